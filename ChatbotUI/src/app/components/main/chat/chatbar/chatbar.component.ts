@@ -101,6 +101,10 @@ export class ChatbarComponent implements OnDestroy {
   showSuggesstion = false;
   suggestedQuestionMessage: Message;
   loader_chat_id: any;
+  // Parsing state of the streamed answer: the length of the text parsed, the answer text and its id
+  responseOffset = 0;
+  responseAnswer = "";
+  responseAnswerId: any;
   questionArray: any[] = [];
 
   /** DEP accordion border colors */
@@ -171,6 +175,7 @@ export class ChatbarComponent implements OnDestroy {
       this.botStartTime = new Date().getTime()
       this.initialQuestion = this.conversation[0].body;
       this.pushQuestion(this.initialQuestion);
+      this.resetBotResponse();
       this.chatService.postChat([...this.conversation]).subscribe({
         next: (event: HttpEvent<string>) => {
           if (event.type === HttpEventType.DownloadProgress) {
@@ -178,7 +183,7 @@ export class ChatbarComponent implements OnDestroy {
               (event as HttpDownloadProgressEvent).partialText + "…",
             );
           } else if (event.type === HttpEventType.Response) {
-            this.handleBotResponse(event.body!);
+            this.handleBotResponse(event.body!, true);
           }
         },
         error: () => {
@@ -238,6 +243,7 @@ export class ChatbarComponent implements OnDestroy {
     this.showLoader = true;
     this.setTimeoutForLoaderText();
     this.setCyclicBackgroundImages();
+    this.resetBotResponse();
     this.chatService.postChat([...this.conversation]).subscribe({
       next: (event: HttpEvent<string>) => {
         if (event.type === HttpEventType.DownloadProgress) {
@@ -245,7 +251,7 @@ export class ChatbarComponent implements OnDestroy {
             (event as HttpDownloadProgressEvent).partialText as string
           );
         } else if (event.type === HttpEventType.Response) {
-          this.handleBotResponse(event.body as string);
+          this.handleBotResponse(event.body as string, true);
         }
       },
       error: () => {
@@ -314,73 +320,89 @@ export class ChatbarComponent implements OnDestroy {
     return text;
   }
 
-  handleBotResponse(answer: string) {
-    let events: string[] = answer.split("\n");
+  // Flattens the AI message content of a streamed event, a string or a list of content blocks (Claude with tools)
+  getAiMessageContent(event: any): string {
+    const kwargs = event?.agent?.messages?.at(-1)?.kwargs;
+    if (!kwargs || kwargs.type !== "ai") {
+      return "";
+    }
+    const content = kwargs.content ?? "";
+    if (Array.isArray(content)) {
+      return content.map((part: any) => typeof part === "string" ? part : (part?.text ?? "")).join("");
+    }
+    return typeof content === "string" ? content : "";
+  }
 
-    // Filter out empty strings that might result from extra newlines.
-    events = events.filter(event => event.trim() !== "");
+  // Resets the parsing state of the NDJSON stream before a new question is sent
+  resetBotResponse() {
+    this.responseOffset = 0;
+    this.responseAnswer = "";
+    this.responseAnswerId = undefined;
+  }
 
-    if (events.length === 0) {
-        return; // Nothing to process
+  // Handles the response text received so far. Only the lines completed since the last call are parsed,
+  // the partial last line is kept for the next call, unless the response is complete.
+  handleBotResponse(answer: string, complete: boolean = false) {
+    const end = complete ? answer.length : answer.lastIndexOf("\n") + 1;
+    if (end <= this.responseOffset) {
+      return; // No new complete line
     }
-    
-    try {
-        let parsedEvent = JSON.parse(events[0]);
-        let answerId = parsedEvent.agent.messages[0].kwargs.id; // Access the "id" from the kwargs
-
-        if (answerId === this.conversation[0].chat_id) {
-            // Process the *last* event.  Use .at(-1) for clarity and safety.
-            const lastEventString = events.at(-1);
-            if (!lastEventString) {
-                console.warn("No last event found after splitting.");
-                return; // Or handle the error appropriately
-            }
-
-            const lastEventParsed = JSON.parse(lastEventString);
-            const lastMessage = lastEventParsed.agent.messages.at(-1);
-
-            if (lastMessage && lastMessage.kwargs.type === "ai") {
-                this.conversation[0].botAnswer += this.removeUnpairedTripleBackticks(lastMessage.kwargs.content);
-            }
-            return;
-        }
+    const events = answer.substring(this.responseOffset, end).split("\n");
+    this.responseOffset = end;
 
-        let response: Chat = {
-          id: answerId,
-          question: this.chatQuery,
-          answer: "",
-          suggested_questions: []
+    for (const eventString of events) {
+      if (eventString.trim() === "") {
+        continue;
+      }
+      try {
+        const parsedEvent = JSON.parse(eventString);
+        if (this.responseAnswerId === undefined) {
+          this.addBotAnswer(parsedEvent.agent.messages[0].kwargs.id); // Access the "id" from the kwargs
         }
-        
-        let endTime = new Date().getTime();
-        this.assignId(response?.id);
-    
-        let singleMesage: Message = {
-          body: "",
-          botAnswer: response.answer,
-          type: 'bot',
-          responseTime: ((endTime - this.botStartTime) / 1000).toString(),
-          shareable: true,
-          botStartTime: this.botStartTime.toString(),
-          extras: {
-            like: false,
-            dislike: false,
-            delete: false,
-          },
-          chat_id: response.id!
-        };
-    
-        this.conversation.unshift(singleMesage);
-        this.setSuggestedQuestionInChat(response, endTime);
-        this.showLoader = false;
-        this.clearTimeoutForLoaderText();
-        this.isSuggestedQuestion = '';
-
-    } catch (error) {
+        this.responseAnswer += this.getAiMessageContent(parsedEvent);
+      } catch (error) {
         console.error("Error parsing JSON:", error);
-        console.error("Problematic event data:", answer); // Log the raw event data
-        // Consider adding error handling here, such as retrying or logging.
+        console.error("Problematic event data:", eventString); // Log the raw event data
+      }
+    }
+    if (this.responseAnswerId !== undefined) {
+      this.conversation[0].botAnswer = this.removeUnpairedTripleBackticks(this.responseAnswer);
+    }
+  }
+
+  // Adds the message of the answer, filled as its events are received
+  addBotAnswer(answerId: any) {
+    let response: Chat = {
+      id: answerId,
+      question: this.chatQuery,
+      answer: "",
+      suggested_questions: []
     }
+
+    let endTime = new Date().getTime();
+    this.assignId(response?.id);
+
+    let singleMesage: Message = {
+      body: "",
+      botAnswer: response.answer,
+      type: 'bot',
+      responseTime: ((endTime - this.botStartTime) / 1000).toString(),
+      shareable: true,
+      botStartTime: this.botStartTime.toString(),
+      extras: {
+        like: false,
+        dislike: false,
+        delete: false,
+      },
+      chat_id: response.id!
+    };
+
+    this.conversation.unshift(singleMesage);
+    this.responseAnswerId = answerId ?? null;
+    this.setSuggestedQuestionInChat(response, endTime);
+    this.showLoader = false;
+    this.clearTimeoutForLoaderText();
+    this.isSuggestedQuestion = '';
   }
 
   // adds Suggested question as another message
@@ -19,6 +19,7 @@ type Input = {
     input: {
         messages: Message[],
         session_id: string,
+        session_version?: number,
     }
 }
 
@@ -12,8 +12,8 @@
 // See the License for the specific language governing permissions and
 // limitations under the License.
 import { Injectable } from '@angular/core';
-import { HttpClient, HttpDownloadProgressEvent, HttpEvent, HttpEventType, HttpHeaders } from '@angular/common/http';
-import { Observable, Subject, tap } from 'rxjs';
+import { HttpClient, HttpDownloadProgressEvent, HttpErrorResponse, HttpEvent, HttpEventType, HttpHeaders } from '@angular/common/http';
+import { Observable, Subject, catchError, tap, throwError } from 'rxjs';
 import { CreateChatRequest } from '../models/chat.model';
 import { environment } from 'src/environments/environment';
 import { SessionService } from './user/session.service';
@@ -36,8 +36,6 @@ export class ChatService {
       this.sessionService.createSession();
     }
 
-    const headers = new HttpHeaders({'Content-Type': 'application/json' });
-
     let messages: Message[] = []
 
     conversation.reverse().filter(message => message.type !== 'bot' ? true : message.botAnswer ).forEach(message => {
@@ -48,11 +46,32 @@ export class ChatService {
         }
       )
     })
+
+    // Only send the new turn when the server already holds the rest of the conversation
+    const sessionVersion = this.sessionService.getSessionVersion();
+    if (sessionVersion !== null && sessionVersion === messages.length - 1) {
+      return this.sendMessages(messages.slice(-1), messages.length, sessionVersion).pipe(
+        catchError((error: HttpErrorResponse) => {
+          // The server history is out of sync, fall back to sending the full conversation
+          if (error.status === 409) {
+            return this.sendMessages(messages, messages.length);
+          }
+          return throwError(() => error);
+        })
+      );
+    }
+    return this.sendMessages(messages, messages.length);
+  }
+
+  private sendMessages(messages: Message[], conversationLength: number, sessionVersion?: number): Observable<HttpEvent<string>> {
+    const headers = new HttpHeaders({'Content-Type': 'application/json' });
+
     const body: CreateChatRequest = {
       input: {
         input: {
           messages: messages,
           session_id: this.sessionService.getSession()!,
+          session_version: sessionVersion,
         }
       }
     };
@@ -64,5 +83,13 @@ export class ChatService {
         responseType: "text",
         reportProgress: true,
       })
+      .pipe(
+        tap(event => {
+          // The server stores the answer once the stream completes
+          if (event.type === HttpEventType.Response) {
+            this.sessionService.setSessionVersion(conversationLength + 1);
+          }
+        })
+      )
   }
 }
@@ -15,6 +15,7 @@ import { Injectable } from '@angular/core';
 import { v4 as uuid } from 'uuid'; 
 
 const SESSION_KEY = "pasid"
+const SESSION_VERSION_KEY = "pasid_version"
 
 @Injectable({
   providedIn: 'root'
@@ -29,5 +30,16 @@ export class SessionService {
 
   createSession() {
     sessionStorage.setItem(SESSION_KEY, uuid())
+    sessionStorage.removeItem(SESSION_VERSION_KEY)
+  }
+
+  // The number of messages the server stores for the session, if known
+  getSessionVersion(): number | null {
+    const version = sessionStorage.getItem(SESSION_VERSION_KEY);
+    return version === null ? null : Number(version);
+  }
+
+  setSessionVersion(version: number) {
+    sessionStorage.setItem(SESSION_VERSION_KEY, version.toString())
   }
 }
\ No newline at end of file
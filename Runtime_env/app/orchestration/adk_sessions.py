@@ -0,0 +1,158 @@
+# Copyright 2025 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# pylint: disable=C0301
+"""Module for mapping server conversations to ADK sessions.
+
+ADK keeps the history of a conversation in its own session. Each server
+conversation (user_id, session_id) is mapped to one ADK session, created on its
+first turn and reused by the following ones, so a turn only sends the new
+message. Sessions idle for longer than the TTL are evicted.
+"""
+import collections
+from dataclasses import dataclass
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from app.utils.metrics import REGISTRY
+
+ADK_SESSIONS = REGISTRY.counter(
+    "adk_sessions_total",
+    "Number of ADK session lookups by result (created, reused, reseeded, evicted).",
+    ["result"]
+)
+ADK_SESSIONS_ACTIVE = REGISTRY.gauge(
+    "adk_sessions_active",
+    "Number of ADK sessions currently mapped to a conversation."
+)
+
+# The ADK user of requests that do not carry a user_id
+DEFAULT_ADK_USER_ID = "anonymous"
+
+# (user_id, session_id) of a server conversation
+SessionKey = Tuple[str, str]
+
+
+@dataclass
+class AdkSession:
+    """The ADK session of a conversation.
+
+    Attributes:
+        adk_session_id: The ID of the session in ADK.
+        message_count: The number of conversation messages the ADK session holds.
+        last_used: When the session was last used (monotonic seconds).
+    """
+
+    adk_session_id: str
+    message_count: int
+    last_used: float
+
+
+class AdkSessionCache:
+    """
+    Keyed LRU map of conversations to their ADK session, with a TTL.
+
+    A cached session is only reused if it holds every message of the
+    conversation except the new one. Otherwise (e.g. the client rewrote its
+    history) the caller starts a new ADK session seeded with the history.
+    """
+
+    def __init__(self, ttl: float, max_size: int):
+        """
+        Initializes the AdkSessionCache.
+
+        Args:
+            ttl: Number of idle seconds after which a session is evicted.
+            max_size: Maximum number of sessions kept. The least recently used are evicted first.
+        """
+        self.ttl = ttl
+        self.max_size = max_size
+        self._sessions: "collections.OrderedDict[SessionKey, AdkSession]" = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: SessionKey, message_count: int) -> Optional[str]:
+        """Returns the ADK session to continue a conversation in, if it can be reused.
+
+        Args:
+            key: The (user_id, session_id) of the conversation.
+            message_count: The number of messages of the conversation, including the new one.
+
+        Returns:
+            The ADK session ID, or None if a new session must be created.
+        """
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is None:
+                return None
+            if time.monotonic() - session.last_used > self.ttl or session.message_count != message_count - 1:
+                # Expired or out of sync with the conversation, `put` replaces it
+                return None
+            self._sessions.move_to_end(key)
+            session.last_used = time.monotonic()
+            ADK_SESSIONS.inc(result="reused")
+            return session.adk_session_id
+
+    def put(self, key: SessionKey, adk_session_id: str, message_count: int) -> List[Tuple[SessionKey, str]]:
+        """Maps a conversation to a newly created ADK session.
+
+        Args:
+            key: The (user_id, session_id) of the conversation.
+            adk_session_id: The ID of the ADK session.
+            message_count: The number of messages the ADK session holds.
+
+        Returns:
+            The (key, adk_session_id) of the replaced and evicted sessions, to delete in ADK.
+        """
+        with self._lock:
+            evicted = []
+            replaced = self._sessions.pop(key, None)
+            if replaced is not None:
+                evicted.append((key, replaced.adk_session_id))
+            ADK_SESSIONS.inc(result="reseeded" if replaced is not None else "created")
+            self._sessions[key] = AdkSession(adk_session_id, message_count, time.monotonic())
+            evicted.extend(self._evict())
+            ADK_SESSIONS_ACTIVE.set(len(self._sessions))
+            return evicted
+
+    def update(self, key: SessionKey, adk_session_id: str, message_count: int) -> None:
+        """Records the number of messages an ADK session holds after a turn."""
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is not None and session.adk_session_id == adk_session_id:
+                session.message_count = message_count
+                session.last_used = time.monotonic()
+
+    def _evict(self) -> List[Tuple[SessionKey, str]]:
+        """Drops the expired sessions and the least recently used ones beyond `max_size`."""
+        now = time.monotonic()
+        evicted = []
+        for key, session in list(self._sessions.items()):
+            if len(self._sessions) <= self.max_size and now - session.last_used <= self.ttl:
+                break
+            del self._sessions[key]
+            evicted.append((key, session.adk_session_id))
+        if evicted:
+            ADK_SESSIONS.inc(len(evicted), result="evicted")
+        return evicted
+
+    def evict_expired(self) -> List[Tuple[SessionKey, str]]:
+        """Drops the expired sessions, returning their (key, adk_session_id) to delete in ADK."""
+        with self._lock:
+            evicted = self._evict()
+            ADK_SESSIONS_ACTIVE.set(len(self._sessions))
+            return evicted
+
+    def stats(self) -> Dict[str, int]:
+        """Returns the number of cached sessions."""
+        return {"sessions": len(self._sessions)}
@@ -11,38 +11,89 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
-# pylint: disable=C0301, W0107, W0107, W0622, R0917, W0718
+# pylint: disable=C0301, W0107, W0107, W0622, R0917, W0718, C0415
 """Module used to define and interact with agent orchestrators."""
 from abc import ABC, abstractmethod
-from typing import AsyncGenerator, Generator, Dict, Any, Optional
+import asyncio
+import logging
+import time
+from typing import AsyncGenerator, Callable, ContextManager, Generator, Dict, Any, List, Optional, Tuple
 import uuid
 
-from google.adk.agents import Agent
-from google.adk.models.lite_llm import LiteLlm
-from google.api_core import exceptions
-from langchain.agents import (
-    AgentExecutor,
-    create_tool_calling_agent
-)
-from langchain_core.messages import  AIMessage, HumanMessage
-from langchain_google_vertexai import ChatVertexAI
-from langchain_google_vertexai.model_garden import ChatAnthropicVertex
-from langgraph.prebuilt import create_react_agent as langgraph_create_react_agent
-from vertexai.preview import reasoning_engines # TODO: update this when it gets named agent_engines
-
-# LlamaIndex
-from llama_index.core import Settings
-from llama_index.core.agent import ReActAgent
+# Framework dependencies are imported inside the methods that use them, so a
+# deployment only pays the import cost of the orchestration framework it selects.
 # from llama_index.core.agent.workflow import FunctionAgent
-from llama_index.llms.langchain import LangChainLLM
 # from llama_index.llms.vertex import Vertex
 
+from app.orchestration.adk_sessions import DEFAULT_ADK_USER_ID, AdkSessionCache
+from app.orchestration.clients import CLIENTS, MODEL_CLIENTS, init_vertexai
+from app.orchestration.config import (
+    ADK_SESSION_MAX_COUNT,
+    ADK_SESSION_TTL_SECONDS,
+    AGENT_STREAM_WORKER_POOL_SIZE,
+    DATA_STORE_ID,
+    HISTORY_COMPACTION,
+    MODEL_HEDGING_ENABLED,
+    MODEL_REGIONS,
+    MODEL_TIMEOUT_SECONDS,
+    RESPONSE_CACHE_ENABLED,
+    RESPONSE_CACHE_MAX_ENTRIES,
+    RESPONSE_CACHE_PATH,
+    RESPONSE_CACHE_TTL_SECONDS,
+    SEMANTIC_CACHE_EMBEDDER,
+    SEMANTIC_CACHE_ENABLED,
+    SEMANTIC_CACHE_MAX_ENTRIES,
+    SEMANTIC_CACHE_THRESHOLD,
+    SEMANTIC_CACHE_TTL_SECONDS
+)
 from app.orchestration.constants import GEMINI_FLASH_20_LATEST
 from app.orchestration.enums import OrchestrationFramework
+from app.orchestration.history import HISTORY, get_conversation_key
+from app.orchestration.remote_engines import REMOTE_ENGINES
 from app.orchestration.tools import (
+    get_tool_name,
     get_tools,
-    get_llamaindex_tools
+    get_llamaindex_tools,
+    llamaindex_scope
+)
+from app.utils.deadline import Deadline, DeadlineExceededError, deadline_scope
+from app.utils.response_cache import (
+    RESPONSE_CACHE_REQUESTS,
+    CachedResponse,
+    ResponseCache,
+    get_first_turn_question,
+    make_cache_key
 )
+from app.utils.session_store import get_ai_message_content
+from app.utils.stage_metrics import RunMetrics, run_metrics_scope, stage_timer
+from app.utils.streaming import get_stream_executor, iterate_in_threadpool
+
+# The responses of repeated conversations, shared by every Agent Manager of the process
+RESPONSE_CACHE = ResponseCache(RESPONSE_CACHE_TTL_SECONDS, RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_PATH)
+
+
+def _create_semantic_cache():
+    """Creates the semantic cache of first turn answers (imports NumPy, so only when enabled)."""
+    from app.utils.semantic_cache import SemanticCache, get_embedder
+
+    return SemanticCache(
+        get_embedder(SEMANTIC_CACHE_EMBEDDER),
+        threshold=SEMANTIC_CACHE_THRESHOLD,
+        ttl=SEMANTIC_CACHE_TTL_SECONDS,
+        max_entries=SEMANTIC_CACHE_MAX_ENTRIES
+    )
+
+
+CLIENTS.register("semantic_cache", _create_semantic_cache, warm_up=SEMANTIC_CACHE_ENABLED)
+
+
+def _is_timeout(error: BaseException) -> bool:
+    """Whether a run failed because it ran out of time, also when a manager wrapped the error."""
+    while error is not None:
+        if isinstance(error, (asyncio.TimeoutError, DeadlineExceededError)):
+            return True
+        error = error.__cause__
+    return False
 
 
 class BaseAgentManager(ABC):
@@ -52,6 +103,16 @@ class BaseAgentManager(ABC):
     frameworks.
     """
 
+    # The namespace used in the `id` of the structured response objects
+    schema_namespace = "langchain"
+    # The modules the manager imports lazily, used to warm up and profile imports
+    dependency_modules: tuple = (
+        "langchain_google_vertexai",
+        "langchain_google_vertexai.model_garden",
+    )
+    # Whether the conversation history is compacted before `astream` is called
+    compact_history = HISTORY_COMPACTION
+
     def __init__(
         self,
         prompt: str,
@@ -101,6 +162,7 @@ class BaseAgentManager(ABC):
         self.return_steps = return_steps
         self.verbose = verbose
 
+        init_vertexai()
         self.model_obj = self.get_model_obj()
         self.tools = self.get_tools()
         self.agent_executor = self.create_agent_executor()
@@ -118,6 +180,17 @@ class BaseAgentManager(ABC):
         pass
 
 
+    async def aget_agent_executor(self):
+        """
+        Returns the executor serving a request. With an agent_engine_resource_id,
+        this is the shared handle of the deployed Agent Engine, which is
+        refreshed in the background, rather than the one resolved at creation.
+        """
+        if self.agent_engine_resource_id:
+            return await REMOTE_ENGINES.aget(self.agent_engine_resource_id)
+        return self.agent_executor
+
+
     def get_tools(self):
         """
         Helper method to retrieve tools based on the industry type.
@@ -134,7 +207,8 @@ class BaseAgentManager(ABC):
     def get_model_obj(self):
         """
         Helper method to retrieve the model object based on the model name 
-        and config.
+        and config. Model objects are shared by every Agent Manager of the
+        process using the same model settings.
 
         Returns:
             An LLM object for the Agent to use.
@@ -142,25 +216,40 @@ class BaseAgentManager(ABC):
         Exception:
             The model_name is not found.
         """
+        from google.api_core import exceptions
+        from langchain_google_vertexai.model_garden import ChatAnthropicVertex
+
+        from app.orchestration.models import AgentChatVertexAI
+        from app.orchestration.regions import get_model_regions, parse_model_regions
+
+        # Calls fail over between the regions of the model, and are retried with jittered backoff, see `RegionalChatModel`.
+        # Each attempt is bounded by MODEL_TIMEOUT_SECONDS, capped by the request deadline.
+        model_regions = parse_model_regions(MODEL_REGIONS)
         try:
             if "claude" in self.model_name:
-                return ChatAnthropicVertex(
+                return MODEL_CLIENTS.get_regional_model(
+                    ChatAnthropicVertex,
+                    ## for now, claude is only available in us-east5 and europe-west1
+                    regions=get_model_regions(model_regions, self.model_name, ["us-east5"]),
+                    hedging=MODEL_HEDGING_ENABLED,
+                    attempt_timeout=MODEL_TIMEOUT_SECONDS,
                     model_name=self.model_name,
                     max_retries=self.max_retries,
                     ## causes issues with the pydantic model with default None value:
                     # max_output_tokens=self.max_output_tokens,
-                    ## for now, claude is only available in us-east5 and europe-west1
-                    # location = self.location,
-                    location="us-east5",
                     temperature=self.temperature,
                     top_p=self.top_p,
                     top_k=self.top_k,
                     verbose=self.verbose
                 )
             elif "llama-4" in self.model_name:
-                return ChatVertexAI(
+                return MODEL_CLIENTS.get_regional_model(
+                    AgentChatVertexAI,
+                    # llama-4 is currently only available in us-east5
+                    regions=get_model_regions(model_regions, self.model_name, ["us-east5"]),
+                    hedging=MODEL_HEDGING_ENABLED,
+                    attempt_timeout=MODEL_TIMEOUT_SECONDS,
                     model_name=self.model_name,
-                    location="us-east5", # llama-4 is currently only available in us-east5
                     max_retries=self.max_retries,
                     max_output_tokens=self.max_output_tokens,
                     temperature=self.temperature,
@@ -169,9 +258,12 @@ class BaseAgentManager(ABC):
                     verbose=self.verbose
                 )
             else:
-                return ChatVertexAI(
+                return MODEL_CLIENTS.get_regional_model(
+                    AgentChatVertexAI,
+                    regions=get_model_regions(model_regions, self.model_name, [self.location]),
+                    hedging=MODEL_HEDGING_ENABLED,
+                    attempt_timeout=MODEL_TIMEOUT_SECONDS,
                     model_name=self.model_name,
-                    location=self.location,
                     max_retries=self.max_retries,
                     max_output_tokens=self.max_output_tokens,
                     temperature=self.temperature,
@@ -185,6 +277,136 @@ class BaseAgentManager(ABC):
             raise RuntimeError(f"Error encountered initalizing model resource. {e}") from e
 
 
+    def get_response_obj(
+        self,
+        content: Any,
+        run_id: str,
+        message_class: str = "AIMessage",
+        message_type: str = "ai",
+        usage_metadata: Optional[Dict] = None,
+        **kwargs: Any
+    ) -> Dict:
+        """Returns a structure dictionary response object.
+        The response object needs to be organized to be
+        consistent with other Agents (e.g. Agent Engine)
+
+        Args:
+            content: The string reponse from the LLM.
+            run_id: The run_id.
+            message_class: The message class name (e.g. `AIMessage`, `AIMessageChunk`).
+            message_type: The message type read by the UI. Only `ai` messages are displayed.
+            usage_metadata: The token usage of the model call, if available.
+            **kwargs: Additional fields to add to the message kwargs.
+
+        Returns:
+            Structured dictionary reponse object.
+        """
+        message = {
+            "lc": 1,
+            "type": "constructor",
+            "id": [self.schema_namespace, "schema", "messages", message_class],
+            "kwargs": {
+                "content": content,
+                "type": message_type,
+                "tool_calls": [],
+                "invalid_tool_calls": [],
+                **kwargs,
+                "id": run_id
+            },
+        }
+        if usage_metadata is not None:
+            message["usage_metadata"] = usage_metadata
+        return {"agent": {"messages": [message]}}
+
+
+    def get_tool_start_obj(
+        self,
+        name: str,
+        tool_input: Any,
+        tool_call_id: str,
+        run_id: str
+    ) -> Dict:
+        """Returns a structured response object announcing a tool call.
+
+        Args:
+            name: The name of the tool being called.
+            tool_input: The input passed to the tool.
+            tool_call_id: The ID of this tool call.
+            run_id: The run_id.
+
+        Returns:
+            Structured dictionary reponse object.
+        """
+        return self.get_response_obj(
+            content="",
+            run_id=run_id,
+            message_class="ToolCall",
+            message_type="tool_call",
+            name=name,
+            args=tool_input,
+            tool_call_id=tool_call_id
+        )
+
+
+    def get_tool_end_obj(
+        self,
+        name: str,
+        output: Any,
+        tool_call_id: str,
+        run_id: str
+    ) -> Dict:
+        """Returns a structured response object carrying a tool result.
+
+        Args:
+            name: The name of the tool that was called.
+            output: The output returned by the tool.
+            tool_call_id: The ID of the tool call.
+            run_id: The run_id.
+
+        Returns:
+            Structured dictionary reponse object.
+        """
+        from langchain_core.messages import ToolMessage
+
+        if isinstance(output, ToolMessage):
+            output = output.content
+        return self.get_response_obj(
+            content=output if isinstance(output, str) else str(output),
+            run_id=run_id,
+            message_class="ToolMessage",
+            message_type="tool",
+            name=name,
+            tool_call_id=tool_call_id
+        )
+
+
+    def iterate_in_threadpool(
+        self,
+        func: Callable[..., Any],
+        *args: Any,
+        **kwargs: Any
+    ) -> AsyncGenerator[Any, None]:
+        """
+        Helper method to asynchronously iterate a synchronous generator
+        (e.g. `stream_query`) on the shared stream worker pool, so that
+        waiting on a chunk does not block the event loop.
+
+        Args:
+            func: A callable returning a synchronous iterable.
+            *args: Positional arguments passed to `func`.
+            **kwargs: Keyword arguments passed to `func`.
+
+        Returns:
+            An async generator over the chunks produced by `func`.
+        """
+        return iterate_in_threadpool(
+            func,
+            *args,
+            executor=get_stream_executor(AGENT_STREAM_WORKER_POOL_SIZE),
+            **kwargs
+        )
+
+
     @abstractmethod
     async def astream(
         self,
@@ -198,11 +420,251 @@ class BaseAgentManager(ABC):
         pass
 
 
+    def metric_labels(self) -> Dict[str, str]:
+        """Returns the labels of the metrics recorded for this agent."""
+        return {"framework": self.orchestration_framework, "model": self.model_name}
+
+
+    def stage_timer(self, stage: str) -> ContextManager[None]:
+        """Returns a context manager timing its block as a stage of the agent runs (e.g. `prompt_assembly`)."""
+        return stage_timer(stage, self.metric_labels())
+
+
+    async def astream_with_metrics(
+        self,
+        input: Dict[str, Any],
+    ) -> AsyncGenerator[Dict, Any]:
+        """
+        Streams the Agent output like `astream`, recording the time to first
+        token, total time and token throughput of the run. Tools called by the
+        run are labeled with the framework and model of this agent.
+
+        Repeated conversations are answered from the response cache, by
+        replaying the recorded chunks. The `response_cache` of the input
+        selects whether the cache is used (`use`), only written (`refresh`)
+        or skipped (`bypass`). Runs with a failed or degraded tool call, or
+        calling a `volatile_tool`, are not cached, nor are the runs of a
+        deployed Agent Engine, whose tool calls are not seen.
+
+        Args:
+            input: The agent input, as passed to `astream`.
+
+        Yields:
+            Dictionaries representing the streamed agent output.
+        """
+        run = RunMetrics(**self.metric_labels())
+        status = "error"
+        try:
+            with run_metrics_scope(run):
+                # The tools of a deployed Agent Engine run remotely, where their failures and live data go unseen
+                cacheable = RESPONSE_CACHE_ENABLED and not self.agent_engine_resource_id
+                cache_mode = (input.get("response_cache") or "use") if cacheable else "bypass"
+                cached = await self.aget_cached_response(input, cache_mode)
+                if cached is not None:
+                    for chunk in cached.replay(input["run_id"]):
+                        run.observe_chunk(chunk)
+                        yield chunk
+                    status = "cached"
+                    return
+
+                run_input = self.compact_input(input) if self.compact_history else input
+                chunks = []
+                async for chunk in self.astream(run_input):
+                    run.observe_chunk(chunk)
+                    if cache_mode != "bypass":
+                        chunks.append(chunk)
+                    yield chunk
+                # Only answers of runs that succeeded with every tool, none returning live data, are replayed
+                if (cache_mode != "bypass" and run.tool_errors == 0 and run.cacheable
+                        and any(get_ai_message_content(chunk) for chunk in chunks)):
+                    await self.acache_response(input, chunks)
+            status = "success"
+        except (asyncio.CancelledError, GeneratorExit):
+            status = "cancelled"
+            raise
+        finally:
+            run.finish(status)
+
+
+    def get_response_cache_scope(self) -> Dict[str, Any]:
+        """
+        Returns what determines the answers of this agent besides the
+        conversation, which scopes its cached responses.
+        """
+        return {
+            "model_name": self.model_name,
+            "industry_type": self.industry_type,
+            "data_store_id": DATA_STORE_ID,
+            "orchestration_framework": self.orchestration_framework,
+            "agent_engine_resource_id": self.agent_engine_resource_id,
+            "tools": sorted(get_tool_name(tool) for tool in self.tools),
+            "prompt": self.prompt,
+            "temperature": self.temperature,
+            "max_output_tokens": self.max_output_tokens,
+        }
+
+
+    def get_response_cache_key(self, input: Dict[str, Any]) -> str:
+        """
+        Returns the response cache key of an agent input: a hash of its
+        normalized messages and of the response cache scope of this agent.
+
+        Args:
+            input: The agent input, as passed to `astream`.
+
+        Returns:
+            The cache key.
+        """
+        return make_cache_key(input["messages"], **self.get_response_cache_scope())
+
+
+    async def aget_cached_response(self, input: Dict[str, Any], cache_mode: str) -> Optional[CachedResponse]:
+        """
+        Looks up the answer of an agent input in the response cache, then in
+        the semantic cache for first turns.
+
+        Args:
+            input: The agent input, as passed to `astream`.
+            cache_mode: `use` to look up the caches, `refresh` or `bypass` to skip them.
+
+        Returns:
+            The cached response, None on a miss.
+        """
+        if cache_mode == "bypass":
+            RESPONSE_CACHE_REQUESTS.inc(result="bypass")
+            return None
+        if cache_mode != "use":
+            return None
+
+        cached = RESPONSE_CACHE.get(self.get_response_cache_key(input))
+        question = get_first_turn_question(input["messages"])
+        if cached is None and SEMANTIC_CACHE_ENABLED and question:
+            semantic_cache = await CLIENTS.aget("semantic_cache")
+            scope = make_cache_key([], **self.get_response_cache_scope())
+            cached = await asyncio.to_thread(semantic_cache.get, scope, question)
+        return cached
+
+
+    async def acache_response(self, input: Dict[str, Any], chunks: List[Dict]) -> None:
+        """
+        Records the answer of an agent input in the response cache, and in the
+        semantic cache for first turns.
+
+        Args:
+            input: The agent input, as passed to `astream`.
+            chunks: The chunks streamed by the agent.
+        """
+        response = RESPONSE_CACHE.put(self.get_response_cache_key(input), input["run_id"], chunks)
+        question = get_first_turn_question(input["messages"])
+        if SEMANTIC_CACHE_ENABLED and question:
+            semantic_cache = await CLIENTS.aget("semantic_cache")
+            scope = make_cache_key([], **self.get_response_cache_scope())
+            await asyncio.to_thread(semantic_cache.put, scope, question, response)
+
+
+    def compact_input(self, input: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Fits the conversation history of an agent input in the token budget
+        of the model, keeping the last turns and summarizing the older ones.
+
+        Args:
+            input: The agent input, as passed to `astream`.
+
+        Returns:
+            A copy of the input with the compacted messages.
+        """
+        with self.stage_timer("history_compaction"):
+            messages = HISTORY.compact(input["messages"], self.model_name, get_conversation_key(input))
+        return {**input, "messages": messages}
+
+
+    async def ainvoke(
+        self,
+        input: Dict[str, Any],
+    ) -> str:
+        """
+        Runs the Agent on one conversation and returns its final answer.
+
+        Args:
+            input: The agent input, as passed to `astream`.
+
+        Returns:
+            The text of the AI messages streamed by the agent.
+        """
+        answer = ""
+        async for chunk in self.astream_with_metrics(input):
+            answer += get_ai_message_content(chunk)
+        return answer
+
+
+    async def abatch(
+        self,
+        inputs: List[Dict[str, Any]],
+        max_concurrency: int = 8,
+        timeout: Optional[float] = None
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        """
+        Runs the Agent on several conversations with bounded parallelism.
+
+        At most `max_concurrency` conversations run at once. The results are
+        yielded as soon as each conversation completes, so they arrive in
+        completion order and are tagged with the index of their input.
+
+        Args:
+            inputs: The agent inputs, as passed to `astream`.
+            max_concurrency: Maximum number of conversations run at once.
+            timeout: Maximum number of seconds a single conversation may run.
+
+        Yields:
+            One result per input, with its `index`, `run_id`, `status`
+            ("success", "error" or "timeout"), `output` or `error`, and
+            `latency_seconds`.
+        """
+        semaphore = asyncio.Semaphore(max(max_concurrency, 1))
+
+        async def run(index: int, item: Dict[str, Any]) -> Dict[str, Any]:
+            item = {**item, "run_id": item.get("run_id") or str(uuid.uuid4())}
+            result = {"index": index, "run_id": item["run_id"]}
+            async with semaphore:
+                start_time = time.perf_counter()
+                try:
+                    # The deadline lets model and tool calls give up before the item times out
+                    with deadline_scope(Deadline(timeout) if timeout else None):
+                        output = await asyncio.wait_for(self.ainvoke(item), timeout=timeout)
+                    result.update(status="success", output=output)
+                except Exception as e: # pylint: disable=W0718
+                    if _is_timeout(e):
+                        result.update(status="timeout", error=f"Timed out after {timeout} seconds.")
+                    else:
+                        result.update(status="error", error=f"Unexpected error. {e}")
+                result["latency_seconds"] = time.perf_counter() - start_time
+            return result
+
+        tasks = [asyncio.create_task(run(index, item)) for index, item in enumerate(inputs)]
+        try:
+            for next_result in asyncio.as_completed(tasks):
+                yield await next_result
+        finally:
+            # The consumer went away, stop the conversations that are still running
+            for task in tasks:
+                task.cancel()
+
+
 class GoogleAdkAgentManager(BaseAgentManager):
     """
     AgentManager subclass for Google ADK orchestration.
     """
 
+    schema_namespace = "adk"
+    # ADK sessions keep their own history, only the messages seeding them are compacted
+    compact_history = False
+    dependency_modules = BaseAgentManager.dependency_modules + (
+        "google.adk.agents",
+        "google.adk.models.lite_llm",
+        "google.adk.tools",
+        "vertexai.preview.reasoning_engines",
+    )
+
     def __init__(
         self,
         prompt: str,
@@ -218,7 +680,10 @@ class GoogleAdkAgentManager(BaseAgentManager):
         return_steps: Optional[bool] = False,
         verbose: Optional[bool] = True
     ):
-        self.user_id = "test_user_id"
+        # The ADK session of each conversation, so a turn only sends the new message
+        self.sessions = AdkSessionCache(ADK_SESSION_TTL_SECONDS, ADK_SESSION_MAX_COUNT)
+        # The pending deletions of evicted sessions, kept referenced until done
+        self.delete_tasks: set = set()
 
         super().__init__(
             prompt=prompt,
@@ -241,9 +706,13 @@ class GoogleAdkAgentManager(BaseAgentManager):
         """
         Creates a ADK Agent executor.
         """
+        from google.adk.agents import Agent
+        from google.adk.models.lite_llm import LiteLlm
+        from vertexai.preview import reasoning_engines # TODO: update this when it gets named agent_engines
+
         # If agent_engine_resource_id is provided, use the deployed Agent Engine
         if self.agent_engine_resource_id:
-            return reasoning_engines.ReasoningEngine(self.agent_engine_resource_id)
+            return REMOTE_ENGINES.get(self.agent_engine_resource_id)
 
         tool_names = []
         tool_desc = []
@@ -269,41 +738,83 @@ class GoogleAdkAgentManager(BaseAgentManager):
         return reasoning_engines.AdkApp(agent=adk_agent) #, enable_tracing=True)
 
 
-    def get_response_obj(
+    @staticmethod
+    def format_messages(messages: List[Dict[str, Any]]) -> str:
+        """Converts the messages into a string."""
+        return "\n".join(f"[{msg['type']}]: {msg['content']}" for msg in messages)
+
+
+    @staticmethod
+    def get_event_text(event: Dict[str, Any]) -> str:
+        """Returns the text of an ADK event, empty for events without text (e.g. tool calls)."""
+        content = event.get("content") or {}
+        return "".join(part.get("text") or "" for part in content.get("parts") or [] if not part.get("thought"))
+
+
+    async def aget_session(
         self,
-        content: str,
-        run_id: str
-    ) -> Dict:
-        """Returns a structure dictionary response object.
-        The response object needs to be organized to be
-        consistent with other Agents (e.g. Agent Engine)
+        agent_executor: Any,
+        user_id: str,
+        session_id: str,
+        messages: List[Dict[str, Any]]
+    ) -> Tuple[Optional[str], str]:
+        """Returns the ADK session to run a turn in and the message to send.
+
+        A conversation continues in its ADK session, which already holds the
+        history, so only the new message is sent. A new session is seeded with
+        the whole conversation. Requests without a session_id run without one.
 
         Args:
-            content: The string reponse from the LLM.
-            run_id: The run_id.
+            agent_executor: The AdkApp or the deployed Agent Engine.
+            user_id: The ADK user of the conversation.
+            session_id: The session_id of the conversation, empty for none.
+            messages: The messages of the conversation, ending with the new one.
 
         Returns:
-            Structured dictionary reponse object.
+            The ADK session ID (None for no session) and the message to send.
         """
-        response_obj = {
-            "agent": {
-                "messages": [
-                    {
-                        "lc": 1,
-                        "type": "constructor",
-                        "id": ["adk", "schema", "messages", "AIMessage"],
-                        "kwargs": {
-                            "content": content,
-                            "type": "ai",
-                            "tool_calls": [],
-                            "invalid_tool_calls": [],
-                            "id": run_id
-                        },
-                    }
-                ]
-            }
-        }
-        return response_obj
+        if not session_id:
+            with self.stage_timer("prompt_assembly"):
+                return None, self.format_messages(self.compact_seed(messages, user_id, session_id))
+
+        key = (user_id, session_id)
+        adk_session_id = self.sessions.get(key, len(messages))
+        if adk_session_id is not None:
+            return adk_session_id, str(messages[-1]["content"])
+
+        with self.stage_timer("session_create"):
+            session = await asyncio.to_thread(agent_executor.create_session, user_id=user_id)
+        adk_session_id = session["id"] if isinstance(session, dict) else session.id
+        for (evicted_user_id, _), evicted_session_id in self.sessions.put(key, adk_session_id, len(messages) - 1):
+            task = asyncio.create_task(self.adelete_session(agent_executor, evicted_user_id, evicted_session_id))
+            self.delete_tasks.add(task)
+            task.add_done_callback(self.delete_tasks.discard)
+
+        with self.stage_timer("prompt_assembly"):
+            return adk_session_id, self.format_messages(self.compact_seed(messages, user_id, session_id))
+
+
+    def compact_seed(self, messages: List[Dict[str, Any]], user_id: str, session_id: str) -> List[Dict[str, Any]]:
+        """Compacts the history sent to a new ADK session, like `compact_input` does for other frameworks."""
+        if not HISTORY_COMPACTION:
+            return messages
+        return self.compact_input({"messages": messages, "user_id": user_id, "session_id": session_id})["messages"]
+
+
+    @staticmethod
+    async def adelete_session(agent_executor: Any, user_id: str, adk_session_id: str) -> None:
+        """Deletes an evicted ADK session, logging instead of raising on failure."""
+        try:
+            await asyncio.to_thread(agent_executor.delete_session, user_id=user_id, session_id=adk_session_id)
+        except Exception as e:
+            logging.warning("Failed to delete ADK session %s: %s", adk_session_id, e)
+
+
+    def astream_events(self, agent_executor: Any, **kwargs: Any) -> AsyncGenerator[Dict, Any]:
+        """Streams the ADK events, natively async when the executor supports it."""
+        if hasattr(agent_executor, "async_stream_query"):
+            return agent_executor.async_stream_query(**kwargs)
+        return self.iterate_in_threadpool(agent_executor.stream_query, **kwargs)
 
 
     async def astream(
@@ -311,14 +822,24 @@ class GoogleAdkAgentManager(BaseAgentManager):
         input: Dict[str, Any],
     ) -> AsyncGenerator[Dict, Any]:
         """Asynchronously event streams the Agent output."""
-        # Convert the messages into a string
-        content = "\n".join(f"[{msg['type']}]: {msg['content']}" for msg in input["messages"])
+        messages = input["messages"]
+        user_id = input.get("user_id") or DEFAULT_ADK_USER_ID
+        session_id = input.get("session_id") or ""
         try:
-            for chunk in self.agent_executor.stream_query(message=content, user_id=self.user_id):
-                yield self.get_response_obj(
-                    content=chunk["content"]["parts"][0]["text"],
-                    run_id=input["run_id"]
-                )
+            agent_executor = await self.aget_agent_executor()
+            adk_session_id, message = await self.aget_session(agent_executor, user_id, session_id, messages)
+
+            kwargs = {"message": message, "user_id": user_id}
+            if adk_session_id is not None:
+                kwargs["session_id"] = adk_session_id
+            async for event in self.astream_events(agent_executor, **kwargs):
+                content = self.get_event_text(event)
+                if content:
+                    yield self.get_response_obj(content=content, run_id=input["run_id"])
+
+            if adk_session_id is not None:
+                # The session now also holds the answer, stored by the server after the stream
+                self.sessions.update((user_id, session_id), adk_session_id, len(messages) + 1)
         except Exception as e:
             raise RuntimeError(f"Unexpected error. {e}") from e
 
@@ -327,6 +848,13 @@ class LangChainPrebuiltAgentManager(BaseAgentManager):
     """
     AgentManager subclass for LangChain Agent orchestration.
     """
+
+    dependency_modules = BaseAgentManager.dependency_modules + (
+        "langchain.agents",
+        "langchain_core.tools",
+        "langchain_community.tools",
+    )
+
     def __init__(
         self,
         prompt: str,
@@ -340,8 +868,23 @@ class LangChainPrebuiltAgentManager(BaseAgentManager):
         top_p: Optional[float] = None,
         top_k: Optional[int] = None,
         return_steps: Optional[bool] = False,
-        verbose: Optional[bool] = True
+        verbose: Optional[bool] = True,
+        stream_tokens: Optional[bool] = True,
+        stream_intermediate_steps: Optional[bool] = True
     ):
+        """
+        Initializes the LangChainPrebuiltAgentManager.
+
+        Args:
+            stream_tokens: Whether to stream incremental model tokens as they are
+                generated. If False, the final output is streamed as one block.
+            stream_intermediate_steps: Whether to stream tool start/end events
+                while streaming tokens.
+            See BaseAgentManager for the remaining arguments.
+        """
+        self.stream_tokens = stream_tokens
+        self.stream_intermediate_steps = stream_intermediate_steps
+
         super().__init__(
             prompt=prompt,
             industry_type=industry_type,
@@ -363,6 +906,8 @@ class LangChainPrebuiltAgentManager(BaseAgentManager):
         """
         Creates a Langchain React Agent executor.
         """
+        from langchain.agents import AgentExecutor, create_tool_calling_agent
+
         agent = create_tool_calling_agent(
             prompt=self.prompt,
             llm=self.model_obj,
@@ -391,50 +936,107 @@ class LangChainPrebuiltAgentManager(BaseAgentManager):
         Exception:
             An error is encountered during streaming.
         """
-        try:
+        from langchain_core.messages import AIMessage, HumanMessage
+
+        with self.stage_timer("prompt_assembly"):
             input_text = input["messages"][-1]["content"]
             chat_history = [
                 HumanMessage(content=msg["content"]) if msg["type"] == "human"
                 else AIMessage(content=msg["content"])
                 for msg in input["messages"][:-1]
             ]
-            async for chunk in self.agent_executor.astream(
-                {
-                    "input": input_text,
-                    "chat_history": chat_history,
-                }
-            ):
-                # Organize response object to be consistent with other Agents (e.g. Agent Engine)
-                if "output" in chunk:
-                    response_obj = {
-                        "agent": {
-                            "output": chunk["output"],
-                            "messages": [
-                                {
-                                    "lc": 1,
-                                    "type": "constructor",
-                                    "id": ["langchain", "schema", "messages", "AIMessage"],
-                                    "kwargs": {
-                                        "content": chunk["output"],
-                                        "type": "ai",
-                                        "tool_calls": [],
-                                        "invalid_tool_calls": [],
-                                        "id": input["run_id"]
-                                    }
-                                }
-                            ]
-                        }
-                    }
-                    yield response_obj
+            agent_input = {
+                "input": input_text,
+                "chat_history": chat_history,
+            }
+        if self.stream_tokens:
+            stream = self.astream_tokens(agent_input, run_id=input["run_id"])
+        else:
+            stream = self.astream_output(agent_input, run_id=input["run_id"])
+        try:
+            async for response_obj in stream:
+                yield response_obj
             return  # Exit the loop if successful
         except Exception as e:
             raise RuntimeError(f"Unexpected error. {e}") from e
 
 
+    async def astream_tokens(
+        self,
+        agent_input: Dict[str, Any],
+        run_id: str
+    ) -> AsyncGenerator[Dict, Any]:
+        """Streams model token deltas and, optionally, tool start/end events.
+
+        Args:
+            agent_input: The input and chat history for the AgentExecutor.
+            run_id: The run_id.
+
+        Yields:
+            Dictionaries representing the streamed agent output.
+        """
+        async for event in self.agent_executor.astream_events(agent_input, version="v2"):
+            kind = event["event"]
+            if kind == "on_chat_model_stream":
+                chunk = event["data"]["chunk"]
+                # Tool calling rounds stream tool call chunks with no content
+                if chunk.content or chunk.usage_metadata:
+                    yield self.get_response_obj(
+                        content=chunk.content,
+                        run_id=run_id,
+                        message_class="AIMessageChunk",
+                        usage_metadata=chunk.usage_metadata
+                    )
+            elif kind == "on_tool_start" and self.stream_intermediate_steps:
+                yield self.get_tool_start_obj(
+                    name=event["name"],
+                    tool_input=event["data"].get("input"),
+                    tool_call_id=event["run_id"],
+                    run_id=run_id
+                )
+            elif kind == "on_tool_end" and self.stream_intermediate_steps:
+                yield self.get_tool_end_obj(
+                    name=event["name"],
+                    output=event["data"].get("output"),
+                    tool_call_id=event["run_id"],
+                    run_id=run_id
+                )
+
+
+    async def astream_output(
+        self,
+        agent_input: Dict[str, Any],
+        run_id: str
+    ) -> AsyncGenerator[Dict, Any]:
+        """Streams the final output of the agent as one block.
+
+        Args:
+            agent_input: The input and chat history for the AgentExecutor.
+            run_id: The run_id.
+
+        Yields:
+            Dictionaries representing the streamed agent output.
+        """
+        async for chunk in self.agent_executor.astream(agent_input):
+            # Organize response object to be consistent with other Agents (e.g. Agent Engine)
+            if "output" in chunk:
+                response_obj = self.get_response_obj(content=chunk["output"], run_id=run_id)
+                response_obj["agent"]["output"] = chunk["output"]
+                yield response_obj
+
+
 class LangGraphPrebuiltAgentManager(BaseAgentManager):
     """
     AgentManager subclass for LangGraph Agent orchestration.
     """
+
+    schema_namespace = "langgraph"
+    dependency_modules = BaseAgentManager.dependency_modules + (
+        "langgraph.prebuilt",
+        "langchain_core.tools",
+        "langchain_community.tools",
+    )
+
     def __init__(
         self,
         prompt: str,
@@ -448,8 +1050,20 @@ class LangGraphPrebuiltAgentManager(BaseAgentManager):
         top_p: Optional[float] = None,
         top_k: Optional[int] = None,
         return_steps: Optional[bool] = False,
-        verbose: Optional[bool] = True
+        verbose: Optional[bool] = True,
+        stream_tokens: Optional[bool] = True
     ):
+        """
+        Initializes the LangGraphPrebuiltAgentManager.
+
+        Args:
+            stream_tokens: Whether to stream incremental model tokens and tool
+                events as they happen. If False, only complete AI messages are
+                streamed once each graph step finishes.
+            See BaseAgentManager for the remaining arguments.
+        """
+        self.stream_tokens = stream_tokens
+
         super().__init__(
             prompt=prompt,
             industry_type=industry_type,
@@ -471,6 +1085,8 @@ class LangGraphPrebuiltAgentManager(BaseAgentManager):
         """
         Creates a LangGraph React Agent executor.
         """
+        from langgraph.prebuilt import create_react_agent as langgraph_create_react_agent
+
         return langgraph_create_react_agent(
             prompt=self.prompt,
             model=self.model_obj,
@@ -494,40 +1110,92 @@ class LangGraphPrebuiltAgentManager(BaseAgentManager):
         Exception:
             An error is encountered during streaming.
         """
+        if self.stream_tokens:
+            stream = self.astream_tokens(input)
+        else:
+            stream = self.astream_values(input)
         try:
-            async for chunk in self.agent_executor.astream(input, stream_mode="values"):
-                message = chunk["messages"][-1]
-                if isinstance(message, AIMessage):
-                    # Organize response object to be consistent with other Agents (e.g. Agent Engine)
-                    response_obj = {
-                        "agent": {
-                            "messages": [
-                                {
-                                    "lc": 1,
-                                    "type": "constructor",
-                                    "id": ["langgraph", "schema", "messages", "AIMessage"],
-                                    "kwargs": {
-                                        "content": message.content,
-                                        "type": "ai",
-                                        "tool_calls": [],
-                                        "invalid_tool_calls": [],
-                                        "id": input["run_id"]
-                                    },
-                                    "usage_metadata": message.usage_metadata
-                                }
-                            ]
-                        }
-                    }
-                    yield response_obj
+            async for response_obj in stream:
+                yield response_obj
             return  # Exit the loop if successful
         except Exception as e:
             raise RuntimeError(f"Unexpected error. {e}") from e
 
 
+    async def astream_tokens(
+        self,
+        input: Dict[str, Any],
+    ) -> AsyncGenerator[Dict, Any]:
+        """Streams model token deltas and tool start/end events as they happen.
+
+        Args:
+            input: The list of messages to send to the model as input.
+
+        Yields:
+            Dictionaries representing the streamed agent output.
+        """
+        async for event in self.agent_executor.astream_events(input, version="v2"):
+            kind = event["event"]
+            if kind == "on_chat_model_stream":
+                chunk = event["data"]["chunk"]
+                if chunk.content or chunk.usage_metadata:
+                    yield self.get_response_obj(
+                        content=chunk.content,
+                        run_id=input["run_id"],
+                        message_class="AIMessageChunk",
+                        usage_metadata=chunk.usage_metadata
+                    )
+            elif kind == "on_tool_start":
+                yield self.get_tool_start_obj(
+                    name=event["name"],
+                    tool_input=event["data"].get("input"),
+                    tool_call_id=event["run_id"],
+                    run_id=input["run_id"]
+                )
+            elif kind == "on_tool_end":
+                yield self.get_tool_end_obj(
+                    name=event["name"],
+                    output=event["data"].get("output"),
+                    tool_call_id=event["run_id"],
+                    run_id=input["run_id"]
+                )
+
+
+    async def astream_values(
+        self,
+        input: Dict[str, Any],
+    ) -> AsyncGenerator[Dict, Any]:
+        """Streams each complete AI message once its graph step finishes.
+
+        Args:
+            input: The list of messages to send to the model as input.
+
+        Yields:
+            Dictionaries representing the streamed agent output.
+        """
+        from langchain_core.messages import AIMessage
+
+        async for chunk in self.agent_executor.astream(input, stream_mode="values"):
+            message = chunk["messages"][-1]
+            if isinstance(message, AIMessage):
+                # Organize response object to be consistent with other Agents (e.g. Agent Engine)
+                yield self.get_response_obj(
+                    content=message.content,
+                    run_id=input["run_id"],
+                    usage_metadata=message.usage_metadata
+                )
+
+
 class LangChainVertexAIAgentEngineAgentManager(BaseAgentManager):
     """
     AgentManager subclass for Vertex AI Agent Engine LangChain orchestration.
     """
+
+    dependency_modules = BaseAgentManager.dependency_modules + (
+        "vertexai.preview.reasoning_engines",
+        "langchain_core.tools",
+    )
+
     def __init__(
         self,
         prompt: str,
@@ -564,9 +1232,11 @@ class LangChainVertexAIAgentEngineAgentManager(BaseAgentManager):
         """
         Creates a Vertex AI Agent Engine Langchain Agent executor.
         """
+        from vertexai.preview import reasoning_engines
+
         # If agent_engine_resource_id is provided, use the deployed Agent Engine
         if self.agent_engine_resource_id:
-            langchain_agent = reasoning_engines.ReasoningEngine(self.agent_engine_resource_id)
+            langchain_agent = REMOTE_ENGINES.get(self.agent_engine_resource_id)
         else:
             langchain_agent = reasoning_engines.LangchainAgent(
                 # prompt=self.prompt, # Custom prompt seems to have an issue for some reason
@@ -598,10 +1268,12 @@ class LangChainVertexAIAgentEngineAgentManager(BaseAgentManager):
         Exception:
             An error is encountered during streaming.
         """
-        # Convert the messages into a string
-        content = "\n".join(f"[{msg['type']}]: {msg['content']}" for msg in input["messages"])
+        with self.stage_timer("prompt_assembly"):
+            # Convert the messages into a string
+            content = "\n".join(f"[{msg['type']}]: {msg['content']}" for msg in input["messages"])
         try:
-            for chunk in self.agent_executor.stream_query(input=content):
+            agent_executor = await self.aget_agent_executor()
+            async for chunk in self.iterate_in_threadpool(agent_executor.stream_query, input=content):
                 chunk["messages"] = [{**msg, "kwargs": {**msg["kwargs"], "id": input["run_id"]}} for msg in chunk["messages"]]
                 yield {"agent": chunk}
         except Exception as e:
@@ -612,6 +1284,12 @@ class LangGraphVertexAIAgentEngineAgentManager(BaseAgentManager):
     """
     AgentManager subclass for Vertex AI Agent Engine LangGraph orchestration.
     """
+
+    dependency_modules = BaseAgentManager.dependency_modules + (
+        "vertexai.preview.reasoning_engines",
+        "langchain_core.tools",
+    )
+
     def __init__(
         self,
         prompt: str,
@@ -648,9 +1326,11 @@ class LangGraphVertexAIAgentEngineAgentManager(BaseAgentManager):
         """
         Creates a Vertex AI Agent Engine LangGraph Agent executor.
         """
+        from vertexai.preview import reasoning_engines
+
         # If agent_engine_resource_id is provided, use the deployed Agent Engine
         if self.agent_engine_resource_id:
-            langgraph_agent = reasoning_engines.ReasoningEngine(self.agent_engine_resource_id)
+            langgraph_agent = REMOTE_ENGINES.get(self.agent_engine_resource_id)
         else:
             langgraph_agent = reasoning_engines.LanggraphAgent(
                 model=self.model_name,
@@ -679,7 +1359,9 @@ class LangGraphVertexAIAgentEngineAgentManager(BaseAgentManager):
             An error is encountered during streaming.
         """
         try:
-            for chunk in self.agent_executor.stream_query(
+            agent_executor = await self.aget_agent_executor()
+            async for chunk in self.iterate_in_threadpool(
+                agent_executor.stream_query,
                 input=input,
                 stream_mode="values"
             ):
@@ -699,6 +1381,15 @@ class LlamaIndexAgentManager(BaseAgentManager):
     """
     AgentManager subclass for LangGraph Agent orchestration.
     """
+
+    schema_namespace = "llamaindex"
+    dependency_modules = BaseAgentManager.dependency_modules + (
+        "llama_index.core.agent",
+        "llama_index.core.tools",
+        "llama_index.llms.langchain",
+        "llama_index.retrievers.vertexai_search",
+    )
+
     def __init__(
         self,
         prompt: str,
@@ -729,7 +1420,19 @@ class LlamaIndexAgentManager(BaseAgentManager):
             return_steps=return_steps,
             verbose=verbose
         )
-        self.model_obj = LangChainLLM(self.model_obj)
+
+
+    def get_model_obj(self):
+        """
+        Helper method to retrieve the shared chat model, wrapped once as a
+        LlamaIndex LLM.
+
+        Returns:
+            An LLM object for the Agent to use.
+        """
+        from llama_index.llms.langchain import LangChainLLM
+
+        return LangChainLLM(super().get_model_obj())
 
 
     def get_tools(self):
@@ -746,11 +1449,12 @@ class LlamaIndexAgentManager(BaseAgentManager):
         """
         Creates a LlamaIndex React Agent executor.
         """
-        # setup the index/query llm for Vertex Search
-        Settings.llm = LangChainLLM(self.model_obj)
+        from llama_index.core.agent import ReActAgent
+
+        # The index/query llm for Vertex Search is set per run, see `llamaindex_scope`
         llamaindex_agent = ReActAgent.from_tools(
             prompt=self.prompt,
-            llm=LangChainLLM(self.model_obj),
+            llm=self.model_obj,
             tools=self.tools,
             verbose=self.verbose
         )
@@ -765,43 +1469,6 @@ class LlamaIndexAgentManager(BaseAgentManager):
         return llamaindex_agent
 
 
-    def get_response_obj(
-        self,
-        content: str,
-        run_id: str
-    ) -> Dict:
-        """Returns a structure dictionary response object.
-        The response object needs to be organized to be
-        consistent with other Agents (e.g. Agent Engine)
-
-        Args:
-            content: The string reponse from the LLM.
-            run_id: The run_id.
-
-        Returns:
-            Structured dictionary reponse object.
-        """
-        response_obj = {
-            "agent": {
-                "messages": [
-                    {
-                        "lc": 1,
-                        "type": "constructor",
-                        "id": ["llamaindex", "schema", "messages", "AIMessage"],
-                        "kwargs": {
-                            "content": content,
-                            "type": "ai",
-                            "tool_calls": [],
-                            "invalid_tool_calls": [],
-                            "id": run_id
-                        },
-                    }
-                ]
-            }
-        }
-        return response_obj
-
-
     async def astream(
         self,
         input: Dict[str, Any],
@@ -818,25 +1485,63 @@ class LlamaIndexAgentManager(BaseAgentManager):
         Exception:
             An error is encountered during streaming.
         """
+        from llama_index.core.chat_engine.types import StreamingAgentChatResponse
+
         try:
             if self.agent_engine_resource_id:
-                llamaindex_agent = reasoning_engines.ReasoningEngine(self.agent_engine_resource_id)
                 # Uses the stream_query function below
-                response = llamaindex_agent.stream_query(input=input)
-                for chunk in response:
+                async for chunk in self.iterate_in_threadpool(self.remote_stream_query, input=input):
                     yield chunk
             else:
-                # Convert the messages into a string
-                content = "\n".join(f"[{msg['type']}]: {msg['content']}" for msg in input["messages"])
-                response = await self.agent_executor.aquery(content)
-                yield self.get_response_obj(
-                    content=response.response,
-                    run_id=input["run_id"]
-                )
+                # The tools query Vertex Search with the model of this agent
+                with llamaindex_scope(self.model_obj):
+                    with self.stage_timer("prompt_assembly"):
+                        # Convert the messages into a string
+                        content = "\n".join(f"[{msg['type']}]: {msg['content']}" for msg in input["messages"])
+                        task = self.agent_executor.create_task(content)
+                    reasoning_state = {"seen": 0, "tool_call_id": None, "tool_name": None}
+                    while True:
+                        # Each step is one round of the ReAct loop (one LLM call plus any tool call)
+                        step_output = await self.agent_executor.astream_step(task.task_id)
+                        for response_obj in self.get_reasoning_objs(task, reasoning_state, input["run_id"]):
+                            yield response_obj
+
+                        if step_output.is_last:
+                            if isinstance(step_output.output, StreamingAgentChatResponse):
+                                async for token in step_output.output.async_response_gen():
+                                    yield self.get_response_obj(
+                                        content=token,
+                                        run_id=input["run_id"],
+                                        message_class="AIMessageChunk"
+                                    )
+                            else:
+                                yield self.get_response_obj(
+                                    content=step_output.output.response,
+                                    run_id=input["run_id"]
+                                )
+                            self.agent_executor.finalize_response(task.task_id, step_output)
+                            break
 
         except Exception as e:
             raise RuntimeError(f"Unexpected error. {e}") from e
 
+    def remote_stream_query(
+        self,
+        input: Dict[str, Any]
+    ) -> Generator:
+        """Synchronously event streams the output of the deployed Agent Engine agent.
+        The remote agent is resolved on first use and then shared. Resolving it
+        is a blocking call, so it happens here rather than on the event loop.
+
+        Args:
+            input: The list of messages to send to the model as input.
+
+        Yields:
+            Dictionaries representing the streamed agent output.
+        """
+        llamaindex_agent = REMOTE_ENGINES.get(self.agent_engine_resource_id)
+        yield from llamaindex_agent.stream_query(input=input)
+
     # # alias stream_query for Agent Engine deployments
     # stream_query = astream
 
@@ -856,19 +1561,92 @@ class LlamaIndexAgentManager(BaseAgentManager):
         Exception:
             An error is encountered during processing.
         """
-        run_id = uuid.uuid4()
+        from llama_index.core.chat_engine.types import StreamingAgentChatResponse
 
-        # If using Agent Engine, explicitly re-set the index/query llm for Vertex Search
-        Settings.llm = self.model_obj
+        run_id = input.get("run_id", str(uuid.uuid4()))
 
-        try:
-            # Convert the messages into a string
-            content = "\n".join(f"[{msg['type']}]: {msg['content']}" for msg in input["messages"])
-            response = self.agent_executor.query(content)
-            yield self.get_response_obj(
-                content=response.response,
-                run_id=run_id
-            )
+        # The tools query Vertex Search with the model of this agent
+        with llamaindex_scope(self.model_obj):
+            try:
+                # Convert the messages into a string
+                content = "\n".join(f"[{msg['type']}]: {msg['content']}" for msg in input["messages"])
+                task = self.agent_executor.create_task(content)
+                reasoning_state = {"seen": 0, "tool_call_id": None, "tool_name": None}
+                while True:
+                    step_output = self.agent_executor.stream_step(task.task_id)
+                    yield from self.get_reasoning_objs(task, reasoning_state, run_id)
+
+                    if step_output.is_last:
+                        if isinstance(step_output.output, StreamingAgentChatResponse):
+                            for token in step_output.output.response_gen:
+                                yield self.get_response_obj(
+                                    content=token,
+                                    run_id=run_id,
+                                    message_class="AIMessageChunk"
+                                )
+                        else:
+                            yield self.get_response_obj(
+                                content=step_output.output.response,
+                                run_id=run_id
+                            )
+                        self.agent_executor.finalize_response(task.task_id, step_output)
+                        break
+
+            except Exception as e:
+                raise RuntimeError(f"Unexpected error. {e}") from e
+
+
+    def get_reasoning_objs(
+        self,
+        task: Any,
+        reasoning_state: Dict[str, Any],
+        run_id: str
+    ) -> List[Dict]:
+        """Returns response objects for the ReAct reasoning steps not yet streamed.
 
-        except Exception as e:
-            raise RuntimeError(f"Unexpected error. {e}") from e
+        Thoughts are streamed with the `thought` message type, actions as tool
+        start events and observations as tool end events.
+
+        Args:
+            task: The LlamaIndex agent task being run.
+            reasoning_state: The number of reasoning steps already streamed and
+                the ID and name of the pending tool call. Updated in place.
+            run_id: The run_id.
+
+        Returns:
+            A list of structured dictionary response objects.
+        """
+        from llama_index.core.agent.react.types import (
+            ActionReasoningStep,
+            ObservationReasoningStep
+        )
+
+        reasoning_steps = task.extra_state.get("current_reasoning", [])
+        response_objs = []
+        for step in reasoning_steps[reasoning_state["seen"]:]:
+            if isinstance(step, ActionReasoningStep):
+                reasoning_state["tool_call_id"] = str(uuid.uuid4())
+                reasoning_state["tool_name"] = step.action
+                response_objs.append(self.get_response_obj(
+                    content=step.thought,
+                    run_id=run_id,
+                    message_class="AIMessageChunk",
+                    message_type="thought"
+                ))
+                response_objs.append(self.get_tool_start_obj(
+                    name=step.action,
+                    tool_input=step.action_input,
+                    tool_call_id=reasoning_state["tool_call_id"],
+                    run_id=run_id
+                ))
+            elif isinstance(step, ObservationReasoningStep):
+                response_objs.append(self.get_tool_end_obj(
+                    name=reasoning_state["tool_name"] or "observation",
+                    output=step.observation,
+                    tool_call_id=reasoning_state["tool_call_id"] or str(uuid.uuid4()),
+                    run_id=run_id
+                ))
+                reasoning_state["tool_call_id"] = None
+                reasoning_state["tool_name"] = None
+        reasoning_state["seen"] = len(reasoning_steps)
+        return response_objs
@@ -0,0 +1,279 @@
+# Copyright 2025 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# pylint: disable=C0301
+"""Module for hosting several agent configurations in one server process.
+
+Each configuration (industry, orchestration framework, model) gets its own
+Agent Manager. Managers are built on first use and kept in a keyed LRU pool,
+so one instance can serve several tenants while sharing the process-wide
+model clients and retrievers.
+"""
+import asyncio
+import collections
+from dataclasses import dataclass, fields
+import json
+import logging
+import os
+import threading
+from typing import Any, Callable, Dict, Optional
+
+import yaml
+
+from app.utils.admission import AdmissionController, AdmissionLease
+from app.utils.metrics import REGISTRY
+
+# The name of the configuration built from the AGENT_* environment variables
+DEFAULT_AGENT_CONFIG_NAME = "default"
+
+AGENT_POOL_SIZE = REGISTRY.gauge(
+    "agent_pool_size",
+    "Number of Agent Managers currently held by the pool."
+)
+AGENT_POOL_BUILDS = REGISTRY.counter(
+    "agent_pool_builds_total",
+    "Number of Agent Managers built by the pool.",
+    ["agent"]
+)
+AGENT_POOL_EVICTIONS = REGISTRY.counter(
+    "agent_pool_evictions_total",
+    "Number of Agent Managers evicted from the pool.",
+    ["agent"]
+)
+
+
+@dataclass(frozen=True)
+class AgentConfig:
+    """The settings of one hosted agent.
+
+    Attributes:
+        name: The name requests select the agent by.
+        orchestration_framework: The AGENT_ORCHESTRATION_FRAMEWORK of the agent.
+        industry_type: The AGENT_INDUSTRY_TYPE of the agent.
+        foundation_model: The AGENT_FOUNDATION_MODEL of the agent.
+        agent_engine_resource_id: The Resource ID of the deployed AE Agent (if using AE).
+        model_cascade: The AGENT_MODEL_CASCADE of the agent: comma separated models, cheapest
+            first, each query is routed to. Empty to always use `foundation_model`.
+        max_concurrency: Maximum number of concurrent requests for this agent. 0 means
+            only the server-wide limit applies.
+    """
+
+    name: str
+    orchestration_framework: str
+    industry_type: str
+    foundation_model: str
+    agent_engine_resource_id: str = ""
+    model_cascade: str = ""
+    max_concurrency: int = 0
+
+
+class UnknownAgentConfigError(KeyError):
+    """Raised when a request selects an agent configuration that is not defined."""
+
+
+def load_agent_configs(default_config: AgentConfig, source: str = "") -> Dict[str, AgentConfig]:
+    """Loads the hosted agent configurations.
+
+    The source is either a JSON string or the path of a JSON or YAML file that
+    maps agent names to their settings, e.g.
+
+        {"retail": {"industry_type": "retail", "foundation_model": "gemini-2.5-flash"}}
+
+    Settings that are not given default to those of `default_config`.
+
+    Args:
+        default_config: The configuration built from the environment variables.
+        source: The AGENT_CONFIGS value. May be empty.
+
+    Returns:
+        The configurations by name, always including `default_config`.
+
+    Exception:
+        ValueError: The source cannot be parsed or contains unknown settings.
+    """
+    configs = {default_config.name: default_config}
+    if not source:
+        return configs
+
+    try:
+        if os.path.isfile(source):
+            with open(source, "r", encoding="utf-8") as f:
+                raw_configs = yaml.safe_load(f) if source.endswith((".yaml", ".yml")) else json.load(f)
+        else:
+            raw_configs = json.loads(source)
+    except (OSError, ValueError, yaml.YAMLError) as e:
+        raise ValueError(f"Unable to read AGENT_CONFIGS. {e}") from e
+
+    if not isinstance(raw_configs, dict):
+        raise ValueError("AGENT_CONFIGS must map agent names to their settings.")
+
+    allowed = {field.name for field in fields(AgentConfig)} - {"name"}
+    for name, settings in raw_configs.items():
+        unknown = set(settings or {}) - allowed
+        if unknown:
+            raise ValueError(f"Unknown settings for agent {name}: {sorted(unknown)}")
+        merged = {key: getattr(default_config, key) for key in allowed}
+        merged.update(settings or {})
+        configs[name] = AgentConfig(name=name, **merged)
+    return configs
+
+
+class AgentLease:
+    """The use of a pooled Agent Manager by one request. Releasing it more than once is a no-op."""
+
+    def __init__(self, pool: "AgentManagerPool", name: str, agent_manager: Any, admission_lease: AdmissionLease):
+        self.name = name
+        self.agent_manager = agent_manager
+        self._pool = pool
+        self._admission_lease = admission_lease
+        self._released = False
+
+    def release(self) -> None:
+        """Returns the manager to the pool and frees the per-agent concurrency slot."""
+        if not self._released:
+            self._released = True
+            self._admission_lease.release()
+            self._pool.release(self.name)
+
+
+class AgentManagerPool:
+    """
+    Keyed LRU pool of Agent Managers, one per agent configuration.
+
+    Managers are built on first use. Once more than `max_size` managers are
+    held, the least recently used ones that are not serving a request are
+    evicted and built again on their next use. Each configuration can further
+    limit its number of concurrent requests.
+    """
+
+    def __init__(
+        self,
+        configs: Dict[str, AgentConfig],
+        factory: Callable[[AgentConfig], Any],
+        max_size: int,
+        max_queue_size: int,
+        max_queue_time: float,
+        retry_after: int
+    ):
+        """
+        Initializes the AgentManagerPool.
+
+        Args:
+            configs: The hosted agent configurations by name.
+            factory: A callable building the Agent Manager of a configuration.
+            max_size: Maximum number of managers held at once.
+            max_queue_size: Maximum number of requests waiting for a per-agent slot.
+            max_queue_time: Maximum number of seconds a request waits for a per-agent slot.
+            retry_after: The `Retry-After` value (in seconds) sent with rejections.
+        """
+        self.configs = configs
+        self.factory = factory
+        self.max_size = max_size
+
+        self._managers: "collections.OrderedDict[str, Any]" = collections.OrderedDict()
+        self._in_use: Dict[str, int] = collections.defaultdict(int)
+        self._lock = threading.Lock()
+        self._build_locks = {name: threading.Lock() for name in configs}
+        self._admission = {
+            name: AdmissionController(
+                max_in_flight=config.max_concurrency,
+                max_queue_size=max_queue_size,
+                max_queue_time=max_queue_time,
+                retry_after=retry_after,
+                route=f"agent:{name}"
+            )
+            for name, config in configs.items()
+        }
+
+    def get_config(self, name: Optional[str]) -> AgentConfig:
+        """Returns the configuration selected by a request, the default one if none is given.
+
+        Exception:
+            UnknownAgentConfigError: No configuration is defined under the name.
+        """
+        name = name or DEFAULT_AGENT_CONFIG_NAME
+        if name not in self.configs:
+            raise UnknownAgentConfigError(f"Agent {name} is not defined.")
+        return self.configs[name]
+
+    def get(self, name: str) -> Any:
+        """Returns the Agent Manager of a configuration, building it on first use.
+
+        Args:
+            name: The name of the configuration.
+
+        Returns:
+            The Agent Manager.
+        """
+        config = self.get_config(name)
+        with self._lock:
+            if config.name in self._managers:
+                self._managers.move_to_end(config.name)
+                return self._managers[config.name]
+
+        # Build outside the pool lock so other agents are not held up
+        with self._build_locks[config.name]:
+            with self._lock:
+                if config.name in self._managers:
+                    self._managers.move_to_end(config.name)
+                    return self._managers[config.name]
+
+            agent_manager = self.factory(config)
+            AGENT_POOL_BUILDS.inc(agent=config.name)
+
+            with self._lock:
+                self._managers[config.name] = agent_manager
+                self._evict()
+        return agent_manager
+
+    def _evict(self) -> None:
+        """Evicts least recently used idle managers until the pool fits `max_size`."""
+        for name in list(self._managers):
+            if len(self._managers) <= self.max_size:
+                break
+            if self._in_use[name] == 0:
+                del self._managers[name]
+                AGENT_POOL_EVICTIONS.inc(agent=name)
+                logging.info("Evicted agent %s from the pool.", name)
+        AGENT_POOL_SIZE.set(len(self._managers))
+
+    async def acquire(self, name: Optional[str]) -> AgentLease:
+        """Waits for a per-agent slot and returns the Agent Manager to serve a request with.
+
+        Args:
+            name: The name of the configuration, the default one if None.
+
+        Returns:
+            An AgentLease that must be released once the request finishes.
+
+        Exception:
+            UnknownAgentConfigError: No configuration is defined under the name.
+            AdmissionRejectedError: The agent is at its concurrency limit.
+        """
+        config = self.get_config(name)
+        admission_lease = await self._admission[config.name].acquire()
+        with self._lock:
+            self._in_use[config.name] += 1
+        try:
+            agent_manager = await asyncio.to_thread(self.get, config.name)
+        except BaseException:
+            admission_lease.release()
+            self.release(config.name)
+            raise
+        return AgentLease(self, config.name, agent_manager, admission_lease)
+
+    def release(self, name: str) -> None:
+        """Marks one request of an agent as finished."""
+        with self._lock:
+            self._in_use[name] = max(self._in_use[name] - 1, 0)
+            self._evict()
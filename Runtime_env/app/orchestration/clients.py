@@ -0,0 +1,399 @@
+# Copyright 2025 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# pylint: disable=C0301, C0415, W0718
+"""Module for the process-wide registry of lazily created Google Cloud clients.
+
+Credentials, Vertex AI and the logging and tracing clients used to be set up
+at import time, which made every cold start wait on metadata-server and auth
+round trips. They are now created on first use and shared process-wide, and
+the server warms them up in the background once it accepts traffic. Chat
+models are pooled the same way, so the Agent Managers of a multi-agent
+process share them and their connections.
+
+When INTEGRATION_TEST is set to "TRUE", no client talks to Google Cloud, so no
+credentials are needed.
+"""
+import asyncio
+import json
+import logging
+import os
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from app.orchestration.config import (
+    CIRCUIT_FAILURE_THRESHOLD,
+    MODEL_HEDGE_MIN_DELAY_SECONDS,
+    MODEL_REGION_COOLDOWN_SECONDS,
+    PROJECT_ID,
+    RETRY_BASE_DELAY_SECONDS,
+    RETRY_MAX_DELAY_SECONDS
+)
+from app.utils.metrics import REGISTRY
+
+MODEL_CLIENT_REQUESTS = REGISTRY.counter(
+    "model_client_pool_requests_total",
+    "Number of model objects and prediction clients requested from the pool, by kind and result (hit, miss).",
+    ["kind", "result"]
+)
+MODEL_CLIENT_POOL_SIZE = REGISTRY.gauge(
+    "model_client_pool_size",
+    "Number of model objects and prediction clients held by the pool, by kind.",
+    ["kind"]
+)
+
+
+def is_integration_test() -> bool:
+    """Whether the process runs as an integration test, without Google Cloud access."""
+    return os.getenv("INTEGRATION_TEST") == "TRUE"
+
+
+class ClientRegistry:
+    """
+    Creates named clients on first use and shares them process-wide.
+
+    Each client is built by the factory registered under its name. Concurrent
+    first calls wait for a single construction. A failed construction is not
+    cached, so the next call retries it.
+    """
+
+    def __init__(self):
+        self._factories: Dict[str, Callable[[], Any]] = {}
+        self._warm_up: Dict[str, bool] = {}
+        self._clients: Dict[str, Any] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, factory: Callable[[], Any], warm_up: bool = True) -> None:
+        """Registers the factory of a client.
+
+        Args:
+            name: The name the client is retrieved by.
+            factory: A callable creating the client.
+            warm_up: Whether `warm_up` creates the client ahead of its first use.
+        """
+        with self._lock:
+            self._factories[name] = factory
+            self._warm_up[name] = warm_up
+            self._locks.setdefault(name, threading.Lock())
+            self._clients.pop(name, None)
+
+    def is_initialized(self, name: str) -> bool:
+        """Whether the client has already been created."""
+        return name in self._clients
+
+    def get(self, name: str) -> Any:
+        """Returns the client, creating it on first use.
+
+        Args:
+            name: The name of a registered client.
+
+        Returns:
+            The shared client instance.
+
+        Exception:
+            KeyError: No client is registered under the name.
+        """
+        if name in self._clients:
+            return self._clients[name]
+
+        with self._lock:
+            factory = self._factories[name]
+            lock = self._locks[name]
+        with lock:
+            if name not in self._clients:
+                self._clients[name] = factory()
+            return self._clients[name]
+
+    async def aget(self, name: str) -> Any:
+        """Returns the client, creating it on a worker thread so the event loop is not blocked."""
+        if name in self._clients:
+            return self._clients[name]
+        return await asyncio.to_thread(self.get, name)
+
+    def warm_up(self, names: Optional[Iterable[str]] = None) -> Dict[str, Exception]:
+        """Creates clients ahead of their first use.
+
+        Args:
+            names: The clients to create, in order. Defaults to every client
+                registered with `warm_up=True`, in registration order.
+
+        Returns:
+            The errors raised by the clients that could not be created, by name.
+        """
+        if names is None:
+            with self._lock:
+                names = [name for name, warm_up in self._warm_up.items() if warm_up]
+
+        errors = {}
+        for name in names:
+            try:
+                self.get(name)
+            except Exception as e:
+                logging.warning("Failed to warm up client %s: %s", name, e)
+                errors[name] = e
+        return errors
+
+    async def awarm_up(self, names: Optional[Iterable[str]] = None) -> Dict[str, Exception]:
+        """Runs `warm_up` on a worker thread."""
+        return await asyncio.to_thread(self.warm_up, names)
+
+    def reset(self, name: Optional[str] = None) -> None:
+        """Drops a created client (or all of them), so it is created again on next use."""
+        with self._lock:
+            if name is None:
+                self._clients.clear()
+            else:
+                self._clients.pop(name, None)
+
+
+class ModelClientPool:
+    """
+    Shares chat model objects and their prediction service clients process-wide.
+
+    Model objects are cached by their class and settings (model, location,
+    generation parameters), so Agent Managers with the same model settings
+    share one object. Prediction service clients are cached by endpoint and
+    transport, so models that only differ in their generation parameters
+    still share one gRPC channel and its connections.
+
+    Each object is built under a lock of its own key, so building one model
+    (credential lookup, channel setup) never blocks the lookups of the others.
+    """
+
+    def __init__(self):
+        self._models: Dict[tuple, Any] = {}
+        self._clients: Dict[tuple, Any] = {}
+        self._locks: Dict[tuple, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def _get_lock(self, key: tuple) -> threading.Lock:
+        with self._lock:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def _get(self, kind: str, cache: Dict[tuple, Any], key: tuple, factory: Callable[[], Any]) -> Any:
+        """Returns the cached object, creating it on first use."""
+        with self._lock:
+            if key in cache:
+                MODEL_CLIENT_REQUESTS.inc(kind=kind, result="hit")
+                return cache[key]
+        with self._get_lock(key):
+            with self._lock:
+                if key in cache:
+                    MODEL_CLIENT_REQUESTS.inc(kind=kind, result="hit")
+                    return cache[key]
+            instance = factory()
+            with self._lock:
+                cache[key] = instance
+                MODEL_CLIENT_POOL_SIZE.set(len(cache), kind=kind)
+            MODEL_CLIENT_REQUESTS.inc(kind=kind, result="miss")
+            return instance
+
+    def get_model(self, model_class: type, **params: Any) -> Any:
+        """Returns the shared model object of a class and settings, creating it on first use.
+
+        Args:
+            model_class: The chat model class (e.g. ChatVertexAI).
+            **params: The hashable constructor arguments of the model.
+
+        Returns:
+            The shared model object.
+        """
+        key = (model_class.__module__, model_class.__qualname__, tuple(sorted(params.items())))
+        return self._get("model", self._models, key, lambda: model_class(**params))
+
+    def get_regional_model(
+        self,
+        model_class: type,
+        regions: List[str],
+        hedging: bool = False,
+        max_retries: int = 6,
+        attempt_timeout: Optional[float] = None,
+        **params: Any
+    ) -> Any:
+        """Returns the shared model of a class and settings, served from its regions.
+
+        The models of each region retry at most once on their own. The
+        returned RegionalChatModel fails over between the regions, stops
+        calling regions whose circuit is open, and retries calls failed in
+        every region with jittered backoff, up to `max_retries` attempts and
+        while the deadline of the run allows.
+
+        Args:
+            model_class: The chat model class (e.g. ChatVertexAI).
+            regions: The regions of the model, in order of preference.
+            hedging: Whether slow async calls are hedged in a second region.
+            max_retries: Maximum number of attempts of a call.
+            attempt_timeout: Maximum number of seconds of an attempt, capped by the deadline of the run.
+            **params: The hashable constructor arguments of the model, except its location and retries.
+
+        Returns:
+            The shared RegionalChatModel.
+        """
+        from app.orchestration.regions import RegionalChatModel, get_region_pool
+        from app.utils.resilience import RetryPolicy
+
+        model_name = params.get("model_name", model_class.__name__)
+        key = ("regional", model_class.__module__, model_class.__qualname__, tuple(regions), hedging, max_retries, attempt_timeout, tuple(sorted(params.items())))
+        return self._get("model", self._models, key, lambda: RegionalChatModel(
+            model_name=model_name,
+            region_models={region: self.get_model(model_class, location=region, max_retries=1, **params) for region in regions},
+            pool=get_region_pool(
+                model_name,
+                list(regions),
+                cooldown=MODEL_REGION_COOLDOWN_SECONDS,
+                failure_threshold=CIRCUIT_FAILURE_THRESHOLD,
+                hedge_min_delay=MODEL_HEDGE_MIN_DELAY_SECONDS
+            ),
+            hedging=hedging,
+            retry_policy=RetryPolicy(
+                max_attempts=max_retries,
+                base_delay=RETRY_BASE_DELAY_SECONDS,
+                max_delay=RETRY_MAX_DELAY_SECONDS
+            ),
+            attempt_timeout=attempt_timeout
+        ))
+
+    def get_client(self, key: tuple, factory: Callable[[], Any]) -> Any:
+        """Returns the shared prediction service client of an endpoint, creating it on first use.
+
+        Args:
+            key: Identifies the endpoint, transport and API version of the client.
+            factory: A callable creating the client.
+
+        Returns:
+            The shared client.
+        """
+        return self._get("client", self._clients, key, factory)
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns the number of pooled model objects and clients, and the cache hits and misses."""
+        with self._lock:
+            stats = {"models": len(self._models), "clients": len(self._clients)}
+        for kind in ("model", "client"):
+            stats[f"{kind}_hits"] = int(MODEL_CLIENT_REQUESTS.get(kind=kind, result="hit"))
+            stats[f"{kind}_misses"] = int(MODEL_CLIENT_REQUESTS.get(kind=kind, result="miss"))
+        return stats
+
+    def clear(self) -> None:
+        """Drops every pooled object, so they are created again on next use."""
+        with self._lock:
+            self._models.clear()
+            self._clients.clear()
+            self._locks.clear()
+            for kind in ("model", "client"):
+                MODEL_CLIENT_POOL_SIZE.set(0, kind=kind)
+
+
+class LocalStructLogger:
+    """Stands in for a Cloud Logging logger by writing structured entries to the standard logger."""
+
+    def __init__(self, name: str):
+        self._logger = logging.getLogger(name)
+
+    def log_struct(self, info: Dict[str, Any], severity: str = "INFO", **kwargs: Any) -> None: # pylint: disable=W0613
+        """Logs a structured entry as JSON."""
+        self._logger.log(logging.getLevelName(severity), json.dumps(info, default=str))
+
+
+def _create_credentials() -> tuple:
+    """Resolves the application default credentials and project."""
+    if is_integration_test():
+        return None, PROJECT_ID or "integration-test"
+
+    import google.auth
+
+    return google.auth.default()
+
+
+def _init_vertexai() -> bool:
+    """Initializes the Vertex AI SDK for the project."""
+    if is_integration_test():
+        return False
+
+    import vertexai
+
+    vertexai.init(project=get_project_id())
+    return True
+
+
+def _create_logging_client() -> Any:
+    """Creates the Cloud Logging client."""
+    if is_integration_test():
+        return None
+
+    from google.cloud import logging as google_cloud_logging
+
+    credentials, _ = get_credentials()
+    return google_cloud_logging.Client(project=get_project_id(), credentials=credentials)
+
+
+def _create_trace_exporter() -> Any:
+    """Creates the span exporter writing traces to Cloud Trace and Cloud Logging."""
+    if is_integration_test():
+        return None
+
+    from app.utils.tracing import CloudTraceLoggingSpanExporter
+
+    return CloudTraceLoggingSpanExporter(logging_client=get_logging_client(), project_id=get_project_id())
+
+
+# The clients shared by the whole process
+CLIENTS = ClientRegistry()
+CLIENTS.register("credentials", _create_credentials)
+CLIENTS.register("vertexai", _init_vertexai)
+CLIENTS.register("logging_client", _create_logging_client)
+CLIENTS.register("trace_exporter", _create_trace_exporter)
+
+# The chat models shared by the Agent Managers of the process
+MODEL_CLIENTS = ModelClientPool()
+
+
+def get_credentials() -> tuple:
+    """Returns the application default (credentials, project_id), resolved on first use."""
+    return CLIENTS.get("credentials")
+
+
+def get_project_id() -> str:
+    """Returns the PROJECT_ID, falling back to the project of the default credentials."""
+    return PROJECT_ID or get_credentials()[1]
+
+
+def init_vertexai() -> None:
+    """Initializes the Vertex AI SDK once per process."""
+    CLIENTS.get("vertexai")
+
+
+def get_logging_client() -> Any:
+    """Returns the shared Cloud Logging client, or None in integration tests."""
+    return CLIENTS.get("logging_client")
+
+
+def get_cloud_logger(name: str) -> Any:
+    """Returns a Cloud Logging logger, or a local stand-in in integration tests.
+
+    Args:
+        name: The name of the log.
+
+    Returns:
+        An object exposing `log_struct`.
+    """
+    logging_client = get_logging_client()
+    if logging_client is None:
+        return LocalStructLogger(name)
+    return logging_client.logger(name)
+
+
+def get_trace_exporter() -> Any:
+    """Returns the shared span exporter, or None in integration tests."""
+    return CLIENTS.get("trace_exporter")
@@ -15,19 +15,15 @@
 """Module that sets up environment variables from a sourced config yaml file."""
 import os
 
-import google
-
 from app.orchestration.constants import DEV_YAML_CONFIG_PATH
 from app.utils.utils import load_env_from_yaml
 
-# Initialize Google Cloud and Vertex AI
-credentials, project_id = google.auth.default()
-
 # Explicitly set env vars from file (used for agent engine)
 load_env_from_yaml(DEV_YAML_CONFIG_PATH)
 
 SERP_API_KEY = os.getenv("SERPER_API_KEY", "unset")
-PROJECT_ID = os.getenv("PROJECT_ID", project_id)
+# Falls back to the project of the default credentials, see clients.get_project_id
+PROJECT_ID = os.getenv("PROJECT_ID")
 VERTEX_AI_LOCATION = os.getenv("REGION", "us-central1")
 GCS_STAGING_BUCKET = os.getenv("GCS_STAGING_BUCKET", "unset")
 AGENT_BUILDER_LOCATION = os.getenv("AGENT_BUILDER_LOCATION", "us")
@@ -35,6 +31,66 @@ AGENT_INDUSTRY_TYPE = os.getenv("AGENT_INDUSTRY_TYPE", "unset")
 AGENT_ORCHESTRATION_FRAMEWORK = os.getenv("AGENT_ORCHESTRATION_FRAMEWORK", "unset")
 AGENT_FOUNDATION_MODEL = os.getenv("AGENT_FOUNDATION_MODEL", "gemini-2.0-flash")
 AGENT_ENGINE_RESOURCE_ID = os.getenv("AGENT_ENGINE_RESOURCE_ID", "")
+# Comma separated models, cheapest first, to route each query to one of them
+AGENT_MODEL_CASCADE = os.getenv("AGENT_MODEL_CASCADE", "")
 USER_AGENT = os.getenv("USER_AGENT", "unset")
 AGENT_DESCRIPTION = os.getenv("AGENT_DESCRIPTION", "unset")
 DATA_STORE_ID = os.getenv("DATA_STORE_ID", "unset")
+
+# Performance tuning
+AGENT_STREAM_WORKER_POOL_SIZE = int(os.getenv("AGENT_STREAM_WORKER_POOL_SIZE", "64"))
+STREAM_QUERY_MAX_IN_FLIGHT = int(os.getenv("STREAM_QUERY_MAX_IN_FLIGHT", "32"))
+STREAM_QUERY_MAX_QUEUE_SIZE = int(os.getenv("STREAM_QUERY_MAX_QUEUE_SIZE", "64"))
+STREAM_QUERY_MAX_QUEUE_SECONDS = float(os.getenv("STREAM_QUERY_MAX_QUEUE_SECONDS", "10"))
+STREAM_QUERY_RETRY_AFTER_SECONDS = int(os.getenv("STREAM_QUERY_RETRY_AFTER_SECONDS", "5"))
+JSON_ENCODER = os.getenv("JSON_ENCODER", "auto")
+SESSION_STORE_PATH = os.getenv("SESSION_STORE_PATH", "/tmp/agent_sessions.sqlite3")
+SESSION_STORE_MAX_MEMORY_BYTES = int(os.getenv("SESSION_STORE_MAX_MEMORY_BYTES", str(64 * 1024 * 1024)))
+CLIENT_WARM_UP = os.getenv("CLIENT_WARM_UP", "TRUE") == "TRUE"
+AGENT_CONFIGS = os.getenv("AGENT_CONFIGS", "")
+AGENT_POOL_MAX_SIZE = int(os.getenv("AGENT_POOL_MAX_SIZE", "4"))
+AGENT_MAX_CONCURRENCY = int(os.getenv("AGENT_MAX_CONCURRENCY", "0"))
+BATCH_QUERY_MAX_CONCURRENCY = int(os.getenv("BATCH_QUERY_MAX_CONCURRENCY", "8"))
+BATCH_QUERY_ITEM_TIMEOUT_SECONDS = float(os.getenv("BATCH_QUERY_ITEM_TIMEOUT_SECONDS", "120"))
+BATCH_QUERY_MAX_ITEMS = int(os.getenv("BATCH_QUERY_MAX_ITEMS", "1000"))
+FEEDBACK_QUEUE_MAX_SIZE = int(os.getenv("FEEDBACK_QUEUE_MAX_SIZE", "10000"))
+FEEDBACK_BATCH_SIZE = int(os.getenv("FEEDBACK_BATCH_SIZE", "100"))
+FEEDBACK_FLUSH_SECONDS = float(os.getenv("FEEDBACK_FLUSH_SECONDS", "5"))
+FEEDBACK_SPILL_PATH = os.getenv("FEEDBACK_SPILL_PATH", "/tmp/agent_feedback_spill.jsonl")
+DISCONNECT_POLL_SECONDS = float(os.getenv("DISCONNECT_POLL_SECONDS", "0.5"))
+REQUEST_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", "120"))
+REQUEST_DEADLINE_MAX_SECONDS = float(os.getenv("REQUEST_DEADLINE_MAX_SECONDS", "600"))
+MODEL_TIMEOUT_SECONDS = float(os.getenv("MODEL_TIMEOUT_SECONDS", "60"))
+TOOL_MIN_REMAINING_SECONDS = float(os.getenv("TOOL_MIN_REMAINING_SECONDS", "2"))
+TOOL_TIMEOUT_SECONDS = float(os.getenv("TOOL_TIMEOUT_SECONDS", "30"))
+TOOL_WORKER_POOL_SIZE = int(os.getenv("TOOL_WORKER_POOL_SIZE", "32"))
+RERANK_MIN_REMAINING_SECONDS = float(os.getenv("RERANK_MIN_REMAINING_SECONDS", "5"))
+AGENT_ENGINE_REFRESH_SECONDS = float(os.getenv("AGENT_ENGINE_REFRESH_SECONDS", "300"))
+ADK_SESSION_TTL_SECONDS = float(os.getenv("ADK_SESSION_TTL_SECONDS", "1800"))
+ADK_SESSION_MAX_COUNT = int(os.getenv("ADK_SESSION_MAX_COUNT", "10000"))
+HISTORY_COMPACTION = os.getenv("HISTORY_COMPACTION", "TRUE") == "TRUE"
+HISTORY_KEEP_TURNS = int(os.getenv("HISTORY_KEEP_TURNS", "4"))
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "8000"))
+HISTORY_TOKEN_BUDGETS = os.getenv("HISTORY_TOKEN_BUDGETS", "")
+HISTORY_SUMMARY_MODEL = os.getenv("HISTORY_SUMMARY_MODEL", "gemini-2.0-flash")
+HISTORY_SUMMARY_CACHE_SIZE = int(os.getenv("HISTORY_SUMMARY_CACHE_SIZE", "10000"))
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "TRUE") == "TRUE"
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "3600"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "10000"))
+RESPONSE_CACHE_PATH = os.getenv("RESPONSE_CACHE_PATH", "")
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "FALSE") == "TRUE"
+SEMANTIC_CACHE_EMBEDDER = os.getenv("SEMANTIC_CACHE_EMBEDDER", "hashing")
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+SEMANTIC_CACHE_TTL_SECONDS = float(os.getenv("SEMANTIC_CACHE_TTL_SECONDS", "3600"))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "10000"))
+ROUTING_MIN_CONFIDENCE = float(os.getenv("ROUTING_MIN_CONFIDENCE", "0.3"))
+# JSON of the regions of each model, e.g. {"claude": ["us-east5", "europe-west1"]}
+MODEL_REGIONS = os.getenv("MODEL_REGIONS", "")
+MODEL_HEDGING_ENABLED = os.getenv("MODEL_HEDGING_ENABLED", "FALSE") == "TRUE"
+MODEL_HEDGE_MIN_DELAY_SECONDS = float(os.getenv("MODEL_HEDGE_MIN_DELAY_SECONDS", "1"))
+MODEL_REGION_COOLDOWN_SECONDS = float(os.getenv("MODEL_REGION_COOLDOWN_SECONDS", "30"))
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_SECONDS = float(os.getenv("CIRCUIT_RESET_SECONDS", "30"))
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "3"))
+RETRY_BASE_DELAY_SECONDS = float(os.getenv("RETRY_BASE_DELAY_SECONDS", "0.5"))
+RETRY_MAX_DELAY_SECONDS = float(os.getenv("RETRY_MAX_DELAY_SECONDS", "8"))
@@ -61,4 +61,18 @@ help you answer questions. Check your available tools before answering questions
 If the user asks a general question, try to answer it to the best
 of your ability. Please respond in the language that your user asks questions in."""
 
+HISTORY_SUMMARY_PROMPT = """Summarize the conversation below between a user and an assistant.
+Keep the facts, figures, names, decisions and open questions needed to continue
+the conversation, and drop greetings and repetitions. Answer with the summary only,
+in the language of the conversation, in at most 300 words.
+
+{conversation}"""
+
+# Prepended to the first message sent verbatim when the older turns are summarized
+HISTORY_SUMMARY_CONTEXT = """[Context from the server, not written by the user: a summary of the earlier conversation]
+{summary}
+[End of the summary]
+
+"""
+
 DEV_YAML_CONFIG_PATH = "deployment/config/dev.yaml" # TODO: make this dynamic
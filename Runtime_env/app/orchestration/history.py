@@ -0,0 +1,343 @@
+# Copyright 2025 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# pylint: disable=C0301, C0415, W0718
+"""Module for compacting the conversation history sent to the model.
+
+Histories that fit the token budget of their model are sent unchanged. Once
+a history exceeds it, the last turns are kept verbatim and the older turns
+are replaced by a rolling summary, computed in the background and cached per
+conversation, so a turn never waits for it: until the summary is ready, the
+older turns are cut to what fits the budget instead. Tokens are estimated
+locally from the text length.
+"""
+import asyncio
+import collections
+import contextvars
+from dataclasses import dataclass
+import hashlib
+import logging
+import threading
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app.orchestration.config import (
+    HISTORY_KEEP_TURNS,
+    HISTORY_SUMMARY_CACHE_SIZE,
+    HISTORY_SUMMARY_MODEL,
+    HISTORY_TOKEN_BUDGET,
+    HISTORY_TOKEN_BUDGETS,
+    MODEL_TIMEOUT_SECONDS,
+    VERTEX_AI_LOCATION
+)
+from app.orchestration.constants import HISTORY_SUMMARY_CONTEXT, HISTORY_SUMMARY_PROMPT
+from app.utils.metrics import REGISTRY
+from app.utils.stage_metrics import estimate_tokens
+
+HISTORY_COMPACTIONS = REGISTRY.counter(
+    "history_compactions_total",
+    "Number of conversation histories by compaction result (unchanged, summarized, truncated).",
+    ["result"]
+)
+HISTORY_TOKENS_SAVED = REGISTRY.counter(
+    "history_tokens_saved_total",
+    "Estimated number of history tokens not sent to the model thanks to compaction."
+)
+HISTORY_SUMMARIES = REGISTRY.counter(
+    "history_summaries_total",
+    "Number of background history summaries by status (success, error).",
+    ["status"]
+)
+
+# Estimated tokens of the role and separators of a message
+MESSAGE_TOKEN_OVERHEAD = 4
+
+# A conversation: (user_id, session_id), or a digest of its first message
+ConversationKey = Tuple[str, str]
+
+Summarizer = Callable[[str], Awaitable[str]]
+
+
+def parse_token_budgets(value: str) -> Dict[str, int]:
+    """Parses per-model token budgets, e.g. "gemini-2.5-pro=32000,gemini-2.0-flash=8000"."""
+    budgets = {}
+    for item in value.split(","):
+        model_name, _, budget = item.partition("=")
+        if model_name.strip() and budget.strip():
+            try:
+                budgets[model_name.strip()] = int(budget)
+            except ValueError:
+                logging.warning("Ignoring invalid history token budget %r.", item)
+    return budgets
+
+
+def estimate_message_tokens(message: Dict[str, Any]) -> int:
+    """Roughly estimates the number of tokens of a message."""
+    content = message.get("content")
+    return estimate_tokens(content if isinstance(content, str) else str(content)) + MESSAGE_TOKEN_OVERHEAD
+
+
+def with_summary(message: Dict[str, Any], summary: str) -> Dict[str, Any]:
+    """Returns a copy of a message with the summary of the earlier conversation prepended to its content."""
+    context = HISTORY_SUMMARY_CONTEXT.format(summary=summary)
+    content = message.get("content")
+    if isinstance(content, list):
+        return {**message, "content": [{"type": "text", "text": context}] + content}
+    return {**message, "content": context + (content or "")}
+
+
+def digest_messages(messages: List[Dict[str, Any]]) -> str:
+    """Returns a digest identifying a list of messages."""
+    digest = hashlib.sha1()
+    for message in messages:
+        digest.update(f"{message.get('type')}\x1f{message.get('content')}\x1e".encode("utf-8"))
+    return digest.hexdigest()
+
+
+async def summarize_with_model(text: str) -> str:
+    """Summarizes a conversation with the history summary model."""
+    from langchain_core.messages import HumanMessage
+
+    from app.orchestration.clients import MODEL_CLIENTS
+    from app.orchestration.models import AgentChatVertexAI
+
+    model = MODEL_CLIENTS.get_model(
+        AgentChatVertexAI,
+        model_name=HISTORY_SUMMARY_MODEL,
+        location=VERTEX_AI_LOCATION,
+        attempt_timeout=MODEL_TIMEOUT_SECONDS,
+        max_retries=2,
+        temperature=0
+    )
+    response = await model.ainvoke([HumanMessage(content=HISTORY_SUMMARY_PROMPT.format(conversation=text))])
+    return response.content if isinstance(response.content, str) else str(response.content)
+
+
+@dataclass
+class HistorySummary:
+    """The rolling summary of the first messages of a conversation.
+
+    Attributes:
+        message_count: The number of messages summarized.
+        digest: The digest of the summarized messages.
+        text: The summary.
+    """
+
+    message_count: int
+    digest: str
+    text: str
+
+
+class HistoryCompactor:
+    """
+    Fits conversation histories in the token budget of their model.
+
+    Histories within the budget are left unchanged. Otherwise the last
+    `keep_turns` turns (a human message and the messages answering it) are
+    kept verbatim, and older turns are replaced by the cached summary of the
+    conversation, prepended to the first message kept. The summary is
+    context, not a message of the user or of the model, so it never gets a
+    message of its own. A summary covering fewer messages than needed is
+    still used, followed by the older turns it misses, while it is brought up
+    to date in the background. Messages are dropped from the oldest until the
+    history fits the budget, always keeping the new message.
+    """
+
+    def __init__(
+        self,
+        keep_turns: int,
+        default_budget: int,
+        budgets: Optional[Dict[str, int]] = None,
+        summarize: Summarizer = summarize_with_model,
+        max_summaries: int = 10000
+    ):
+        """
+        Initializes the HistoryCompactor.
+
+        Args:
+            keep_turns: Number of last turns kept verbatim.
+            default_budget: Token budget of the history of models without their own.
+            budgets: Token budget of the history, by model name.
+            summarize: Coroutine function summarizing a conversation transcript.
+            max_summaries: Maximum number of conversation summaries cached.
+        """
+        self.keep_turns = keep_turns
+        self.default_budget = default_budget
+        self.budgets = budgets or {}
+        self.summarize = summarize
+        self.max_summaries = max_summaries
+        self._summaries: "collections.OrderedDict[ConversationKey, HistorySummary]" = collections.OrderedDict()
+        self._pending: Dict[ConversationKey, asyncio.Task] = {}
+        self._lock = threading.Lock()
+
+    def get_budget(self, model_name: str) -> int:
+        """Returns the token budget of the history for a model."""
+        return self.budgets.get(model_name, self.default_budget)
+
+    def get_summary(self, key: ConversationKey) -> Optional[HistorySummary]:
+        """Returns the cached summary of a conversation, if any."""
+        with self._lock:
+            summary = self._summaries.get(key)
+            if summary is not None:
+                self._summaries.move_to_end(key)
+            return summary
+
+    def _set_summary(self, key: ConversationKey, summary: HistorySummary) -> None:
+        with self._lock:
+            self._summaries[key] = summary
+            self._summaries.move_to_end(key)
+            while len(self._summaries) > self.max_summaries:
+                self._summaries.popitem(last=False)
+
+    def split_turns(self, messages: List[Dict[str, Any]]) -> int:
+        """Returns the index of the first message of the last `keep_turns` turns."""
+        turns = 0
+        for index in range(len(messages) - 1, -1, -1):
+            if messages[index].get("type") == "human":
+                turns += 1
+                if turns >= self.keep_turns:
+                    return index
+        return 0
+
+    def compact(
+        self,
+        messages: List[Dict[str, Any]],
+        model_name: str,
+        key: ConversationKey
+    ) -> List[Dict[str, Any]]:
+        """Returns the history to send to the model.
+
+        Args:
+            messages: The messages of the conversation, ending with the new one.
+            model_name: The name of the model the history is sent to.
+            key: Identifies the conversation, for its cached summary.
+
+        Returns:
+            The compacted messages. The input list is not modified.
+        """
+        tokens = [estimate_message_tokens(message) for message in messages]
+        budget = self.get_budget(model_name)
+        if sum(tokens) <= budget:
+            HISTORY_COMPACTIONS.inc(result="unchanged")
+            return messages
+
+        split = self.split_turns(messages)
+        context_tokens = 0
+        start = 0
+        summary = None
+        if split > 0:
+            summary = self.get_summary(key)
+            if summary is not None and (summary.message_count > split or summary.digest != digest_messages(messages[:summary.message_count])):
+                summary = None
+            if summary is None or summary.message_count < split:
+                self.schedule_summary(key, messages[:split], summary)
+            if summary is not None:
+                start = summary.message_count
+                context_tokens = estimate_tokens(HISTORY_SUMMARY_CONTEXT.format(summary=summary.text))
+
+        # Drop messages from the oldest until the history fits the budget
+        budget -= context_tokens
+        kept = len(messages) - 1
+        used = tokens[kept]
+        while kept > start and used + tokens[kept - 1] <= budget:
+            kept -= 1
+            used += tokens[kept]
+        # Never start the history with the answer to a dropped message
+        while 0 < kept < len(messages) - 1 and messages[kept].get("type") != "human":
+            used -= tokens[kept]
+            kept += 1
+
+        compacted = messages[kept:]
+        if summary is not None:
+            compacted = [with_summary(compacted[0], summary.text)] + compacted[1:]
+        HISTORY_COMPACTIONS.inc(result="summarized" if summary is not None else "truncated")
+        HISTORY_TOKENS_SAVED.inc(max(sum(tokens) - used - context_tokens, 0))
+        return compacted
+
+    def schedule_summary(
+        self,
+        key: ConversationKey,
+        messages: List[Dict[str, Any]],
+        previous: Optional[HistorySummary]
+    ) -> None:
+        """Starts summarizing the first messages of a conversation in the background.
+
+        Args:
+            key: Identifies the conversation.
+            messages: The messages to summarize.
+            previous: A summary of the first of these messages, extended instead of starting over.
+        """
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        with self._lock:
+            if key in self._pending:
+                return
+            # Reserved until the task starts, so concurrent turns do not start another
+            self._pending[key] = None
+        # Run outside of the request context, so its deadline and cancellation do not apply
+        loop.call_soon(self._start_summary, key, messages, previous, context=contextvars.Context())
+
+    def _start_summary(
+        self,
+        key: ConversationKey,
+        messages: List[Dict[str, Any]],
+        previous: Optional[HistorySummary]
+    ) -> None:
+        task = asyncio.ensure_future(self._summarize(key, messages, previous))
+        with self._lock:
+            self._pending[key] = task
+
+    async def _summarize(
+        self,
+        key: ConversationKey,
+        messages: List[Dict[str, Any]],
+        previous: Optional[HistorySummary]
+    ) -> None:
+        start = 0
+        transcript = []
+        if previous is not None:
+            start = previous.message_count
+            transcript.append(f"[summary]: {previous.text}")
+        transcript.extend(f"[{message.get('type')}]: {message.get('content')}" for message in messages[start:])
+        try:
+            text = await self.summarize("\n".join(transcript))
+            self._set_summary(key, HistorySummary(len(messages), digest_messages(messages), text))
+            HISTORY_SUMMARIES.inc(status="success")
+        except Exception as e:
+            logging.warning("Failed to summarize the history of a conversation: %s", e)
+            HISTORY_SUMMARIES.inc(status="error")
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+
+    def stats(self) -> Dict[str, int]:
+        """Returns the number of cached and pending summaries."""
+        return {"summaries": len(self._summaries), "pending": len(self._pending)}
+
+
+def get_conversation_key(input: Dict[str, Any]) -> ConversationKey:
+    """Identifies the conversation of an agent input, for its cached summary."""
+    if input.get("session_id"):
+        return (input.get("user_id") or "", input["session_id"])
+    messages = input.get("messages") or []
+    return ("", digest_messages(messages[:1]))
+
+
+# The history compactor shared by every Agent Manager of the process
+HISTORY = HistoryCompactor(
+    keep_turns=HISTORY_KEEP_TURNS,
+    default_budget=HISTORY_TOKEN_BUDGET,
+    budgets=parse_token_budgets(HISTORY_TOKEN_BUDGETS),
+    max_summaries=HISTORY_SUMMARY_CACHE_SIZE
+)
@@ -0,0 +1,115 @@
+# Copyright 2025 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# pylint: disable=C0301
+"""Module for the chat model classes used by the Agent Managers.
+
+This module imports langchain_google_vertexai at import time, so it is itself
+imported lazily, when the first model is created.
+"""
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+from langchain_google_vertexai import ChatVertexAI
+
+from app.orchestration.clients import MODEL_CLIENTS
+from app.utils.deadline import clamp_timeout
+
+
+class AgentChatVertexAI(ChatVertexAI):
+    """
+    ChatVertexAI sharing its prediction service clients and bounding every
+    Gemini request by a timeout.
+
+    The clients come from the process-wide model client pool, so every model
+    calling the same regional endpoint reuses one gRPC channel instead of
+    opening its own connections.
+
+    The timeout of each attempt is `attempt_timeout`, capped by the time left
+    until the deadline of the current run, so retries never outlive the
+    request that triggered them. Once the deadline has passed, calls raise
+    DeadlineExceededError instead of reaching the model.
+    """
+
+    attempt_timeout: Optional[float] = None
+    """Maximum number of seconds a single Gemini request may take. None for no limit."""
+
+    def _client_key(self, kind: str) -> tuple:
+        """Identifies the prediction service client this model can share."""
+        api_endpoint = getattr(self.client_options, "api_endpoint", None)
+        return (kind, api_endpoint, self.endpoint_version, self.api_transport, id(self.credentials) if self.credentials else None)
+
+    @property
+    def prediction_client(self) -> Any:
+        """Returns the shared PredictionServiceClient."""
+        if self.client is None:
+            self.client = MODEL_CLIENTS.get_client(
+                self._client_key("sync"), lambda: super(AgentChatVertexAI, self).prediction_client
+            )
+        return self.client
+
+    @property
+    def async_prediction_client(self) -> Any:
+        """Returns the shared PredictionServiceAsyncClient."""
+        if self.async_client is None:
+            self.async_client = MODEL_CLIENTS.get_client(
+                self._client_key("async"), lambda: super(AgentChatVertexAI, self).async_prediction_client
+            )
+        return self.async_client
+
+    def _with_timeout(self, kwargs: Any) -> Any:
+        """Adds the request timeout to the call kwargs of Gemini models."""
+        if self._is_gemini_model:
+            timeout = clamp_timeout(kwargs.get("timeout", self.attempt_timeout))
+            if timeout is not None:
+                kwargs["timeout"] = timeout
+        return kwargs
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any
+    ) -> ChatResult:
+        return super()._generate(messages, stop=stop, run_manager=run_manager, **self._with_timeout(kwargs))
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any
+    ) -> ChatResult:
+        return await super()._agenerate(messages, stop=stop, run_manager=run_manager, **self._with_timeout(kwargs))
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any
+    ) -> Iterator[ChatGenerationChunk]:
+        yield from super()._stream(messages, stop=stop, run_manager=run_manager, **self._with_timeout(kwargs))
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        async for chunk in super()._astream(messages, stop=stop, run_manager=run_manager, **self._with_timeout(kwargs)):
+            yield chunk
@@ -0,0 +1,537 @@
+# Copyright 2025 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# pylint: disable=C0301, W0212, W0718
+"""Module for spreading the calls of a model over its regional endpoints.
+
+Each model gets a pool tracking, per region, an EWMA of the latency (time to
+the first chunk, or to the response) and of the error rate. Calls go to the
+best region. A region failing several times in a row has its circuit opened
+(see app.utils.resilience) and gets no call until it is probed again. A call
+failing before its first chunk is retried in the next region, and a call
+still waiting for its first chunk after the p95 latency of its region can be
+hedged by a second call to the next region, the first to answer wins. Calls
+failed in every region are retried with jittered backoff, while the deadline
+of the run allows.
+
+This module imports langchain_core at import time, so it is itself imported
+lazily, when the first model is created.
+"""
+import asyncio
+import collections
+import itertools
+import json
+import logging
+import random
+import threading
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+
+from app.utils.cancellation import raise_if_cancelled
+from app.utils.deadline import clamp_timeout, get_remaining_time
+from app.utils.metrics import REGISTRY
+from app.utils.resilience import CIRCUIT_REJECTIONS, CircuitBreaker, CircuitOpenError, is_transient_error
+
+MODEL_REGION_REQUESTS = REGISTRY.counter(
+    "model_region_requests_total",
+    "Number of model calls per region, by status (success, error, cancelled).",
+    ["model", "region", "status"]
+)
+MODEL_REGION_LATENCY = REGISTRY.gauge(
+    "model_region_latency_seconds",
+    "EWMA of the latency of each region, to the first chunk or to the response.",
+    ["model", "region"]
+)
+MODEL_REGION_FAILOVERS = REGISTRY.counter(
+    "model_region_failovers_total",
+    "Number of calls retried in another region after an error.",
+    ["model", "from_region", "to_region"]
+)
+MODEL_REGION_HEDGES = REGISTRY.counter(
+    "model_region_hedges_total",
+    "Number of hedged calls, by the call answering first (primary, hedge).",
+    ["model", "winner"]
+)
+
+def parse_model_regions(value: str) -> Dict[str, List[str]]:
+    """Parses the regions of each model, e.g. '{"claude": ["us-east5", "europe-west1"]}'.
+
+    Keys are model names, or parts of them ("claude" matches every Claude model).
+    """
+    if not value:
+        return {}
+    try:
+        regions = json.loads(value)
+    except ValueError:
+        logging.warning("Ignoring invalid MODEL_REGIONS %r.", value)
+        return {}
+    return {
+        model_name: [regions_of_model] if isinstance(regions_of_model, str) else list(regions_of_model)
+        for model_name, regions_of_model in regions.items()
+    }
+
+
+def get_model_regions(model_regions: Dict[str, List[str]], model_name: str, default: List[str]) -> List[str]:
+    """Returns the regions of a model: its own entry, else the longest matching part of its name, else `default`."""
+    if model_name in model_regions:
+        return model_regions[model_name]
+    matches = [key for key in model_regions if key in model_name]
+    if not matches:
+        return default
+    return model_regions[max(matches, key=len)]
+
+
+class RegionStats:
+    """The recent latency and errors of one region of a model."""
+
+    def __init__(self, sample_size: int):
+        self.latency: Optional[float] = None
+        self.error_rate = 0.0
+        self.samples: "collections.deque[float]" = collections.deque(maxlen=sample_size)
+
+
+class RegionalEndpointPool:
+    """
+    Ranks the regions of a model by their recent latency and error rate.
+
+    Regions are scored by their latency EWMA, inflated by their error rate
+    EWMA. A region without latency yet is scored like the best measured one,
+    so the configured order breaks ties. Each region has a circuit breaker:
+    a region failing `failure_threshold` times in a row gets no call for
+    `cooldown` seconds, then a single probe call. A small share of calls
+    (`explore`) starts in the runner-up region, so the latency of a
+    recovered region is measured again.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        regions: List[str],
+        alpha: float = 0.2,
+        cooldown: float = 30.0,
+        failure_threshold: int = 3,
+        explore: float = 0.02,
+        hedge_quantile: float = 0.95,
+        hedge_min_delay: float = 1.0,
+        sample_size: int = 200
+    ):
+        """
+        Initializes the RegionalEndpointPool.
+
+        Args:
+            model_name: The name of the model, for the metrics.
+            regions: The regions serving the model, in order of preference.
+            alpha: The weight of the newest sample in the EWMAs.
+            cooldown: Number of seconds a failing region gets no call.
+            failure_threshold: Number of errors in a row opening the circuit of a region.
+            explore: Share of calls starting in the runner-up region.
+            hedge_quantile: Quantile of the latency of a region after which a call is hedged.
+            hedge_min_delay: Minimum number of seconds before hedging a call.
+            sample_size: Number of latencies kept per region for the quantile.
+        """
+        if not regions:
+            raise ValueError(f"No region configured for {model_name}.")
+        self.model_name = model_name
+        self.regions = list(regions)
+        self.alpha = alpha
+        self.explore = explore
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_delay = hedge_min_delay
+        self.min_hedge_samples = 20
+        self._stats = {region: RegionStats(sample_size) for region in self.regions}
+        self._breakers = {
+            region: CircuitBreaker(f"{model_name}@{region}", failure_threshold, cooldown) for region in self.regions
+        }
+        self._lock = threading.Lock()
+
+    def rank(self) -> List[str]:
+        """Returns the regions, from the one to call first to the last one."""
+        is_open = {region: breaker.state == CircuitBreaker.OPEN for region, breaker in self._breakers.items()}
+        with self._lock:
+            measured = [stats.latency for stats in self._stats.values() if stats.latency is not None]
+            best_latency = min(measured) if measured else 0.0
+
+            def score(region: str) -> Tuple[bool, float]:
+                stats = self._stats[region]
+                latency = stats.latency if stats.latency is not None else best_latency
+                return (is_open[region], latency * (1.0 + 4.0 * stats.error_rate))
+
+            ranked = sorted(self.regions, key=score)
+        if len(ranked) > 1 and not is_open[ranked[1]] and random.random() < self.explore:
+            ranked[0], ranked[1] = ranked[1], ranked[0]
+        return ranked
+
+    def acquire(self, region: str) -> bool:
+        """Whether a call may be made to a region now, i.e. its circuit lets it through."""
+        if self._breakers[region].allow():
+            return True
+        CIRCUIT_REJECTIONS.inc(dependency=self._breakers[region].name)
+        return False
+
+    def retry_after(self) -> float:
+        """Number of seconds until a region lets a call through."""
+        return min(breaker.retry_after() for breaker in self._breakers.values())
+
+    def record_success(self, region: str, latency: float) -> None:
+        """Records a call answered by a region after `latency` seconds."""
+        self._breakers[region].record_success()
+        with self._lock:
+            stats = self._stats[region]
+            stats.latency = latency if stats.latency is None else (1 - self.alpha) * stats.latency + self.alpha * latency
+            stats.error_rate *= 1 - self.alpha
+            stats.samples.append(latency)
+            MODEL_REGION_LATENCY.set(stats.latency, model=self.model_name, region=region)
+        MODEL_REGION_REQUESTS.inc(model=self.model_name, region=region, status="success")
+
+    def record_failure(self, region: str, error: BaseException) -> None:
+        """Records a call failed by a region. Only transient errors count against the region."""
+        self._breakers[region].record(error)
+        if is_transient_error(error):
+            with self._lock:
+                stats = self._stats[region]
+                stats.error_rate = (1 - self.alpha) * stats.error_rate + self.alpha
+        MODEL_REGION_REQUESTS.inc(model=self.model_name, region=region, status="error")
+
+    def record_cancelled(self, region: str) -> None:
+        """Records a call abandoned for another region (the loser of a hedge)."""
+        self._breakers[region].record_abandoned()
+        MODEL_REGION_REQUESTS.inc(model=self.model_name, region=region, status="cancelled")
+
+    def hedge_delay(self, region: str) -> Optional[float]:
+        """Returns the number of seconds after which a call to a region is hedged, None until enough samples."""
+        with self._lock:
+            samples = sorted(self._stats[region].samples)
+        if len(samples) < self.min_hedge_samples:
+            return None
+        return max(samples[min(int(len(samples) * self.hedge_quantile), len(samples) - 1)], self.hedge_min_delay)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Returns the latency, error rate and circuit state of each region."""
+        with self._lock:
+            stats = {
+                region: {"latency": region_stats.latency, "error_rate": region_stats.error_rate}
+                for region, region_stats in self._stats.items()
+            }
+        for region, breaker in self._breakers.items():
+            stats[region]["circuit"] = breaker.state
+        return stats
+
+
+def _close_result(result: Any) -> None:
+    """Closes the stream of a call that was answered but not used."""
+    stream = result[1] if isinstance(result, tuple) and len(result) == 2 else None
+    if stream is not None and hasattr(stream, "aclose"):
+        asyncio.ensure_future(stream.aclose())
+    elif stream is not None and hasattr(stream, "close"):
+        stream.close()
+
+
+class RegionalChatModel(BaseChatModel):
+    """
+    Chat model calling one of several copies of a model, one per region.
+
+    Every call starts in the best region of the pool and fails over to the
+    next region if it raises a transient error before its first chunk. Once
+    a chunk was received, the call stays in its region. With `hedging`, an
+    async call still waiting for its first chunk after the hedge delay of
+    its region is also started in the next region, and the slower call is
+    cancelled. A call failed in every region is retried according to
+    `retry_policy`. Tools are bound like on the regional models.
+
+    Each attempt passes a `timeout` to the regional model, `attempt_timeout`
+    capped by the time left until the deadline of the current run, so sync
+    calls driven by worker threads never outlive the request either.
+    """
+
+    model_name: str
+    """The name of the model."""
+    region_models: Dict[str, Any]
+    """The chat model of each region."""
+    pool: Any
+    """The RegionalEndpointPool ranking the regions."""
+    hedging: bool = False
+    """Whether slow async calls are hedged in a second region."""
+    retry_policy: Any = None
+    """The RetryPolicy of calls failed in every region, None to not retry."""
+    attempt_timeout: Optional[float] = None
+    """Maximum number of seconds a single attempt may take. None for no limit."""
+
+    @property
+    def _llm_type(self) -> str:
+        return "regional-" + next(iter(self.region_models.values()))._llm_type
+
+    def bind_tools(self, tools: Any, **kwargs: Any) -> Any:
+        """Binds tools formatted by the regional models, so every region receives them."""
+        binding = next(iter(self.region_models.values())).bind_tools(tools, **kwargs)
+        return self.bind(**binding.kwargs)
+
+    def _can_fail_over(self, region: str, error: BaseException) -> bool:
+        """Whether the call failed by a region may be made in another one."""
+        remaining = get_remaining_time()
+        if not is_transient_error(error) or (remaining is not None and remaining <= 0):
+            return False
+        logging.warning("%s failed in %s: %s", self.model_name, region, error)
+        return True
+
+    def _attempt_kwargs(self, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        """Returns the call kwargs of an attempt, with its timeout capped by the deadline of the run.
+
+        Exception:
+            DeadlineExceededError: The deadline has already passed.
+        """
+        timeout = clamp_timeout(kwargs.get("timeout", self.attempt_timeout))
+        return kwargs if timeout is None else {**kwargs, "timeout": timeout}
+
+    def _count_failover(self, from_region: Optional[str], to_region: str) -> None:
+        if from_region is not None:
+            MODEL_REGION_FAILOVERS.inc(model=self.model_name, from_region=from_region, to_region=to_region)
+
+    def _call_once(self, start: Callable[[Any], Any]) -> Tuple[str, Any]:
+        """Starts a call in the best region, failing over to the next ones.
+
+        Args:
+            start: Calls a regional model until its first chunk or response.
+
+        Returns:
+            The region answering, and what `start` returned.
+
+        Exception:
+            CircuitOpenError: The circuit of every region is open.
+        """
+        failed_region = None
+        error = None
+        for region in self.pool.rank():
+            if not self.pool.acquire(region):
+                continue
+            self._count_failover(failed_region, region)
+            start_time = time.perf_counter()
+            try:
+                result = start(self.region_models[region])
+            except Exception as e:
+                self.pool.record_failure(region, e)
+                if not self._can_fail_over(region, e):
+                    raise
+                failed_region, error = region, e
+                continue
+            self.pool.record_success(region, time.perf_counter() - start_time)
+            return region, result
+        if error is not None:
+            raise error
+        raise CircuitOpenError(self.model_name, self.pool.retry_after())
+
+    def _call(self, start: Callable[[Any, Dict[str, Any]], Any], kwargs: Dict[str, Any]) -> Tuple[str, Any]:
+        """Calls `_call_once` with the kwargs of each attempt, retrying transient failures with the retry policy."""
+        attempt = 0
+        while True:
+            attempt += 1
+            attempt_kwargs = self._attempt_kwargs(kwargs)
+            try:
+                return self._call_once(lambda model: start(model, attempt_kwargs))
+            except Exception as e:
+                delay = self.retry_policy.next_delay(self.model_name, attempt, e) if self.retry_policy else None
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                raise_if_cancelled()
+
+    async def _acall_once(self, start: Callable[[Any], Awaitable[Any]]) -> Tuple[str, Any]:
+        """Starts a call in the best region, hedging it and failing over to the next ones.
+
+        Args:
+            start: Calls a regional model until its first chunk or response.
+
+        Returns:
+            The region answering, and what `start` returned.
+
+        Exception:
+            CircuitOpenError: The circuit of every region is open.
+        """
+        regions = self.pool.rank()
+        pending: Dict[asyncio.Future, Tuple[str, float]] = {}
+        next_index = 0
+        hedged = False
+
+        def launch() -> Optional[Tuple[str, float]]:
+            """Starts the call in the next region letting it through."""
+            nonlocal next_index
+            while next_index < len(regions):
+                region = regions[next_index]
+                next_index += 1
+                if self.pool.acquire(region):
+                    start_time = time.perf_counter()
+                    pending[asyncio.ensure_future(start(self.region_models[region]))] = (region, start_time)
+                    return region, start_time
+            return None
+
+        launched = launch()
+        if launched is None:
+            raise CircuitOpenError(self.model_name, self.pool.retry_after())
+        primary, primary_start = launched
+        try:
+            while True:
+                timeout = None
+                if self.hedging and not hedged and next_index < len(regions):
+                    delay = self.pool.hedge_delay(primary)
+                    remaining = get_remaining_time()
+                    if delay is not None and (remaining is None or delay < remaining):
+                        timeout = max(delay - (time.perf_counter() - primary_start), 0.0)
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedged = True
+                    launch()
+                    continue
+
+                winner = None
+                for task in done:
+                    region, start_time = pending.pop(task)
+                    error = task.exception()
+                    if error is not None:
+                        self.pool.record_failure(region, error)
+                        if not self._can_fail_over(region, error):
+                            raise error
+                        if pending:
+                            # A hedge of the call is still running
+                            continue
+                        launched = launch()
+                        if launched is None:
+                            raise error
+                        self._count_failover(region, launched[0])
+                        primary, primary_start = launched
+                    elif winner is None:
+                        self.pool.record_success(region, time.perf_counter() - start_time)
+                        winner = (region, task.result())
+                    else:
+                        self.pool.record_cancelled(region)
+                        _close_result(task.result())
+                if winner is not None:
+                    if hedged:
+                        MODEL_REGION_HEDGES.inc(model=self.model_name, winner="primary" if winner[0] == primary else "hedge")
+                    return winner
+        finally:
+            for task, (region, _) in pending.items():
+                task.cancel()
+                self.pool.record_cancelled(region)
+
+    async def _acall(self, start: Callable[[Any, Dict[str, Any]], Awaitable[Any]], kwargs: Dict[str, Any]) -> Tuple[str, Any]:
+        """Calls `_acall_once` with the kwargs of each attempt, retrying transient failures with the retry policy."""
+        attempt = 0
+        while True:
+            attempt += 1
+            attempt_kwargs = self._attempt_kwargs(kwargs)
+            try:
+                return await self._acall_once(lambda model: start(model, attempt_kwargs))
+            except Exception as e:
+                delay = self.retry_policy.next_delay(self.model_name, attempt, e) if self.retry_policy else None
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                raise_if_cancelled()
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any
+    ) -> ChatResult:
+        _, result = self._call(lambda model, call_kwargs: model._generate(messages, stop=stop, **call_kwargs), kwargs)
+        return result
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any
+    ) -> ChatResult:
+        _, result = await self._acall(lambda model, call_kwargs: model._agenerate(messages, stop=stop, **call_kwargs), kwargs)
+        return result
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any
+    ) -> Iterator[ChatGenerationChunk]:
+        def start(model: Any, call_kwargs: Dict[str, Any]) -> Tuple[Optional[ChatGenerationChunk], Iterator[ChatGenerationChunk]]:
+            stream = model._stream(messages, stop=stop, **call_kwargs)
+            try:
+                return next(stream, None), stream
+            except BaseException:
+                stream.close()
+                raise
+
+        _, (first, stream) = self._call(start, kwargs)
+        if first is None:
+            return
+        try:
+            # The regional models are called without callbacks, so a cancelled hedge never reports tokens
+            for chunk in itertools.chain([first], stream):
+                if run_manager:
+                    run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+                yield chunk
+        finally:
+            stream.close()
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        async def start(model: Any, call_kwargs: Dict[str, Any]) -> Tuple[Optional[ChatGenerationChunk], AsyncIterator[ChatGenerationChunk]]:
+            stream = model._astream(messages, stop=stop, **call_kwargs)
+            try:
+                return await stream.__anext__(), stream
+            except StopAsyncIteration:
+                return None, stream
+            except BaseException:
+                await stream.aclose()
+                raise
+
+        _, (first, stream) = await self._acall(start, kwargs)
+        if first is None:
+            return
+        try:
+            chunk = first
+            while True:
+                if run_manager:
+                    await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+                yield chunk
+                try:
+                    chunk = await stream.__anext__()
+                except StopAsyncIteration:
+                    return
+        finally:
+            await stream.aclose()
+
+
+# The pools of the models of the process, shared by their regional models
+_POOLS: Dict[Tuple[str, Tuple[str, ...]], RegionalEndpointPool] = {}
+_POOLS_LOCK = threading.Lock()
+
+
+def get_region_pool(model_name: str, regions: List[str], **options: Any) -> RegionalEndpointPool:
+    """Returns the process-wide pool of a model and its regions, creating it on first use."""
+    key = (model_name, tuple(regions))
+    with _POOLS_LOCK:
+        if key not in _POOLS:
+            _POOLS[key] = RegionalEndpointPool(model_name, regions, **options)
+        return _POOLS[key]
@@ -0,0 +1,195 @@
+# Copyright 2025 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# pylint: disable=C0301, C0415, W0718
+"""Module for the process-wide cache of remote Agent Engine handles.
+
+Resolving a deployed Agent Engine (`ReasoningEngine(resource_id)`) fetches the
+resource and opens new API connections. Handles are resolved once per resource
+and shared by every Agent Manager, so each chat turn reuses the connections of
+the cached handle. A background task re-resolves the cached handles
+periodically, which doubles as their health check.
+"""
+import asyncio
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from app.utils.metrics import REGISTRY
+
+REMOTE_ENGINE_REQUESTS = REGISTRY.counter(
+    "agent_engine_handle_requests_total",
+    "Number of remote Agent Engine handles requested from the cache, by result (hit, miss).",
+    ["result"]
+)
+REMOTE_ENGINE_REFRESHES = REGISTRY.counter(
+    "agent_engine_handle_refreshes_total",
+    "Number of remote Agent Engine handle refreshes, by status (success, error, not_found).",
+    ["status"]
+)
+REMOTE_ENGINE_HEALTHY = REGISTRY.gauge(
+    "agent_engine_handle_healthy",
+    "Whether the last refresh of a remote Agent Engine handle succeeded (1) or not (0).",
+    ["resource_id"]
+)
+
+
+def _create_remote_engine(resource_id: str) -> Any:
+    """Resolves a deployed Agent Engine."""
+    from vertexai.preview import reasoning_engines # TODO: update this when it gets named agent_engines
+
+    from app.orchestration.clients import init_vertexai
+
+    init_vertexai()
+    return reasoning_engines.ReasoningEngine(resource_id)
+
+
+class _CachedEngine:
+    """A resolved handle and its health."""
+
+    def __init__(self, handle: Any):
+        self.handle = handle
+        self.resolved_at = time.monotonic()
+        self.healthy = True
+
+
+class RemoteEngineCache:
+    """
+    Resolves remote Agent Engine handles once and shares them process-wide.
+
+    Concurrent first requests of a resource wait for a single resolution. A
+    refresh resolves the resource again and swaps the handle in. If it fails,
+    the previous handle is kept and marked unhealthy, unless the resource no
+    longer exists, in which case it is dropped.
+    """
+
+    def __init__(self, factory: Callable[[str], Any] = _create_remote_engine):
+        """
+        Initializes the RemoteEngineCache.
+
+        Args:
+            factory: A callable resolving the handle of a resource ID.
+        """
+        self.factory = factory
+        self._engines: Dict[str, _CachedEngine] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def _get_lock(self, resource_id: str) -> threading.Lock:
+        with self._lock:
+            return self._locks.setdefault(resource_id, threading.Lock())
+
+    def get(self, resource_id: str) -> Any:
+        """Returns the handle of a deployed Agent Engine, resolving it on first use.
+
+        Args:
+            resource_id: The Resource ID of the deployed Agent Engine.
+
+        Returns:
+            The shared handle.
+        """
+        engine = self._engines.get(resource_id)
+        if engine is not None:
+            REMOTE_ENGINE_REQUESTS.inc(result="hit")
+            return engine.handle
+
+        with self._get_lock(resource_id):
+            engine = self._engines.get(resource_id)
+            if engine is None:
+                REMOTE_ENGINE_REQUESTS.inc(result="miss")
+                engine = self._engines[resource_id] = _CachedEngine(self.factory(resource_id))
+                REMOTE_ENGINE_HEALTHY.set(1, resource_id=resource_id)
+            else:
+                REMOTE_ENGINE_REQUESTS.inc(result="hit")
+            return engine.handle
+
+    async def aget(self, resource_id: str) -> Any:
+        """Returns the handle, resolving it on a worker thread so the event loop is not blocked."""
+        engine = self._engines.get(resource_id)
+        if engine is not None:
+            REMOTE_ENGINE_REQUESTS.inc(result="hit")
+            return engine.handle
+        return await asyncio.to_thread(self.get, resource_id)
+
+    def refresh(self, resource_id: str) -> bool:
+        """Resolves a cached resource again and swaps the new handle in.
+
+        Args:
+            resource_id: The Resource ID of the deployed Agent Engine.
+
+        Returns:
+            Whether the resource could be resolved.
+        """
+        from google.api_core import exceptions
+
+        try:
+            handle = self.factory(resource_id)
+        except exceptions.NotFound:
+            logging.warning("Agent Engine %s no longer exists, dropping its handle.", resource_id)
+            REMOTE_ENGINE_REFRESHES.inc(status="not_found")
+            self.invalidate(resource_id)
+            return False
+        except Exception as e:
+            logging.warning("Failed to refresh Agent Engine %s, keeping the previous handle: %s", resource_id, e)
+            REMOTE_ENGINE_REFRESHES.inc(status="error")
+            engine = self._engines.get(resource_id)
+            if engine is not None:
+                engine.healthy = False
+            REMOTE_ENGINE_HEALTHY.set(0, resource_id=resource_id)
+            return False
+
+        with self._get_lock(resource_id):
+            self._engines[resource_id] = _CachedEngine(handle)
+        REMOTE_ENGINE_REFRESHES.inc(status="success")
+        REMOTE_ENGINE_HEALTHY.set(1, resource_id=resource_id)
+        return True
+
+    def refresh_all(self, max_age: float = 0) -> Dict[str, bool]:
+        """Refreshes the cached handles resolved more than `max_age` seconds ago.
+
+        Returns:
+            Whether each refreshed resource could be resolved, by resource ID.
+        """
+        now = time.monotonic()
+        resource_ids = [
+            resource_id for resource_id, engine in list(self._engines.items())
+            if now - engine.resolved_at >= max_age
+        ]
+        return {resource_id: self.refresh(resource_id) for resource_id in resource_ids}
+
+    async def run_refresh_loop(self, interval: float) -> None:
+        """Refreshes the cached handles every `interval` seconds, until cancelled."""
+        while True:
+            await asyncio.sleep(interval)
+            await asyncio.to_thread(self.refresh_all, interval)
+
+    def invalidate(self, resource_id: Optional[str] = None) -> None:
+        """Drops a cached handle (or all of them), so it is resolved again on next use."""
+        with self._lock:
+            if resource_id is None:
+                self._engines.clear()
+            else:
+                self._engines.pop(resource_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns the age and health of each cached handle, by resource ID."""
+        now = time.monotonic()
+        return {
+            resource_id: {"age_seconds": now - engine.resolved_at, "healthy": engine.healthy}
+            for resource_id, engine in list(self._engines.items())
+        }
+
+
+# The remote Agent Engine handles shared by the whole process
+REMOTE_ENGINES = RemoteEngineCache()
@@ -0,0 +1,313 @@
+# Copyright 2025 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# pylint: disable=C0301, W0231, W0622, W0718
+"""Module for routing each query to the cheapest model able to answer it.
+
+A cascade agent holds one Agent Manager per model, from the cheapest to the
+largest. A lightweight classifier scores the complexity of each query (its
+length, whether it needs tools or reasoning, the depth of the conversation)
+and picks the starting model. A run that fails, or whose tools fail, before
+any answer was streamed is escalated to the next model.
+"""
+import asyncio
+from dataclasses import dataclass
+import logging
+import re
+import threading
+import time
+from typing import Any, AsyncGenerator, Callable, Dict, List, Optional
+
+from app.orchestration.agent import BaseAgentManager
+from app.utils.cancellation import RunCancelledError
+from app.utils.deadline import DeadlineExceededError
+from app.utils.metrics import REGISTRY
+from app.utils.session_store import get_ai_message_content
+from app.utils.stage_metrics import estimate_tokens, get_run_metrics
+
+ROUTING_DECISIONS = REGISTRY.counter(
+    "model_routing_decisions_total",
+    "Number of queries routed to each model of a cascade, by reason (complexity, low_confidence).",
+    ["model", "reason"]
+)
+ROUTING_ESCALATIONS = REGISTRY.counter(
+    "model_routing_escalations_total",
+    "Number of runs escalated to a larger model, by reason (error, tool_error).",
+    ["from_model", "to_model", "reason"]
+)
+ROUTING_SECONDS = REGISTRY.histogram(
+    "model_routing_seconds",
+    "Time taken to classify a query and pick its model.",
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025)
+)
+
+# Wording hinting that the answer needs fresh or private data, i.e. tools
+_TOOL_CUES = re.compile(
+    r"\b(latest|current|today|recent|news|search|look up|find|price|stock|revenue|sales|earnings|"
+    r"data|dataset|report|trend|statistics|records?|patients?|customers?|transactions?|20\d\d|q[1-4])\b",
+    re.IGNORECASE
+)
+# Wording hinting at multi-step reasoning
+_REASONING_CUES = re.compile(
+    r"\b(why|compare|comparison|versus|vs\.?|analy[sz]e|analysis|evaluate|explain|impact|forecast|"
+    r"predict|recommend|strategy|pros and cons|trade-?offs?|step by step|calculate|estimate|plan)\b",
+    re.IGNORECASE
+)
+
+
+@dataclass
+class RoutingDecision:
+    """The model picked for a query.
+
+    Attributes:
+        tier: The index of the model in the cascade.
+        complexity: The complexity score of the query, between 0 and 1.
+        confidence: How far the score is from the next tier, between 0 and 1.
+        reason: Why the tier was picked (complexity, low_confidence).
+    """
+
+    tier: int
+    complexity: float
+    confidence: float
+    reason: str
+
+
+class ComplexityClassifier:
+    """
+    Scores the complexity of a query from cheap signals.
+
+    The score (between 0 and 1) adds up the length of the question, whether
+    it needs tools or reasoning, and the depth of the conversation. The
+    cascade is split in equal score ranges, one per model. A score close to
+    the upper end of its range gives a low confidence, and the query starts
+    one model up.
+    """
+
+    def __init__(self, min_confidence: float = 0.3):
+        """
+        Initializes the ComplexityClassifier.
+
+        Args:
+            min_confidence: Below this confidence, the query starts one model up.
+        """
+        self.min_confidence = min_confidence
+
+    def score(self, messages: List[Dict[str, Any]], has_tools: bool) -> float:
+        """Returns the complexity of the last question of a conversation, between 0 and 1."""
+        question = messages[-1].get("content") if messages else ""
+        question = question if isinstance(question, str) else str(question)
+        turns = sum(1 for message in messages if message.get("type") == "human")
+
+        score = 0.35 * min(estimate_tokens(question) / 400, 1.0)
+        score += 0.15 * min((turns - 1) / 10, 1.0)
+        if has_tools and _TOOL_CUES.search(question):
+            score += 0.25
+        if _REASONING_CUES.search(question) or question.count("?") > 1:
+            score += 0.25
+        return min(score, 1.0)
+
+    def route(self, messages: List[Dict[str, Any]], tier_count: int, has_tools: bool) -> RoutingDecision:
+        """Picks the model a query starts with.
+
+        Args:
+            messages: The messages of the conversation, ending with the new one.
+            tier_count: The number of models of the cascade.
+            has_tools: Whether the agent has tools.
+
+        Returns:
+            The routing decision.
+        """
+        complexity = self.score(messages, has_tools)
+        position = complexity * tier_count
+        tier = min(int(position), tier_count - 1)
+        confidence = 1.0 if tier == tier_count - 1 else 1.0 - (position - tier)
+        if confidence < self.min_confidence and tier < tier_count - 1:
+            return RoutingDecision(tier + 1, complexity, confidence, "low_confidence")
+        return RoutingDecision(tier, complexity, confidence, "complexity")
+
+
+class _Escalation(Exception):
+    """Raised to abandon a run on a model and retry on the next one."""
+
+
+def _is_stopped(error: BaseException) -> bool:
+    """Whether a run failed because it was cancelled or ran out of time, which a larger model would not fix."""
+    while error is not None:
+        if isinstance(error, (DeadlineExceededError, RunCancelledError)):
+            return True
+        error = error.__cause__
+    return False
+
+
+class ModelCascadeAgentManager(BaseAgentManager):
+    """
+    Agent Manager routing each query to one of several Agent Managers that
+    only differ by their model, ordered from the cheapest to the largest.
+
+    The managers of the larger models are built on first use. A run is
+    escalated to the next model if it raises, or if one of its tools fails,
+    before the first answer chunk. Once answer text was streamed, the run
+    stays on its model.
+    """
+
+    def __init__(
+        self,
+        model_names: List[str],
+        tier_factory: Callable[[str], BaseAgentManager],
+        classifier: Optional[ComplexityClassifier] = None
+    ):
+        """
+        Initializes the ModelCascadeAgentManager. Unlike other managers, it
+        builds no model nor executor itself, its tiers do.
+
+        Args:
+            model_names: The models of the cascade, from the cheapest to the largest.
+            tier_factory: Builds the Agent Manager of a model.
+            classifier: Picks the starting model of each query.
+        """
+        if not model_names:
+            raise ValueError("A model cascade needs at least one model.")
+        self.model_names = model_names
+        self.tier_factory = tier_factory
+        self.classifier = classifier or ComplexityClassifier()
+        self._tiers: Dict[int, BaseAgentManager] = {}
+        self._tier_lock = threading.Lock()
+
+        # The cascade answers like its tiers, so it shares their settings
+        first = self.get_tier(0)
+        self.schema_namespace = first.schema_namespace
+        # The history is compacted by each tier, to the budget of its own model
+        self.compact_history = False
+        self.prompt = first.prompt
+        self.industry_type = first.industry_type
+        self.location = first.location
+        self.orchestration_framework = first.orchestration_framework
+        self.agent_engine_resource_id = first.agent_engine_resource_id
+        self.model_name = "cascade:" + ",".join(model_names)
+        self.max_retries = first.max_retries
+        self.max_output_tokens = first.max_output_tokens
+        self.temperature = first.temperature
+        self.top_p = first.top_p
+        self.top_k = first.top_k
+        self.return_steps = first.return_steps
+        self.verbose = first.verbose
+        self.model_obj = None
+        self.tools = first.tools
+        self.agent_executor = None
+
+
+    def create_agent_executor(self):
+        """The tiers have their own executors."""
+        return None
+
+
+    def get_tier(self, tier: int) -> BaseAgentManager:
+        """Returns the Agent Manager of a model of the cascade, building it on first use."""
+        with self._tier_lock:
+            if tier not in self._tiers:
+                self._tiers[tier] = self.tier_factory(self.model_names[tier])
+            return self._tiers[tier]
+
+
+    async def aget_tier(self, tier: int) -> BaseAgentManager:
+        """Returns the Agent Manager of a model, building it on a worker thread if needed."""
+        if tier in self._tiers:
+            return self._tiers[tier]
+        return await asyncio.to_thread(self.get_tier, tier)
+
+
+    async def astream(
+        self,
+        input: Dict[str, Any],
+    ) -> AsyncGenerator[Dict, Any]:
+        """Asynchronously event streams the output of the model the query is routed to.
+
+        Args:
+            input: The list of messages to send to the model as input.
+
+        Yields:
+            Dictionaries representing the streamed agent output.
+        """
+        start_time = time.perf_counter()
+        decision = self.classifier.route(input["messages"], len(self.model_names), bool(self.tools))
+        routing_seconds = time.perf_counter() - start_time
+        ROUTING_SECONDS.observe(routing_seconds)
+        ROUTING_DECISIONS.inc(model=self.model_names[decision.tier], reason=decision.reason)
+        logging.info(
+            "Routed run %s to %s (complexity %.2f, confidence %.2f, %s) in %.3f ms.",
+            input.get("run_id"), self.model_names[decision.tier], decision.complexity,
+            decision.confidence, decision.reason, routing_seconds * 1000
+        )
+
+        run = get_run_metrics()
+        tier = decision.tier
+        while True:
+            tier_manager = await self.aget_tier(tier)
+            if run is not None:
+                # Label the run with the model actually answering it
+                run.labels["model"] = tier_manager.model_name
+            tool_errors = run.tool_errors if run is not None else 0
+            can_escalate = tier < len(self.model_names) - 1
+            answered = False
+            tier_input = tier_manager.compact_input(input) if tier_manager.compact_history else input
+            stream = tier_manager.astream(tier_input)
+            try:
+                # Hold back tool events until the first answer chunk, in case the run is escalated
+                pending = []
+                async for chunk in stream:
+                    if answered:
+                        yield chunk
+                        continue
+                    if can_escalate and run is not None and run.tool_errors > tool_errors:
+                        raise _Escalation("tool_error")
+                    pending.append(chunk)
+                    if get_ai_message_content(chunk):
+                        answered = True
+                        for pending_chunk in pending:
+                            yield pending_chunk
+                if not answered:
+                    if can_escalate and run is not None and run.tool_errors > tool_errors:
+                        raise _Escalation("tool_error")
+                    for pending_chunk in pending:
+                        yield pending_chunk
+                logging.info(
+                    "Run %s answered by %s in %.2f s.",
+                    input.get("run_id"), tier_manager.model_name, time.perf_counter() - start_time
+                )
+                return
+            except Exception as e:
+                if answered or not can_escalate or _is_stopped(e):
+                    raise
+                reason = e.args[0] if isinstance(e, _Escalation) else "error"
+                if reason == "error":
+                    logging.warning("Run %s failed on %s, escalating: %s", input.get("run_id"), tier_manager.model_name, e)
+            finally:
+                await stream.aclose()
+
+            if run is not None:
+                # The run of the smaller model is discarded, so the larger model's answer can be cached
+                run.tool_errors = tool_errors
+            ROUTING_ESCALATIONS.inc(
+                from_model=self.model_names[tier], to_model=self.model_names[tier + 1], reason=reason
+            )
+            logging.info(
+                "Escalated run %s from %s to %s (%s) after %.2f s.",
+                input.get("run_id"), self.model_names[tier], self.model_names[tier + 1],
+                reason, time.perf_counter() - start_time
+            )
+            tier += 1
+
+
+def parse_model_cascade(value: str) -> List[str]:
+    """Parses a comma separated model cascade, e.g. "gemini-2.5-flash-lite,gemini-2.5-flash,gemini-2.5-pro"."""
+    return [model_name.strip() for model_name in value.split(",") if model_name.strip()]
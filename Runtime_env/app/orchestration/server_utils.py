@@ -11,11 +11,13 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
-# pylint: disable=C0301
+# pylint: disable=C0301, C0415
 """Module that contains various utility functions."""
-from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+import importlib
+from typing import TYPE_CHECKING, Dict, Type
 
 from app.orchestration.agent import (
+    BaseAgentManager,
     LangChainPrebuiltAgentManager,
     LangGraphPrebuiltAgentManager,
     LangChainVertexAIAgentEngineAgentManager,
@@ -23,6 +25,7 @@ from app.orchestration.agent import (
     LlamaIndexAgentManager,
     GoogleAdkAgentManager
 )
+from app.orchestration.config import ROUTING_MIN_CONFIDENCE
 from app.orchestration.constants import (
     FINANCE_AGENT_DESCRIPTION,
     HEALTHCARE_AGENT_DESCRIPTION,
@@ -33,12 +36,58 @@ from app.orchestration.enums import (
     IndustryType,
     OrchestrationFramework
 )
+from app.orchestration.routing import ComplexityClassifier, ModelCascadeAgentManager, parse_model_cascade
+
+if TYPE_CHECKING:
+    from langchain_core.prompts import ChatPromptTemplate
+
+# Maps each orchestration framework to its Agent Manager. The framework
+# dependencies are only imported once a manager of the selected type is built.
+AGENT_MANAGER_REGISTRY: Dict[str, Type[BaseAgentManager]] = {
+    OrchestrationFramework.LANGCHAIN_PREBUILT_AGENT.value: LangChainPrebuiltAgentManager,
+    OrchestrationFramework.LANGCHAIN_VERTEX_AI_AGENT_ENGINE_AGENT.value: LangChainVertexAIAgentEngineAgentManager,
+    OrchestrationFramework.LANGGRAPH_PREBUILT_AGENT.value: LangGraphPrebuiltAgentManager,
+    OrchestrationFramework.LANGGRAPH_VERTEX_AI_AGENT_ENGINE_AGENT.value: LangGraphVertexAIAgentEngineAgentManager,
+    OrchestrationFramework.LLAMAINDEX_AGENT.value: LlamaIndexAgentManager,
+    OrchestrationFramework.AGENT_DEVELOPMENT_KIT_AGENT.value: GoogleAdkAgentManager,
+}
+
+# default agent orchestration is LangGraphPrebuiltAgentManager
+DEFAULT_AGENT_MANAGER = LangGraphPrebuiltAgentManager
+
+
+def register_agent_manager(
+        agent_orchestration_framework: str,
+        agent_manager_class: Type[BaseAgentManager]
+) -> None:
+    """Registers the Agent Manager used for an orchestration framework.
+
+    Args:
+        agent_orchestration_framework: The value of AGENT_ORCHESTRATION_FRAMEWORK selecting the manager.
+        agent_manager_class: The BaseAgentManager subclass to build for that framework.
+    """
+    AGENT_MANAGER_REGISTRY[agent_orchestration_framework] = agent_manager_class
+
+
+def get_agent_manager_class(agent_orchestration_framework: str) -> Type[BaseAgentManager]:
+    """Returns the Agent Manager class registered for an orchestration framework."""
+    return AGENT_MANAGER_REGISTRY.get(agent_orchestration_framework, DEFAULT_AGENT_MANAGER)
+
+
+def import_framework_dependencies(agent_orchestration_framework: str) -> None:
+    """Imports the dependencies of an orchestration framework ahead of the first request.
+
+    Args:
+        agent_orchestration_framework: The selected orchestration framework.
+    """
+    for module_name in get_agent_manager_class(agent_orchestration_framework).dependency_modules:
+        importlib.import_module(module_name)
 
 
 def get_init_prompt(
         agent_orchestration_framework: str,
         industry_type: str
-) -> ChatPromptTemplate:
+) -> "ChatPromptTemplate":
     """Creates the initialization prompt for the agent based on the industry."""
 
     if industry_type == IndustryType.FINANCE_INDUSTRY.value:
@@ -86,6 +135,8 @@ def get_init_prompt(
     #     {agent_scratchpad}""")
 
     if agent_orchestration_framework == OrchestrationFramework.LANGCHAIN_PREBUILT_AGENT.value:
+        from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+
         return ChatPromptTemplate.from_messages(
             [
                 ("system", sys_desc),
@@ -170,6 +221,8 @@ def get_init_prompt(
         """
 
     else:
+        from langchain_core.prompts import ChatPromptTemplate
+
         return ChatPromptTemplate.from_messages([
             ("system", sys_desc),
             ("placeholder", "{messages}")
@@ -180,62 +233,34 @@ def get_agent_from_config(
         agent_foundation_model: str,
         industry_type: str,
         agent_engine_resource_id: str = None,
+        model_cascade: str = "",
     ):
-    """Returns the associated Agent Manager based on the defined selection"""
+    """Returns the associated Agent Manager based on the defined selection.
+
+    With a `model_cascade` of several models (comma separated, cheapest
+    first), each query is routed to one of them instead of always using
+    `agent_foundation_model`.
+    """
 
     # Set up the agent backed on environment variables for user config
     init_prompt = get_init_prompt(agent_orchestration_framework, industry_type)
 
     # Set up agent type based on user config selection
-    if agent_orchestration_framework == OrchestrationFramework.LANGCHAIN_PREBUILT_AGENT.value:
-        agent_manager = LangChainPrebuiltAgentManager(
-            prompt=init_prompt,
-            industry_type=industry_type,
-            model_name=agent_foundation_model,
-            agent_engine_resource_id=agent_engine_resource_id
-        )
-    elif agent_orchestration_framework == OrchestrationFramework.LANGCHAIN_VERTEX_AI_AGENT_ENGINE_AGENT.value:
-        agent_manager = LangChainVertexAIAgentEngineAgentManager(
-            prompt=init_prompt,
-            industry_type=industry_type,
-            model_name=agent_foundation_model,
-            agent_engine_resource_id=agent_engine_resource_id
-        )
-    elif agent_orchestration_framework == OrchestrationFramework.LANGGRAPH_PREBUILT_AGENT.value:
-        agent_manager = LangGraphPrebuiltAgentManager(
-            prompt=init_prompt,
-            industry_type=industry_type,
-            model_name=agent_foundation_model,
-            agent_engine_resource_id=agent_engine_resource_id
-        )
-    elif agent_orchestration_framework == OrchestrationFramework.LANGGRAPH_VERTEX_AI_AGENT_ENGINE_AGENT.value:
-        agent_manager = LangGraphVertexAIAgentEngineAgentManager(
-            prompt=init_prompt,
-            industry_type=industry_type,
-            model_name=agent_foundation_model,
-            agent_engine_resource_id=agent_engine_resource_id
-        )
-    elif agent_orchestration_framework == OrchestrationFramework.LLAMAINDEX_AGENT.value:
-        agent_manager = LlamaIndexAgentManager(
-            prompt=init_prompt,
-            industry_type=industry_type,
-            model_name=agent_foundation_model,
-            agent_engine_resource_id=agent_engine_resource_id
-        )
-    elif agent_orchestration_framework == OrchestrationFramework.AGENT_DEVELOPMENT_KIT_AGENT.value:
-        agent_manager = GoogleAdkAgentManager(
-            prompt=init_prompt,
-            industry_type=industry_type,
-            model_name=agent_foundation_model,
-            agent_engine_resource_id=agent_engine_resource_id
-        )
-    else:
-        # default agent orchestration is LangGraphPrebuiltAgentManager
-        agent_manager = LangGraphPrebuiltAgentManager(
+    agent_manager_class = get_agent_manager_class(agent_orchestration_framework)
+
+    def create_agent_manager(model_name: str) -> BaseAgentManager:
+        return agent_manager_class(
             prompt=init_prompt,
             industry_type=industry_type,
-            model_name=agent_foundation_model,
+            model_name=model_name,
             agent_engine_resource_id=agent_engine_resource_id
         )
 
-    return agent_manager
+    model_names = parse_model_cascade(model_cascade or "")
+    if len(model_names) > 1:
+        return ModelCascadeAgentManager(
+            model_names,
+            create_agent_manager,
+            ComplexityClassifier(min_confidence=ROUTING_MIN_CONFIDENCE)
+        )
+    return create_agent_manager(agent_foundation_model)
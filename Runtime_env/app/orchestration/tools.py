@@ -11,59 +11,93 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
-# pylint: disable=C0301, R1714
-"""Module that contains various tool definitions."""
-from typing import List
-
-from google.adk.tools import VertexAiSearchTool
-
-from langchain_core.documents import Document
-from langchain_core.tools import StructuredTool
-from langchain_community.tools.pubmed.tool import PubmedQueryRun
-from langchain_community.tools.yahoo_finance_news import YahooFinanceNewsTool
-from langchain_community.tools.google_scholar import GoogleScholarQueryRun
-from langchain_community.tools.google_trends import GoogleTrendsQueryRun
-from langchain_community.tools.google_finance import GoogleFinanceQueryRun
-from langchain_community.utilities.google_scholar import GoogleScholarAPIWrapper
-from langchain_community.utilities import GoogleSerperAPIWrapper
-from langchain_community.utilities.google_trends import GoogleTrendsAPIWrapper
-from langchain_community.utilities.google_finance import GoogleFinanceAPIWrapper
-import vertexai
-
-# LlamaIndex
-from llama_index.core.tools import FunctionTool
-from llama_index.core.query_engine import RetrieverQueryEngine
-from llama_index.retrievers.vertexai_search import VertexAISearchRetriever
-
+# pylint: disable=C0301, R1714, C0415, W0212
+"""Module that contains various tool definitions.
+
+The tool wrappers and retrievers are imported and built on first use, so only
+the tools of the selected orchestration framework are ever loaded.
+"""
+import asyncio
+import contextlib
+import contextvars
+import functools
+from typing import Any, Callable, Iterator, Optional
+
+from app.orchestration.clients import CLIENTS, get_project_id
 from app.orchestration.config import (
-    PROJECT_ID,
     AGENT_BUILDER_LOCATION,
+    CIRCUIT_FAILURE_THRESHOLD,
+    CIRCUIT_RESET_SECONDS,
     DATA_STORE_ID,
-    SERP_API_KEY
+    RETRY_BASE_DELAY_SECONDS,
+    RETRY_MAX_ATTEMPTS,
+    RETRY_MAX_DELAY_SECONDS,
+    SERP_API_KEY,
+    TOOL_MIN_REMAINING_SECONDS,
+    TOOL_TIMEOUT_SECONDS,
+    TOOL_WORKER_POOL_SIZE,
+    RERANK_MIN_REMAINING_SECONDS
 )
 from app.orchestration.enums import (
     IndustryType,
     OrchestrationFramework
 )
-from app.rag.templates import format_docs
-from app.rag.retriever import get_compressor, get_retriever
+from app.utils.cancellation import cancellable_tool, raise_if_cancelled
+from app.utils.deadline import DEADLINE_DEGRADATIONS, clamp_timeout, configure_tool_pool, deadline_tool, has_time_left
+from app.utils.resilience import CircuitBreakerRegistry, RetryPolicy, resilient_tool
+from app.utils.response_cache import mark_uncacheable, volatile_tool
+from app.utils.stage_metrics import stage_timer, timed_tool
+
+# The circuit breakers of the tool backends, and how their failed calls are retried
+TOOL_CIRCUITS = CircuitBreakerRegistry(failure_threshold=CIRCUIT_FAILURE_THRESHOLD, reset_timeout=CIRCUIT_RESET_SECONDS)
+TOOL_RETRY_POLICY = RetryPolicy(
+    max_attempts=RETRY_MAX_ATTEMPTS,
+    base_delay=RETRY_BASE_DELAY_SECONDS,
+    max_delay=RETRY_MAX_DELAY_SECONDS,
+    min_remaining=TOOL_MIN_REMAINING_SECONDS
+)
+configure_tool_pool(TOOL_WORKER_POOL_SIZE)
 
 
-# Initialize Vertex AI
-vertexai.init(project=PROJECT_ID)
+### langchain/langgraph tools: ###
 
+def _create_lang_retriever():
+    """Creates the Vertex AI Search retriever."""
+    from app.rag.retriever import get_retriever
 
-### langchain/langgraph tools: ###
+    return get_retriever(
+        project_id=get_project_id(),
+        data_store_id=DATA_STORE_ID,
+        agent_builder_location=AGENT_BUILDER_LOCATION,
+    )
 
-lang_retriever = get_retriever(
-    project_id=PROJECT_ID,
-    data_store_id=DATA_STORE_ID,
-    agent_builder_location=AGENT_BUILDER_LOCATION,
-)
-compressor = get_compressor(project_id=PROJECT_ID)
+
+def _create_lang_compressor():
+    """Creates the Vertex AI Rank compressor."""
+    from app.rag.retriever import get_compressor
+
+    return get_compressor(project_id=get_project_id())
 
 
-def retrieve_info(query: str) -> tuple[str, List[Document]]:
+CLIENTS.register("lang_retriever", _create_lang_retriever, warm_up=False)
+CLIENTS.register("lang_compressor", _create_lang_compressor, warm_up=False)
+
+
+def get_lang_retriever():
+    """Returns the shared Vertex AI Search retriever, created on first use."""
+    return CLIENTS.get("lang_retriever")
+
+
+def get_lang_compressor():
+    """Returns the shared Vertex AI Rank compressor, created on first use."""
+    return CLIENTS.get("lang_compressor")
+
+
+@cancellable_tool
+@timed_tool
+@deadline_tool(min_seconds=TOOL_MIN_REMAINING_SECONDS, fallback=lambda notice: (notice, []))
+@resilient_tool(breaker=TOOL_CIRCUITS.get("vertex_ai_search"), policy=TOOL_RETRY_POLICY, fallback=lambda notice: (notice, []))
+def retrieve_info(query: str) -> tuple[str, list]:
     """
     Use this when you need additional information to answer a question.
     Useful for retrieving relevant information based on a query.
@@ -99,50 +133,138 @@ def retrieve_info(query: str) -> tuple[str, List[Document]]:
     Returns:
         List[Document]: A list of the top-ranked Document objects, limited to TOP_K (5) results.
     """
+    from app.rag.templates import format_docs
+
     # Use the retriever to fetch relevant documents based on the query
-    retrieved_docs = lang_retriever.invoke(query)
-    # Re-rank docs with Vertex AI Rank for better relevance
-    ranked_docs = compressor.compress_documents(documents=retrieved_docs, query=query)
+    with stage_timer("retrieval"):
+        retrieved_docs = get_lang_retriever().invoke(query)
+    # Skip the re-ranking if nobody is waiting for the answer anymore
+    raise_if_cancelled()
+    if has_time_left(RERANK_MIN_REMAINING_SECONDS):
+        # Re-rank docs with Vertex AI Rank for better relevance
+        with stage_timer("rerank"):
+            ranked_docs = get_lang_compressor().compress_documents(documents=retrieved_docs, query=query)
+    else:
+        # Not enough time left to re-rank, keep the search order
+        DEADLINE_DEGRADATIONS.inc(step="rerank_skipped")
+        mark_uncacheable()
+        ranked_docs = retrieved_docs[:5]
     # Format ranked documents into a consistent structure for LLM consumption
     formatted_docs = format_docs.format(docs=ranked_docs)
     return (formatted_docs, ranked_docs)
 
 
+def get_search_timeout() -> Optional[float]:
+    """Returns the timeout of a search API request, capped by the deadline of the run."""
+    return clamp_timeout(TOOL_TIMEOUT_SECONDS)
+
+
+def with_search_timeout(engine: Callable[[dict], Any]) -> Callable[[dict], Any]:
+    """Wraps the SerpAPI client class of a wrapper, so each of its searches times out with the run."""
+
+    def create(params: dict) -> Any:
+        client = engine(params)
+        # SerpApiClient passes its timeout (60000 seconds by default) to requests
+        client.timeout = get_search_timeout()
+        return client
+
+    return create
+
+
+@cancellable_tool
+@volatile_tool
+@timed_tool
+@deadline_tool(min_seconds=TOOL_MIN_REMAINING_SECONDS)
+@resilient_tool(breaker=TOOL_CIRCUITS.get("serper"), policy=TOOL_RETRY_POLICY)
 def google_search_tool(query: str) -> str:
     """Uses Google Search to gather information from the internet."""
-    search = GoogleSerperAPIWrapper()
-    return search.run(query)
-
+    import requests
+    from langchain_community.utilities import GoogleSerperAPIWrapper
 
+    search = GoogleSerperAPIWrapper()
+    # The wrapper sends its request without a timeout, so the request is sent here
+    response = requests.post(
+        f"https://google.serper.dev/{search.type}",
+        headers={"X-API-KEY": search.serper_api_key or "", "Content-Type": "application/json"},
+        params={"q": query, "gl": search.gl, "hl": search.hl, "num": search.k},
+        timeout=get_search_timeout()
+    )
+    response.raise_for_status()
+    return search._parse_results(response.json())
+
+
+@cancellable_tool
+@volatile_tool
+@timed_tool
+@deadline_tool(min_seconds=TOOL_MIN_REMAINING_SECONDS)
+@resilient_tool(breaker=TOOL_CIRCUITS.get("serpapi"), policy=TOOL_RETRY_POLICY)
 def google_scholar_tool(query: str) -> str:
     """Uses Google Scholar to answer complex technical questions."""
-    google_scholar = GoogleScholarQueryRun(api_wrapper=GoogleScholarAPIWrapper())
+    from langchain_community.tools.google_scholar import GoogleScholarQueryRun
+    from langchain_community.utilities.google_scholar import GoogleScholarAPIWrapper
+
+    api_wrapper = GoogleScholarAPIWrapper()
+    api_wrapper.google_scholar_engine = with_search_timeout(api_wrapper.google_scholar_engine)
+    google_scholar = GoogleScholarQueryRun(api_wrapper=api_wrapper)
     return google_scholar.invoke(query)
 
 
+@cancellable_tool
+@volatile_tool
+@timed_tool
+@deadline_tool(min_seconds=TOOL_MIN_REMAINING_SECONDS)
+@resilient_tool(breaker=TOOL_CIRCUITS.get("serpapi"), policy=TOOL_RETRY_POLICY)
 def google_trends_tool(query: str) -> str:
     """Uses Google Trends to get information on trending search results and news."""
-    google_trends = GoogleTrendsQueryRun(api_wrapper=GoogleTrendsAPIWrapper())
+    from langchain_community.tools.google_trends import GoogleTrendsQueryRun
+    from langchain_community.utilities.google_trends import GoogleTrendsAPIWrapper
+
+    api_wrapper = GoogleTrendsAPIWrapper()
+    api_wrapper.serp_search_engine = with_search_timeout(api_wrapper.serp_search_engine)
+    google_trends = GoogleTrendsQueryRun(api_wrapper=api_wrapper)
     return google_trends.invoke(query)
 
 
+@cancellable_tool
+@volatile_tool
+@timed_tool
+@deadline_tool(min_seconds=TOOL_MIN_REMAINING_SECONDS)
+@resilient_tool(breaker=TOOL_CIRCUITS.get("serpapi"), policy=TOOL_RETRY_POLICY)
 def google_finance_tool(query: str) -> str:
     """Uses Google Finance to get information from the Google Finance page."""
-    google_finance = GoogleFinanceQueryRun(api_wrapper=GoogleFinanceAPIWrapper())
+    from langchain_community.tools.google_finance import GoogleFinanceQueryRun
+    from langchain_community.utilities.google_finance import GoogleFinanceAPIWrapper
+
+    api_wrapper = GoogleFinanceAPIWrapper()
+    api_wrapper.serp_search_engine = with_search_timeout(api_wrapper.serp_search_engine)
+    google_finance = GoogleFinanceQueryRun(api_wrapper=api_wrapper)
     return google_finance.invoke(query)
 
 
+@cancellable_tool
+@volatile_tool
+@timed_tool
+@deadline_tool(min_seconds=TOOL_MIN_REMAINING_SECONDS)
+@resilient_tool(breaker=TOOL_CIRCUITS.get("yahoo_finance"), policy=TOOL_RETRY_POLICY)
 def yahoo_finance_tool(query: str) -> str:
     """Uses Yahoo Finance to get real-time new and information on financial markets."""
+    from langchain_community.tools.yahoo_finance_news import YahooFinanceNewsTool
+
     yahoo_finance = YahooFinanceNewsTool()
     return yahoo_finance.invoke(query)
 
 
+@cancellable_tool
+@timed_tool
+@deadline_tool(min_seconds=TOOL_MIN_REMAINING_SECONDS)
+@resilient_tool(breaker=TOOL_CIRCUITS.get("pubmed"), policy=TOOL_RETRY_POLICY)
 def medical_publications_tool(query: str) -> str:
     """Use this tool if the user asks very complicated medical questions
         that can only be answered by searching through medical publications
         and journals.
     """
+    from langchain_community.tools.pubmed.tool import PubmedQueryRun
+
     pubmed = PubmedQueryRun()
     return pubmed.invoke(query)
 
@@ -190,12 +312,16 @@ def get_tools(
     # If using langchain or langgraph, then the tools must be defined as structured tools
     if (orchestration_framework == OrchestrationFramework.LANGCHAIN_PREBUILT_AGENT.value or
         orchestration_framework == OrchestrationFramework.LANGGRAPH_PREBUILT_AGENT.value):
+        from langchain_core.tools import StructuredTool
+
         tools_list = [StructuredTool.from_function(tool) for tool in tools_list]
 
     elif orchestration_framework == OrchestrationFramework.AGENT_DEVELOPMENT_KIT_AGENT.value:
         if DATA_STORE_ID != "unset":
+            from google.adk.tools import VertexAiSearchTool
+
             vais_tool = VertexAiSearchTool(
-                data_store_id=f"projects/{PROJECT_ID}/locations/{AGENT_BUILDER_LOCATION}/collections/default_collection/dataStores/{DATA_STORE_ID}"
+                data_store_id=f"projects/{get_project_id()}/locations/{AGENT_BUILDER_LOCATION}/collections/default_collection/dataStores/{DATA_STORE_ID}"
             )
             vais_tool.name = "Vertex AI Search"
             vais_tool.description = (
@@ -209,15 +335,78 @@ def get_tools(
 
     return tools_list
 
+
+def get_tool_name(tool: Any) -> str:
+    """Returns the name of a tool of any orchestration framework (or a plain function)."""
+    name = getattr(tool, "name", None) or getattr(getattr(tool, "metadata", None), "name", None)
+    return name or getattr(tool, "__name__", type(tool).__name__)
+
 ### llamaindex tools: ###
 
-llama_retriever = VertexAISearchRetriever(
-    project_id=PROJECT_ID,
-    data_store_id=DATA_STORE_ID,
-    location_id=AGENT_BUILDER_LOCATION,
-    engine_data_type=0,
-)
+def _create_llama_retriever():
+    """Creates the LlamaIndex Vertex AI Search retriever."""
+    from app.rag.retriever import get_llamaindex_retriever
+
+    return get_llamaindex_retriever(
+        project_id=get_project_id(),
+        data_store_id=DATA_STORE_ID,
+        agent_builder_location=AGENT_BUILDER_LOCATION,
+    )
+
+
+CLIENTS.register("llama_retriever", _create_llama_retriever, warm_up=False)
+
+# The LLM and retriever of the LlamaIndex run in progress. Context variables are
+# copied into the worker threads running the tools, so concurrent runs with
+# different models never see each other's settings (unlike the global
+# `llama_index.core.Settings`).
+_llamaindex_llm: contextvars.ContextVar[Optional[Any]] = contextvars.ContextVar("llamaindex_llm", default=None)
+_llamaindex_retriever: contextvars.ContextVar[Optional[Any]] = contextvars.ContextVar("llamaindex_retriever", default=None)
+
+
+@contextlib.contextmanager
+def llamaindex_scope(llm: Any, retriever: Optional[Any] = None) -> Iterator[None]:
+    """Sets the LLM (and optionally the retriever) used by the LlamaIndex tools for the duration of the block.
+
+    Args:
+        llm: The LlamaIndex LLM answering the queries of the tools.
+        retriever: The retriever of the tools. Defaults to the shared Vertex AI Search retriever.
+    """
+    llm_token = _llamaindex_llm.set(llm)
+    retriever_token = _llamaindex_retriever.set(retriever)
+    try:
+        yield
+    finally:
+        try:
+            _llamaindex_retriever.reset(retriever_token)
+            _llamaindex_llm.reset(llm_token)
+        except ValueError:
+            # Exited from another context, e.g. a generator closed by a different task
+            _llamaindex_retriever.set(None)
+            _llamaindex_llm.set(None)
+
+
+def get_llamaindex_llm() -> Any:
+    """Returns the LLM of the current LlamaIndex run.
+
+    Exception:
+        RuntimeError: No LlamaIndex run is in progress. Without an LLM,
+            LlamaIndex would silently fall back to its global default (OpenAI).
+    """
+    llm = _llamaindex_llm.get()
+    if llm is None:
+        raise RuntimeError("The LlamaIndex tools must be called inside `llamaindex_scope`, which sets the LLM of the run.")
+    return llm
+
 
+def get_llama_retriever():
+    """Returns the retriever of the current LlamaIndex run, the shared Vertex AI Search retriever by default."""
+    return _llamaindex_retriever.get() or CLIENTS.get("llama_retriever")
+
+@cancellable_tool
+@timed_tool
+@deadline_tool(min_seconds=TOOL_MIN_REMAINING_SECONDS)
+@resilient_tool(breaker=TOOL_CIRCUITS.get("vertex_ai_search"), policy=TOOL_RETRY_POLICY)
 def llamaindex_query_engine_tool(query: str) -> str:
     """
     Use this when you need additional information to answer a question.
@@ -254,33 +443,51 @@ def llamaindex_query_engine_tool(query: str) -> str:
     Returns:
         List[Document]: A list of the top-ranked Document objects
     """
-    query_engine = RetrieverQueryEngine.from_args(llama_retriever)
+    from llama_index.core.query_engine import RetrieverQueryEngine
+
+    # The LLM of the current run, rather than the global Settings.llm
+    query_engine = RetrieverQueryEngine.from_args(get_llama_retriever(), llm=get_llamaindex_llm())
     response = query_engine.query(query)
     return str(response)
 
 
+def _as_llamaindex_tool(fn: Callable[..., Any]) -> Any:
+    """Wraps a tool function as a LlamaIndex FunctionTool.
+
+    The async variant runs the function with `asyncio.to_thread`, which copies
+    the context variables of the run (LLM, cancellation, deadline) into the
+    worker thread, unlike the default `run_in_executor` wrapper of LlamaIndex.
+    """
+    from llama_index.core.tools import FunctionTool
+
+    @functools.wraps(fn)
+    async def async_fn(*args: Any, **kwargs: Any) -> Any:
+        return await asyncio.to_thread(fn, *args, **kwargs)
+
+    return FunctionTool.from_defaults(fn=fn, async_fn=async_fn)
+
+
 def get_llamaindex_tools(industry_type: str = None) -> list:
     """Grabs a list of tools based on the user's configselection"""
-
     tools_list = []
     # if industry_type == IndustryType.FINANCE_INDUSTRY.value:
     #     tool_spec = YahooFinanceToolSpec()
     #     tools_list.extend(tool_spec.to_tool_list())
     if industry_type == IndustryType.HEALTHCARE_INDUSTRY.value:
-        tools_list.append(FunctionTool.from_defaults(fn=medical_publications_tool))
+        tools_list.append(_as_llamaindex_tool(medical_publications_tool))
     # elif industry_type == IndustryType.RETAIL_INDUSTRY.value:
     #     tools_list.append(retail_discovery_tool)
 
     # These tools are only used if the user specifies a SERPER_API_KEY
     if SERP_API_KEY != "unset":
         tools_list.extend([
-            FunctionTool.from_defaults(fn=google_search_tool),
-            FunctionTool.from_defaults(fn=google_scholar_tool),
-            FunctionTool.from_defaults(fn=google_trends_tool),
-            FunctionTool.from_defaults(fn=google_finance_tool)
+            _as_llamaindex_tool(google_search_tool),
+            _as_llamaindex_tool(google_scholar_tool),
+            _as_llamaindex_tool(google_trends_tool),
+            _as_llamaindex_tool(google_finance_tool)
         ])
 
     if DATA_STORE_ID != "unset":
-        tools_list.append(FunctionTool.from_defaults(fn=llamaindex_query_engine_tool))
+        tools_list.append(_as_llamaindex_tool(llamaindex_query_engine_tool))
 
     return tools_list
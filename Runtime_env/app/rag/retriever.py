@@ -11,7 +11,7 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
-# pylint: disable=C0301
+# pylint: disable=C0301, C0415
 """Module that defines a custom RAG engine using Vertex AI Search"""
 import os
 from unittest.mock import MagicMock
@@ -63,3 +63,29 @@ def get_compressor(project_id: str) -> VertexAIRank:
         title_field="id",
         top_n=5,
     )
+
+
+def get_llamaindex_retriever(
+    project_id: str,
+    data_store_id: str,
+    agent_builder_location: str,
+):
+    """
+    Creates and returns an instance of the LlamaIndex retriever service.
+
+    Uses mock service if the INTEGRATION_TEST environment variable is set to "TRUE",
+    otherwise initializes real Vertex AI retriever.
+    """
+    if os.getenv("INTEGRATION_TEST") == "TRUE":
+        retriever = MagicMock()
+        retriever.retrieve = lambda x: []
+        return retriever
+
+    from llama_index.retrievers.vertexai_search import VertexAISearchRetriever
+
+    return VertexAISearchRetriever(
+        project_id=project_id,
+        data_store_id=data_store_id,
+        location_id=agent_builder_location,
+        engine_data_type=0,
+    )
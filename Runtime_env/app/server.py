@@ -14,37 +14,182 @@
 # pylint: disable=W0718, W0621, C0411, C0301
 # ruff: noqa: I001
 """Fast API Server for running an AI Agent"""
-import json
+import asyncio
+from contextlib import asynccontextmanager
 import logging
 import os
+import time
+from typing import Any, Dict, Optional
 import uuid
 
-from fastapi import FastAPI
-from fastapi.responses import RedirectResponse, StreamingResponse
+from fastapi import FastAPI, Header, Request, Response
+from fastapi.responses import JSONResponse, PlainTextResponse, RedirectResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from google.cloud import logging as google_cloud_logging
-from traceloop.sdk import Instruments, Traceloop
+from starlette.background import BackgroundTask
 
+from app.orchestration.clients import (
+    CLIENTS,
+    get_cloud_logger,
+    get_trace_exporter,
+    is_integration_test
+)
 from app.orchestration.config import (
     AGENT_INDUSTRY_TYPE,
     AGENT_ORCHESTRATION_FRAMEWORK,
     AGENT_FOUNDATION_MODEL,
     USER_AGENT,
-    AGENT_ENGINE_RESOURCE_ID
+    AGENT_ENGINE_RESOURCE_ID,
+    AGENT_MODEL_CASCADE,
+    STREAM_QUERY_MAX_IN_FLIGHT,
+    STREAM_QUERY_MAX_QUEUE_SIZE,
+    STREAM_QUERY_MAX_QUEUE_SECONDS,
+    STREAM_QUERY_RETRY_AFTER_SECONDS,
+    SESSION_STORE_PATH,
+    SESSION_STORE_MAX_MEMORY_BYTES,
+    JSON_ENCODER,
+    CLIENT_WARM_UP,
+    AGENT_CONFIGS,
+    AGENT_POOL_MAX_SIZE,
+    AGENT_MAX_CONCURRENCY,
+    BATCH_QUERY_MAX_CONCURRENCY,
+    BATCH_QUERY_ITEM_TIMEOUT_SECONDS,
+    BATCH_QUERY_MAX_ITEMS,
+    FEEDBACK_QUEUE_MAX_SIZE,
+    FEEDBACK_BATCH_SIZE,
+    FEEDBACK_FLUSH_SECONDS,
+    FEEDBACK_SPILL_PATH,
+    DISCONNECT_POLL_SECONDS,
+    REQUEST_DEADLINE_SECONDS,
+    REQUEST_DEADLINE_MAX_SECONDS,
+    AGENT_ENGINE_REFRESH_SECONDS
+)
+from app.orchestration.agent_pool import (
+    DEFAULT_AGENT_CONFIG_NAME,
+    AgentConfig,
+    AgentLease,
+    AgentManagerPool,
+    UnknownAgentConfigError,
+    load_agent_configs
 )
+from app.orchestration.remote_engines import REMOTE_ENGINES
 from app.orchestration.server_utils import get_agent_from_config
-from app.utils.input_types import Feedback, RootInput, InnerInputChat, default_serialization
-from app.utils.tracing import CloudTraceLoggingSpanExporter
+from app.utils.admission import AdmissionController, AdmissionLease, AdmissionRejectedError
+from app.utils.cancellation import RunCancelledError, cancel_on_disconnect, stream_in_task
+from app.utils.deadline import Deadline, DeadlineExceededError, deadline_scope, parse_timeout
+from app.utils.feedback_logger import BatchedStructLogger
+from app.utils.input_types import BatchInput, Feedback, RootInput, InnerInputChat
+from app.utils.metrics import REGISTRY
+from app.utils.response_cache import get_cache_mode
+from app.utils.serialization import StreamEncoder, get_json_dumps
+from app.utils.session_store import (
+    SessionConflictError,
+    SessionHistoryStore,
+    get_ai_message_content
+)
+from app.utils.stage_metrics import STAGE_SECONDS
 
 # The events that are supported by the UI Frontend
 SUPPORTED_EVENTS = [
     "on_chat_model_stream",
 ]
 
-# Initialize FastAPI app and logging
-app = FastAPI()
-logging_client = google_cloud_logging.Client()
-logger = logging_client.logger(__name__)
+
+def init_tracing() -> bool:
+    """Initializes Traceloop with the Cloud Trace exporter. Skipped in integration tests."""
+    if is_integration_test():
+        return False
+
+    from traceloop.sdk import Instruments, Traceloop # pylint: disable=C0415
+
+    try:
+        Traceloop.init(
+            app_name=USER_AGENT,
+            disable_batch=False,
+            exporter=get_trace_exporter(),
+            instruments={Instruments.VERTEXAI, Instruments.LANGCHAIN},
+        )
+    except Exception as e:
+        logging.error("Failed to initialize Traceloop: %s", e)
+        return False
+    return True
+
+
+def set_trace_association_properties(properties: Dict[str, Any]) -> None:
+    """Attaches properties to the spans of the current request, if tracing is enabled."""
+    if not CLIENTS.is_initialized("tracing") or not CLIENTS.get("tracing"):
+        return
+
+    from traceloop.sdk import Traceloop # pylint: disable=C0415
+
+    Traceloop.set_association_properties(properties)
+
+
+def create_agent_manager(config: AgentConfig):
+    """Get agent based on user selection"""
+    return get_agent_from_config(
+        agent_orchestration_framework=config.orchestration_framework,
+        industry_type=config.industry_type,
+        agent_foundation_model=config.foundation_model,
+        agent_engine_resource_id=config.agent_engine_resource_id,
+        model_cascade=config.model_cascade
+    )
+
+
+# The hosted agents. The default one is configured by the AGENT_* variables,
+# further ones by AGENT_CONFIGS. Requests select one by route or header.
+agent_pool = AgentManagerPool(
+    configs=load_agent_configs(
+        AgentConfig(
+            name=DEFAULT_AGENT_CONFIG_NAME,
+            orchestration_framework=AGENT_ORCHESTRATION_FRAMEWORK,
+            industry_type=AGENT_INDUSTRY_TYPE,
+            foundation_model=AGENT_FOUNDATION_MODEL,
+            agent_engine_resource_id=AGENT_ENGINE_RESOURCE_ID,
+            model_cascade=AGENT_MODEL_CASCADE,
+            max_concurrency=AGENT_MAX_CONCURRENCY
+        ),
+        AGENT_CONFIGS
+    ),
+    factory=create_agent_manager,
+    max_size=AGENT_POOL_MAX_SIZE,
+    max_queue_size=STREAM_QUERY_MAX_QUEUE_SIZE,
+    max_queue_time=STREAM_QUERY_MAX_QUEUE_SECONDS,
+    retry_after=STREAM_QUERY_RETRY_AFTER_SECONDS
+)
+
+# Clients are created on first use, or by the background warm-up after startup
+CLIENTS.register("tracing", init_tracing)
+CLIENTS.register("feedback_logger", lambda: get_cloud_logger(__name__))
+CLIENTS.register("agent_manager", lambda: agent_pool.get(DEFAULT_AGENT_CONFIG_NAME))
+
+# Feedback is written to Cloud Logging in batches by a background task
+feedback_logger = BatchedStructLogger(
+    get_logger=lambda: CLIENTS.get("feedback_logger"),
+    max_queue_size=FEEDBACK_QUEUE_MAX_SIZE,
+    max_batch_size=FEEDBACK_BATCH_SIZE,
+    flush_interval=FEEDBACK_FLUSH_SECONDS,
+    spill_path=FEEDBACK_SPILL_PATH
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Warms up the clients in the background once the server accepts traffic."""
+    warm_up_task = asyncio.create_task(CLIENTS.awarm_up()) if CLIENT_WARM_UP else None
+    refresh_task = (
+        asyncio.create_task(REMOTE_ENGINES.run_refresh_loop(AGENT_ENGINE_REFRESH_SECONDS))
+        if AGENT_ENGINE_REFRESH_SECONDS > 0 else None
+    )
+    feedback_logger.start()
+    yield
+    for task in (warm_up_task, refresh_task):
+        if task is not None and not task.done():
+            task.cancel()
+    await feedback_logger.stop()
+
+
+# Initialize FastAPI app
+app = FastAPI(lifespan=lifespan)
 
 def configure_cors(app):
     urls = ["http://localhost:4200"]
@@ -61,43 +206,191 @@ def configure_cors(app):
         allow_headers=["*"],
     )
 
-# Initialize Traceloop
-try:
-    Traceloop.init(
-        app_name=USER_AGENT,
-        disable_batch=False,
-        exporter=CloudTraceLoggingSpanExporter(),
-        instruments={Instruments.VERTEXAI, Instruments.LANGCHAIN},
-    )
-except Exception as e:
-    logging.error("Failed to initialize Traceloop: %s", e)
-
-# Get agent based on user selection
-agent_manager = get_agent_from_config(
-    agent_orchestration_framework=AGENT_ORCHESTRATION_FRAMEWORK,
-    industry_type=AGENT_INDUSTRY_TYPE,
-    agent_foundation_model=AGENT_FOUNDATION_MODEL,
-    agent_engine_resource_id=AGENT_ENGINE_RESOURCE_ID
+# Bound the number of concurrently running agent streams
+admission_controller = AdmissionController(
+    max_in_flight=STREAM_QUERY_MAX_IN_FLIGHT,
+    max_queue_size=STREAM_QUERY_MAX_QUEUE_SIZE,
+    max_queue_time=STREAM_QUERY_MAX_QUEUE_SECONDS,
+    retry_after=STREAM_QUERY_RETRY_AFTER_SECONDS
 )
 
-async def stream_event_response(input_chat: InnerInputChat):
-    """Stream events in response to an input chat."""
+# Encoder used for the NDJSON event stream
+json_dumps = get_json_dumps(JSON_ENCODER)
+
+# Canonical conversation history for clients using the session-delta protocol
+session_store = SessionHistoryStore(
+    path=SESSION_STORE_PATH,
+    max_memory_bytes=SESSION_STORE_MAX_MEMORY_BYTES
+)
+
+async def get_input_dict(input_chat: InnerInputChat) -> Dict[str, Any]:
+    """Builds the agent input, merging the new turn with the stored session history.
+
+    Requests with a `session_version` only carry the new turn, which follows
+    the stored history. Requests without one carry the full conversation. The
+    store is left unchanged until the turn is answered (see `save_session_turn`),
+    so a rejected or failed request can be retried with the same version.
+    The store may read SQLite, so it is called on a worker thread.
+
+    Exception:
+        SessionConflictError: The client's session version is out of date.
+    """
+    input_dict = input_chat.model_dump(exclude={"session_version"})
+    if not input_chat.session_id:
+        return input_dict
+
+    history = await asyncio.to_thread(
+        session_store.merge,
+        input_chat.user_id,
+        input_chat.session_id,
+        input_dict["messages"],
+        expected_version=input_chat.session_version
+    )
+    input_dict["messages"] = history.messages
+    return input_dict
+
+
+async def save_session_turn(input_chat: InnerInputChat, answer: str) -> None:
+    """Stores an answered turn, the messages of the request and the answer together."""
+    if not input_chat.session_id:
+        return
+
+    messages = input_chat.model_dump(include={"messages"})["messages"] + [{"type": "ai", "content": answer}]
+    if input_chat.session_version is None:
+        await asyncio.to_thread(session_store.replace, input_chat.user_id, input_chat.session_id, messages)
+        return
+    try:
+        await asyncio.to_thread(
+            session_store.append,
+            input_chat.user_id, input_chat.session_id, messages, expected_version=input_chat.session_version
+        )
+    except SessionConflictError as e:
+        # Another turn of the session completed first, the client resynchronizes on its next turn
+        logging.warning("Dropping the answered turn of session %s: %s", input_chat.session_id, e)
+
+
+async def stream_event_response(
+    input_chat: InnerInputChat,
+    input_dict: Dict[str, Any],
+    lease: AdmissionLease,
+    agent_lease: AgentLease,
+    http_request: Request
+):
+    """Stream events in response to an input chat, until the client disconnects or the deadline passes."""
+    try:
+        answer = ""
+        timeout = parse_timeout(
+            http_request.headers.get("X-Request-Timeout"), REQUEST_DEADLINE_SECONDS, REQUEST_DEADLINE_MAX_SECONDS
+        )
+        try:
+            with deadline_scope(Deadline(timeout)):
+                async with cancel_on_disconnect(http_request.is_disconnected, "streamQuery", DISCONNECT_POLL_SECONDS):
+                    # The run is driven in a child task, so cancelling it never interrupts sending the response
+                    events = stream_in_task(_stream_event_response(input_dict, agent_lease))
+                    try:
+                        async for event, chunk in events:
+                            answer += get_ai_message_content(chunk)
+                            yield event
+                    finally:
+                        await events.aclose()
+        except DeadlineExceededError:
+            # End the stream with what was answered so far, plus a notice
+            notice = f"\n\n(The answer was cut short because the request deadline of {timeout:g} seconds was reached.)"
+            answer += notice
+            yield StreamEncoder(json_dumps).encode(agent_lease.agent_manager.get_response_obj(notice, input_dict["run_id"]))
+        except RunCancelledError:
+            # The client disconnected, the turn is not stored
+            return
+
+        await save_session_turn(input_chat, answer)
+    finally:
+        agent_lease.release()
+        lease.release()
+
+
+async def _stream_event_response(input_dict: Dict[str, Any], agent_lease: AgentLease):
+    """Stream the agent output as newline delimited JSON, along with the raw chunks."""
     run_id = uuid.uuid4()
-    input_dict = input_chat.model_dump()
     input_dict["run_id"] = str(run_id)
 
-    Traceloop.set_association_properties(
+    await CLIENTS.aget("tracing")
+    set_trace_association_properties(
         {
             "log_type": "tracing",
             "run_id": str(run_id),
             "user_id": input_dict["user_id"],
             "session_id": input_dict["session_id"],
+            "agent": agent_lease.name,
             "commit_sha": os.environ.get("COMMIT_SHA", "None"),
         }
     )
 
-    async for data in agent_manager.astream(input_dict):
-        yield json.dumps(data, default=default_serialization) + "\n"
+    # The constant parts of the response envelope are encoded once per run
+    encoder = StreamEncoder(json_dumps)
+    serialization_seconds = 0.0
+    try:
+        async for data in agent_lease.agent_manager.astream_with_metrics(input_dict):
+            start_time = time.perf_counter()
+            event = encoder.encode(data)
+            serialization_seconds += time.perf_counter() - start_time
+            yield event, data
+    finally:
+        STAGE_SECONDS.observe(serialization_seconds, stage="serialization", **agent_lease.agent_manager.metric_labels())
+
+
+BATCH_ITEM_SECONDS = REGISTRY.histogram(
+    "agent_batch_item_seconds",
+    "Time taken to answer one conversation of a batch query.",
+    ["agent", "status"]
+)
+
+
+async def batch_event_response(
+    batch: BatchInput,
+    lease: AdmissionLease,
+    agent_lease: AgentLease,
+    http_request: Request
+):
+    """Stream the results of a batch query as newline delimited JSON, in completion order."""
+    try:
+        cache_mode = get_cache_mode(http_request.headers.get("Cache-Control"))
+        inputs = [
+            {**input_chat.model_dump(exclude={"session_version"}), "response_cache": cache_mode}
+            for input_chat in batch.inputs
+        ]
+        max_concurrency = min(batch.max_concurrency or BATCH_QUERY_MAX_CONCURRENCY, BATCH_QUERY_MAX_CONCURRENCY)
+        timeout = min(batch.timeout_seconds or BATCH_QUERY_ITEM_TIMEOUT_SECONDS, BATCH_QUERY_ITEM_TIMEOUT_SECONDS)
+
+        # A batch only has an overall deadline if the client asks for one, each item is bounded by `timeout`
+        batch_timeout = http_request.headers.get("X-Request-Timeout")
+        deadline = Deadline(parse_timeout(batch_timeout, REQUEST_DEADLINE_SECONDS, REQUEST_DEADLINE_MAX_SECONDS)) if batch_timeout else None
+
+        completed = set()
+        await CLIENTS.aget("tracing")
+        try:
+            with deadline_scope(deadline):
+                async with cancel_on_disconnect(http_request.is_disconnected, "batchQuery", DISCONNECT_POLL_SECONDS):
+                    results = stream_in_task(
+                        agent_lease.agent_manager.abatch(inputs, max_concurrency=max_concurrency, timeout=timeout)
+                    )
+                    try:
+                        async for result in results:
+                            completed.add(result["index"])
+                            BATCH_ITEM_SECONDS.observe(result["latency_seconds"], agent=agent_lease.name, status=result["status"])
+                            yield json_dumps(result) + b"\n"
+                    finally:
+                        await results.aclose()
+        except DeadlineExceededError:
+            # Report the conversations that had not completed, so every input gets a result
+            for index in range(len(inputs)):
+                if index not in completed:
+                    yield json_dumps({"index": index, "status": "timeout", "error": "The request deadline was reached."}) + b"\n"
+        except RunCancelledError:
+            # The client disconnected
+            return
+    finally:
+        agent_lease.release()
+        lease.release()
 
 
 # Routes
@@ -110,16 +403,176 @@ async def redirect_root_to_docs() -> RedirectResponse:
 @app.post("/feedback")
 async def collect_feedback(feedback_dict: Feedback) -> None:
     """Collect and log feedback."""
-    logger.log_struct(feedback_dict.model_dump(), severity="INFO")
+    feedback_logger.log_struct(feedback_dict.model_dump(), severity="INFO")
 
 
-@app.post("/streamQuery")
-async def stream_chat_events(request: RootInput) -> StreamingResponse:
-    """Stream chat events in response to an input request."""
+@app.get("/metrics")
+async def metrics() -> PlainTextResponse:
+    """Expose the in-process metrics in the Prometheus text format."""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/sessions/{session_id}")
+async def get_session(session_id: str, user_id: str = "") -> Dict[str, Any]:
+    """Return the stored history of a session of a user so a client can resynchronize."""
+    history = await asyncio.to_thread(session_store.get, user_id, session_id)
+    return {
+        "user_id": user_id,
+        "session_id": session_id,
+        "session_version": history.version,
+        "messages": history.messages
+    }
+
+
+@app.get("/agents")
+async def list_agents() -> Dict[str, Any]:
+    """List the agent configurations hosted by this server."""
+    return {
+        "agents": [
+            {
+                "name": config.name,
+                "orchestration_framework": config.orchestration_framework,
+                "industry_type": config.industry_type,
+                "foundation_model": config.foundation_model,
+                "model_cascade": config.model_cascade,
+            }
+            for config in agent_pool.configs.values()
+        ]
+    }
+
+
+def get_rejection_response(e: AdmissionRejectedError) -> JSONResponse:
+    """Builds the response to a request rejected by admission control."""
+    return JSONResponse(
+        status_code=e.status_code,
+        content={"detail": str(e)},
+        headers={"Retry-After": str(e.retry_after)}
+    )
+
+
+async def acquire_leases(agent_name: Optional[str]) -> tuple[AdmissionLease, AgentLease]:
+    """Waits for a server-wide slot, then for a slot of the selected agent.
+
+    Exception:
+        AdmissionRejectedError: The server or the agent is at capacity.
+    """
+    lease = await admission_controller.acquire()
+    try:
+        agent_lease = await agent_pool.acquire(agent_name)
+    except BaseException:
+        lease.release()
+        raise
+    return lease, agent_lease
+
+
+async def stream_agent_events(request: RootInput, agent_name: Optional[str], http_request: Request) -> Response:
+    """Stream chat events of the selected agent in response to an input request."""
+    try:
+        agent_pool.get_config(agent_name)
+    except UnknownAgentConfigError as e:
+        return JSONResponse(status_code=404, content={"detail": e.args[0]})
+
+    try:
+        input_dict = await get_input_dict(request.input.input)
+    except SessionConflictError as e:
+        return JSONResponse(
+            status_code=409,
+            content={"detail": str(e), "session_version": e.current_version}
+        )
+    input_dict["response_cache"] = get_cache_mode(http_request.headers.get("Cache-Control"))
+
+    try:
+        lease, agent_lease = await acquire_leases(agent_name)
+    except AdmissionRejectedError as e:
+        return get_rejection_response(e)
+
+    def release_leases():
+        agent_lease.release()
+        lease.release()
+
+    # The background task releases the leases even if the stream is never started
+    return StreamingResponse(
+        stream_event_response(
+            input_chat=request.input.input,
+            input_dict=input_dict,
+            lease=lease,
+            agent_lease=agent_lease,
+            http_request=http_request
+        ),
+        media_type="text/event-stream",
+        background=BackgroundTask(release_leases)
+    )
+
+
+async def batch_agent_events(batch: BatchInput, agent_name: Optional[str], http_request: Request) -> Response:
+    """Run a batch of conversations on the selected agent and stream back the results."""
+    try:
+        agent_pool.get_config(agent_name)
+    except UnknownAgentConfigError as e:
+        return JSONResponse(status_code=404, content={"detail": e.args[0]})
+
+    if len(batch.inputs) > BATCH_QUERY_MAX_ITEMS:
+        return JSONResponse(
+            status_code=413,
+            content={"detail": f"A batch may contain at most {BATCH_QUERY_MAX_ITEMS} conversations."}
+        )
+
+    # The whole batch holds one slot, its parallelism is bounded by BATCH_QUERY_MAX_CONCURRENCY
+    try:
+        lease, agent_lease = await acquire_leases(agent_name)
+    except AdmissionRejectedError as e:
+        return get_rejection_response(e)
+
+    def release_leases():
+        agent_lease.release()
+        lease.release()
+
     return StreamingResponse(
-        stream_event_response(input_chat=request.input.input), media_type="text/event-stream"
+        batch_event_response(batch=batch, lease=lease, agent_lease=agent_lease, http_request=http_request),
+        media_type="application/x-ndjson",
+        background=BackgroundTask(release_leases)
     )
 
+
+@app.post("/streamQuery")
+async def stream_chat_events(
+    request: RootInput,
+    http_request: Request,
+    x_agent_config: Optional[str] = Header(default=None)
+) -> Response:
+    """Stream chat events in response to an input request.
+
+    The agent is selected by the `X-Agent-Config` header, the default one if absent.
+    """
+    return await stream_agent_events(request, x_agent_config, http_request)
+
+
+@app.post("/agents/{agent_name}/streamQuery")
+async def stream_agent_chat_events(agent_name: str, request: RootInput, http_request: Request) -> Response:
+    """Stream chat events of the named agent in response to an input request."""
+    return await stream_agent_events(request, agent_name, http_request)
+
+
+@app.post("/batchQuery")
+async def batch_query(
+    batch: BatchInput,
+    http_request: Request,
+    x_agent_config: Optional[str] = Header(default=None)
+) -> Response:
+    """Run a batch of independent conversations with bounded parallelism.
+
+    The results are streamed back as newline delimited JSON in completion
+    order. Each line carries the `index` of its conversation in `inputs`, its
+    `status`, the `output` or `error`, and its `latency_seconds`.
+    """
+    return await batch_agent_events(batch, x_agent_config, http_request)
+
+
+@app.post("/agents/{agent_name}/batchQuery")
+async def batch_agent_query(agent_name: str, batch: BatchInput, http_request: Request) -> Response:
+    """Run a batch of independent conversations on the named agent."""
+    return await batch_agent_events(batch, agent_name, http_request)
+
 configure_cors(app)
 
 # Main execution
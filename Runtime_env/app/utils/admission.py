@@ -0,0 +1,184 @@
+# Copyright 2025 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# pylint: disable=C0301
+"""Module for admission control of concurrent agent requests."""
+import asyncio
+import collections
+import time
+from typing import Deque
+
+from app.utils.metrics import REGISTRY
+
+ADMISSION_IN_FLIGHT = REGISTRY.gauge(
+    "agent_admission_in_flight",
+    "Number of requests currently admitted and running.",
+    ["route"]
+)
+ADMISSION_QUEUE_DEPTH = REGISTRY.gauge(
+    "agent_admission_queue_depth",
+    "Number of requests waiting for admission.",
+    ["route"]
+)
+ADMISSION_WAIT_SECONDS = REGISTRY.histogram(
+    "agent_admission_wait_seconds",
+    "Time requests spent waiting for admission.",
+    ["route"]
+)
+ADMISSION_REJECTED = REGISTRY.counter(
+    "agent_admission_rejected_total",
+    "Number of requests rejected by admission control.",
+    ["route", "reason"]
+)
+
+
+class AdmissionRejectedError(Exception):
+    """Raised when a request cannot be admitted.
+
+    Attributes:
+        status_code: The HTTP status code to return to the client.
+        retry_after: The number of seconds the client should wait before retrying.
+    """
+
+    def __init__(self, message: str, status_code: int, retry_after: int):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class AdmissionLease:
+    """A permit to run one request. Releasing it more than once is a no-op."""
+
+    def __init__(self, controller: "AdmissionController"):
+        self._controller = controller
+        self._released = False
+
+    def release(self) -> None:
+        """Returns the permit to the controller."""
+        if not self._released:
+            self._released = True
+            self._controller.release()
+
+
+class AdmissionController:
+    """
+    Bounds the number of requests running concurrently.
+
+    Up to `max_in_flight` requests run at once. Further requests wait in a
+    FIFO queue of at most `max_queue_size` entries for at most
+    `max_queue_time` seconds. Requests arriving to a full queue are rejected
+    immediately with a 429, and requests that time out in the queue are
+    rejected with a 503. Both carry a `Retry-After` hint.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int,
+        max_queue_size: int,
+        max_queue_time: float,
+        retry_after: int,
+        route: str = "streamQuery"
+    ):
+        """
+        Initializes the AdmissionController.
+
+        Args:
+            max_in_flight: Maximum number of concurrently admitted requests.
+                A value <= 0 disables admission control.
+            max_queue_size: Maximum number of requests waiting for admission.
+            max_queue_time: Maximum number of seconds a request may wait for admission.
+            retry_after: The `Retry-After` value (in seconds) sent with rejections.
+            route: The route name used to label metrics.
+        """
+        self.max_in_flight = max_in_flight
+        self.max_queue_size = max_queue_size
+        self.max_queue_time = max_queue_time
+        self.retry_after = retry_after
+        self.route = route
+
+        self._in_flight = 0
+        self._waiters: Deque[asyncio.Future] = collections.deque()
+
+    @property
+    def in_flight(self) -> int:
+        """The number of currently admitted requests."""
+        return self._in_flight
+
+    @property
+    def queue_depth(self) -> int:
+        """The number of requests waiting for admission."""
+        return len(self._waiters)
+
+    def _update_gauges(self) -> None:
+        ADMISSION_IN_FLIGHT.set(self._in_flight, route=self.route)
+        ADMISSION_QUEUE_DEPTH.set(len(self._waiters), route=self.route)
+
+    def _reject(self, reason: str, status_code: int, message: str) -> AdmissionRejectedError:
+        ADMISSION_REJECTED.inc(route=self.route, reason=reason)
+        return AdmissionRejectedError(message, status_code=status_code, retry_after=self.retry_after)
+
+    async def acquire(self) -> AdmissionLease:
+        """Waits for a permit to run a request.
+
+        Returns:
+            An AdmissionLease that must be released once the request finishes.
+
+        Exception:
+            AdmissionRejectedError: The queue is full or the request waited too long.
+        """
+        if self.max_in_flight <= 0:
+            return AdmissionLease(self)
+
+        if self._in_flight < self.max_in_flight and not self._waiters:
+            self._in_flight += 1
+            self._update_gauges()
+            ADMISSION_WAIT_SECONDS.observe(0, route=self.route)
+            return AdmissionLease(self)
+
+        if len(self._waiters) >= self.max_queue_size:
+            raise self._reject("queue_full", 429, "Server is at capacity, please retry later.")
+
+        start_time = time.monotonic()
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._update_gauges()
+        try:
+            await asyncio.wait_for(waiter, timeout=self.max_queue_time)
+        except asyncio.TimeoutError:
+            raise self._reject("queue_timeout", 503, "Timed out waiting for server capacity, please retry later.") from None
+        except asyncio.CancelledError:
+            # The permit may have been handed over just before the caller went away
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            self._update_gauges()
+            ADMISSION_WAIT_SECONDS.observe(time.monotonic() - start_time, route=self.route)
+
+        return AdmissionLease(self)
+
+    def release(self) -> None:
+        """Releases a permit, handing it to the next waiting request if there is one."""
+        if self.max_in_flight <= 0:
+            return
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                # Transfer the permit directly so in-flight stays constant
+                waiter.set_result(None)
+                self._update_gauges()
+                return
+        self._in_flight = max(self._in_flight - 1, 0)
+        self._update_gauges()
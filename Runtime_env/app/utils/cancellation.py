@@ -0,0 +1,276 @@
+# Copyright 2025 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# pylint: disable=C0301
+"""Module for cooperative cancellation of agent runs.
+
+The server attaches a CancellationToken to each run through a context
+variable. Context variables are copied into the worker threads that drive
+sync generators and run tools, so code anywhere in the run can check whether
+the client is still waiting for the answer. The async part of a run is
+driven in a child task of the response (see `stream_in_task`), which is
+cancelled with the run, so the response itself can still end the stream.
+"""
+import asyncio
+import contextlib
+import contextvars
+import functools
+import threading
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterator, List, Optional, TypeVar
+
+from app.utils.deadline import DeadlineExceededError, get_deadline
+from app.utils.metrics import REGISTRY
+
+CANCELLED_RUNS = REGISTRY.counter(
+    "agent_cancelled_runs_total",
+    "Number of agent runs cancelled before completion.",
+    ["route", "reason"]
+)
+CANCELLED_RUN_SECONDS = REGISTRY.histogram(
+    "agent_cancelled_run_seconds",
+    "Time agent runs had been running when they were cancelled.",
+    ["route"]
+)
+CANCELLED_TOOL_CALLS = REGISTRY.counter(
+    "agent_cancelled_tool_calls_total",
+    "Number of tool calls skipped because their run was cancelled.",
+    ["tool"]
+)
+
+T = TypeVar("T")
+
+
+class RunCancelledError(Exception):
+    """Raised inside an agent run once it has been cancelled."""
+
+
+class CancellationToken:
+    """A thread-safe flag telling an agent run to stop."""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._callbacks: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+        self.reason: Optional[str] = None
+        self.created_at = time.monotonic()
+
+    @property
+    def is_cancelled(self) -> bool:
+        """Whether the run has been cancelled."""
+        return self._event.is_set()
+
+    def cancel(self, reason: str = "cancelled") -> None:
+        """Cancels the run and calls its callbacks. Only the first reason is kept."""
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def add_callback(self, callback: Callable[[], None]) -> Callable[[], None]:
+        """Calls `callback` once the run is cancelled, right away if it already is.
+
+        Returns:
+            A function removing the callback.
+        """
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return lambda: self._remove_callback(callback)
+        callback()
+        return lambda: None
+
+    def _remove_callback(self, callback: Callable[[], None]) -> None:
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def raise_if_cancelled(self) -> None:
+        """Raises RunCancelledError if the run has been cancelled."""
+        if self._event.is_set():
+            raise RunCancelledError(f"The run was cancelled ({self.reason}).")
+
+
+_current_token: contextvars.ContextVar[Optional[CancellationToken]] = contextvars.ContextVar(
+    "agent_cancellation_token", default=None
+)
+
+
+def get_cancellation_token() -> Optional[CancellationToken]:
+    """Returns the token of the current run, if any."""
+    return _current_token.get()
+
+
+def is_cancelled() -> bool:
+    """Whether the current run has been cancelled."""
+    token = _current_token.get()
+    return token is not None and token.is_cancelled
+
+
+def raise_if_cancelled() -> None:
+    """Raises RunCancelledError if the current run has been cancelled."""
+    token = _current_token.get()
+    if token is not None:
+        token.raise_if_cancelled()
+
+
+@contextlib.contextmanager
+def cancellation_scope(token: CancellationToken) -> Iterator[CancellationToken]:
+    """Makes a token the current one for the duration of the block."""
+    reset_token = _current_token.set(token)
+    try:
+        yield token
+    finally:
+        try:
+            _current_token.reset(reset_token)
+        except ValueError:
+            # Exited from another context, e.g. a generator closed by a different task
+            _current_token.set(None)
+
+
+def cancellable_tool(func: Callable[..., Any]) -> Callable[..., Any]:
+    """Decorator skipping a tool call once its run has been cancelled.
+
+    The wrapper keeps the signature and docstring of the tool, so it can be
+    passed to `StructuredTool.from_function` and `FunctionTool.from_defaults`.
+    """
+
+    @functools.wraps(func)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        if is_cancelled():
+            CANCELLED_TOOL_CALLS.inc(tool=func.__name__)
+            raise_if_cancelled()
+        return func(*args, **kwargs)
+
+    return wrapper
+
+
+async def stream_in_task(stream: AsyncIterator[T], token: Optional[CancellationToken] = None) -> AsyncIterator[T]:
+    """Drives an async stream in a child task, which is cancelled with the run.
+
+    Cancelling the task consuming the stream (e.g. the task of a
+    StreamingResponse) could interrupt any of its awaits, such as sending a
+    chunk to the client, and the consumer could then not end its response.
+    Only the child task is cancelled, and the consumer gets
+    RunCancelledError the next time it waits for an item.
+
+    Args:
+        stream: The async stream of the run, iterated with the context of the caller.
+        token: The token of the run. Defaults to the current one.
+
+    Yields:
+        The items of the stream.
+
+    Exception:
+        RunCancelledError: The run was cancelled before the end of the stream.
+    """
+    token = token or get_cancellation_token()
+    queue: "asyncio.Queue[T]" = asyncio.Queue(maxsize=1)
+
+    async def pump() -> None:
+        try:
+            async for item in stream:
+                await queue.put(item)
+        finally:
+            # Closes the stream if the task was cancelled while it was suspended
+            aclose = getattr(stream, "aclose", None)
+            if aclose is not None:
+                await aclose()
+
+    loop = asyncio.get_running_loop()
+    task = asyncio.create_task(pump())
+    remove_callback = token.add_callback(lambda: loop.call_soon_threadsafe(task.cancel)) if token else lambda: None
+    try:
+        while True:
+            if not queue.empty():
+                yield queue.get_nowait()
+                continue
+            if task.done():
+                if task.cancelled():
+                    raise RunCancelledError(f"The run was cancelled ({token.reason if token else 'cancelled'}).")
+                task.result()
+                return
+            getter = asyncio.ensure_future(queue.get())
+            try:
+                await asyncio.wait({getter, task}, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                if not getter.done():
+                    getter.cancel()
+            if getter.done() and not getter.cancelled():
+                yield getter.result()
+    finally:
+        remove_callback()
+        if not task.done():
+            task.cancel()
+            await asyncio.wait({task})
+
+
+@contextlib.asynccontextmanager
+async def cancel_on_disconnect(
+    is_disconnected: Callable[[], Awaitable[bool]],
+    route: str,
+    poll_interval: float
+) -> AsyncIterator[CancellationToken]:
+    """Cancels the run of the block once the client has disconnected.
+
+    A watcher polls `is_disconnected` while the block runs. Once the client is
+    gone, it cancels the token, which stops the sync generators and tool
+    calls of the run, and the child tasks driving its async streams (see
+    `stream_in_task`), which stops the async model calls awaited by them.
+
+    The run is cancelled the same way when the current deadline (see
+    `app.utils.deadline`) passes, in which case DeadlineExceededError is
+    raised out of the block instead of RunCancelledError, and the block can
+    still end its response.
+
+    Args:
+        is_disconnected: A coroutine function telling whether the client disconnected
+            (e.g. `Request.is_disconnected`).
+        route: The route name used to label metrics.
+        poll_interval: The number of seconds between two checks.
+
+    Yields:
+        The CancellationToken of the run, which is the current one inside the block.
+    """
+    token = CancellationToken()
+
+    async def watch() -> None:
+        while not token.is_cancelled:
+            await asyncio.sleep(poll_interval)
+            if await is_disconnected():
+                token.cancel("client_disconnected")
+
+    watcher = asyncio.create_task(watch())
+    deadline = get_deadline()
+    timer = None
+    if deadline is not None:
+        timer = asyncio.get_running_loop().call_later(deadline.remaining(), token.cancel, "deadline_exceeded")
+    try:
+        with cancellation_scope(token):
+            yield token
+    except (RunCancelledError, asyncio.CancelledError, GeneratorExit) as e:
+        # Also reached when the server itself stops reading the stream
+        token.cancel("stream_closed")
+        CANCELLED_RUNS.inc(route=route, reason=token.reason)
+        CANCELLED_RUN_SECONDS.observe(time.monotonic() - token.created_at, route=route)
+        if token.reason == "deadline_exceeded" and isinstance(e, RunCancelledError):
+            raise DeadlineExceededError("The request deadline was reached.") from e
+        raise
+    finally:
+        watcher.cancel()
+        if timer is not None:
+            timer.cancel()
@@ -0,0 +1,317 @@
+# Copyright 2025 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# pylint: disable=C0301
+"""Module for end-to-end request deadlines.
+
+The server gives each run a time budget and attaches it through a context
+variable, like the cancellation token. Model calls cap their per-attempt
+timeout by the remaining budget, and tools degrade (skip optional steps, or
+return a short notice instead of a result) when the budget runs low.
+
+A tool call abandoned at the deadline cannot be stopped and keeps its worker
+thread until it returns. Tools therefore give their HTTP calls a timeout
+capped by the remaining budget (see `clamp_timeout`), and fail fast instead
+of queuing once the workers are held by abandoned calls.
+"""
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+import contextlib
+import contextvars
+import functools
+import math
+import threading
+import time
+from typing import Any, Callable, Iterator, Optional, Set
+
+from app.utils.metrics import REGISTRY
+from app.utils.response_cache import mark_uncacheable
+
+DEADLINE_DEGRADATIONS = REGISTRY.counter(
+    "agent_deadline_degradations_total",
+    "Number of steps skipped or cut short because the request deadline was near.",
+    ["step"]
+)
+TOOL_CALLS_IN_FLIGHT = REGISTRY.gauge(
+    "agent_tool_calls_in_flight",
+    "Number of tool calls bounded by a deadline that are queued or running."
+)
+TOOL_CALLS_ABANDONED = REGISTRY.gauge(
+    "agent_tool_calls_abandoned",
+    "Number of tool calls abandoned at the deadline that are still holding a worker."
+)
+
+# The number of worker threads running tools bounded by a deadline, see `configure_tool_pool`
+_tool_workers = 32
+_tool_pool: Optional["ToolWorkerPool"] = None
+_tool_pool_lock = threading.Lock()
+
+
+class DeadlineExceededError(Exception):
+    """Raised when the deadline of a run has passed."""
+
+
+class Deadline:
+    """The point in time by which a run must have finished."""
+
+    def __init__(self, timeout: float):
+        """
+        Initializes the Deadline.
+
+        Args:
+            timeout: The number of seconds from now until the deadline.
+        """
+        self.timeout = timeout
+        self.expires_at = time.monotonic() + timeout
+
+    def remaining(self) -> float:
+        """The number of seconds left, 0 once the deadline has passed."""
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    @property
+    def expired(self) -> bool:
+        """Whether the deadline has passed."""
+        return time.monotonic() >= self.expires_at
+
+
+_current_deadline: contextvars.ContextVar[Optional[Deadline]] = contextvars.ContextVar(
+    "agent_deadline", default=None
+)
+
+
+def get_deadline() -> Optional[Deadline]:
+    """Returns the deadline of the current run, if any."""
+    return _current_deadline.get()
+
+
+def get_remaining_time() -> Optional[float]:
+    """Returns the seconds left until the deadline of the current run, None without deadline."""
+    deadline = _current_deadline.get()
+    return deadline.remaining() if deadline is not None else None
+
+
+def has_time_left(min_seconds: float) -> bool:
+    """Whether the current run has at least `min_seconds` left (always True without deadline)."""
+    remaining = get_remaining_time()
+    return remaining is None or remaining >= min_seconds
+
+
+def clamp_timeout(timeout: Optional[float]) -> Optional[float]:
+    """Caps a timeout by the time left until the deadline of the current run.
+
+    Args:
+        timeout: The timeout of a single call in seconds, None for no timeout.
+
+    Returns:
+        The smaller of `timeout` and the remaining time, None if neither is set.
+
+    Exception:
+        DeadlineExceededError: The deadline has already passed.
+    """
+    remaining = get_remaining_time()
+    if remaining is None:
+        return timeout
+    if remaining <= 0:
+        raise DeadlineExceededError("The request deadline has passed.")
+    return remaining if timeout is None else min(timeout, remaining)
+
+
+@contextlib.contextmanager
+def deadline_scope(deadline: Optional[Deadline]) -> Iterator[Optional[Deadline]]:
+    """Makes a deadline the current one for the duration of the block.
+
+    An enclosing deadline that expires earlier is kept.
+    """
+    current = _current_deadline.get()
+    if deadline is None or (current is not None and current.expires_at <= deadline.expires_at):
+        yield current
+        return
+
+    reset_token = _current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        try:
+            _current_deadline.reset(reset_token)
+        except ValueError:
+            # Exited from another context, e.g. a generator closed by a different task
+            _current_deadline.set(current)
+
+
+def parse_timeout(value: Optional[str], default: float, maximum: float) -> float:
+    """Parses a client supplied timeout in seconds (e.g. the `X-Request-Timeout` header).
+
+    Args:
+        value: The raw value, may be None or invalid.
+        default: The timeout used if the value is missing or invalid.
+        maximum: The largest timeout a client may ask for.
+
+    Returns:
+        The timeout in seconds.
+    """
+    try:
+        timeout = float(value) if value else default
+    except ValueError:
+        timeout = default
+    # "nan" and "inf" parse as floats, but make no deadline
+    if not math.isfinite(timeout) or timeout <= 0:
+        timeout = default
+    return min(timeout, maximum)
+
+
+class ToolWorkerPool:
+    """
+    Worker threads running the tools bounded by a deadline.
+
+    A call abandoned at the deadline keeps running until it returns. The pool
+    counts these calls, and is saturated once every worker is busy and some
+    of them are held by abandoned calls: a new call would wait for a worker
+    that may never be freed, so it is better not made.
+    """
+
+    def __init__(self, max_workers: int):
+        """
+        Initializes the ToolWorkerPool.
+
+        Args:
+            max_workers: The number of worker threads.
+        """
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="agent-tool")
+        self._in_flight = 0
+        self._abandoned: Set[Future] = set()
+        self._lock = threading.Lock()
+
+    @property
+    def in_flight(self) -> int:
+        """The number of calls queued or running."""
+        return self._in_flight
+
+    @property
+    def abandoned(self) -> int:
+        """The number of abandoned calls still running."""
+        return len(self._abandoned)
+
+    @property
+    def saturated(self) -> bool:
+        """Whether every worker is busy and some are held by abandoned calls."""
+        with self._lock:
+            return self._in_flight >= self.max_workers and bool(self._abandoned)
+
+    def _done(self, future: Future) -> None:
+        with self._lock:
+            self._in_flight -= 1
+            self._abandoned.discard(future)
+            TOOL_CALLS_IN_FLIGHT.set(self._in_flight)
+            TOOL_CALLS_ABANDONED.set(len(self._abandoned))
+
+    def submit(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Future:
+        """Runs a call on a worker."""
+        with self._lock:
+            self._in_flight += 1
+            TOOL_CALLS_IN_FLIGHT.set(self._in_flight)
+        future = self._executor.submit(func, *args, **kwargs)
+        future.add_done_callback(self._done)
+        return future
+
+    def abandon(self, future: Future) -> None:
+        """Gives up on a call: a queued call is cancelled, a running one is counted until it returns."""
+        if future.cancel():
+            return
+        with self._lock:
+            if not future.done():
+                self._abandoned.add(future)
+                TOOL_CALLS_ABANDONED.set(len(self._abandoned))
+
+
+def configure_tool_pool(max_workers: int) -> None:
+    """Sets the number of worker threads running tools bounded by a deadline.
+
+    The pool is created on the first tool call, so this has no effect once
+    a tool bounded by a deadline has run.
+
+    Args:
+        max_workers: The number of worker threads.
+    """
+    global _tool_workers # pylint: disable=W0603
+    with _tool_pool_lock:
+        _tool_workers = max_workers
+
+
+def _get_tool_pool() -> ToolWorkerPool:
+    """Returns the worker pool running tools that are bounded by the deadline."""
+    global _tool_pool # pylint: disable=W0603
+    with _tool_pool_lock:
+        if _tool_pool is None:
+            _tool_pool = ToolWorkerPool(_tool_workers)
+        return _tool_pool
+
+
+def deadline_tool(
+    func: Optional[Callable[..., Any]] = None,
+    *,
+    min_seconds: float = 2.0,
+    fallback: Optional[Callable[[str], Any]] = None
+) -> Callable[..., Any]:
+    """Decorator bounding a tool call by the deadline of its run.
+
+    Without a deadline the tool runs unchanged. Otherwise it is skipped when
+    less than `min_seconds` are left or when the workers are held by
+    abandoned calls, and abandoned when it does not finish before the
+    deadline. In these cases the agent gets a short notice, so it can answer
+    with the information gathered so far.
+
+    Args:
+        func: The tool function.
+        min_seconds: The minimum number of seconds left for the tool to be called.
+        fallback: Builds the tool result from the notice. Defaults to the notice itself.
+    """
+    if func is None:
+        return functools.partial(deadline_tool, min_seconds=min_seconds, fallback=fallback)
+
+    def degrade(step: str, notice: str) -> Any:
+        DEADLINE_DEGRADATIONS.inc(step=step)
+        mark_uncacheable()
+        return fallback(notice) if fallback else notice
+
+    @functools.wraps(func)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        remaining = get_remaining_time()
+        if remaining is None:
+            return func(*args, **kwargs)
+        if remaining < min_seconds:
+            return degrade(
+                f"{func.__name__}_skipped",
+                f"The {func.__name__} tool was skipped because the request is running out of time. "
+                "Answer with the information gathered so far."
+            )
+
+        pool = _get_tool_pool()
+        if pool.saturated:
+            return degrade(
+                f"{func.__name__}_saturated",
+                f"The {func.__name__} tool was skipped because the server is busy with earlier tool calls. "
+                "Answer with the information gathered so far."
+            )
+        context = contextvars.copy_context()
+        future = pool.submit(context.run, func, *args, **kwargs)
+        try:
+            return future.result(timeout=remaining)
+        except FutureTimeoutError:
+            pool.abandon(future)
+            return degrade(
+                f"{func.__name__}_timeout",
+                f"The {func.__name__} tool did not finish before the request deadline. "
+                "Answer with the information gathered so far."
+            )
+
+    return wrapper
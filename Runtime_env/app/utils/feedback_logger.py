@@ -0,0 +1,283 @@
+# Copyright 2025 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# pylint: disable=C0301, W0718
+"""Module for writing structured log entries off the request path.
+
+Entries are put on a bounded in-process queue and a background task writes
+them to the sink in batches, once enough have accumulated or a time interval
+has passed. Batches that cannot be written are spilled to a local file and
+replayed once the sink is reachable again.
+"""
+import asyncio
+import json
+import logging
+import os
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.utils.metrics import REGISTRY
+
+FEEDBACK_ENTRIES = REGISTRY.counter(
+    "feedback_entries_total",
+    "Number of feedback entries by outcome (queued, flushed, dropped, spilled, replayed, malformed).",
+    ["outcome"]
+)
+FEEDBACK_FLUSHES = REGISTRY.counter(
+    "feedback_flushes_total",
+    "Number of feedback batch writes by status.",
+    ["status"]
+)
+FEEDBACK_QUEUE_DEPTH = REGISTRY.gauge(
+    "feedback_queue_depth",
+    "Number of feedback entries waiting to be written."
+)
+
+# (structured entry, severity)
+Entry = Tuple[Dict[str, Any], str]
+
+
+class BatchedStructLogger:
+    """
+    Buffers `log_struct` calls and writes them to a logger in batches.
+
+    `log_struct` never blocks: entries arriving to a full queue are dropped
+    and counted. The writes themselves run on a worker thread, so a slow or
+    unreachable sink never holds up the event loop.
+    """
+
+    def __init__(
+        self,
+        get_logger: Callable[[], Any],
+        max_queue_size: int,
+        max_batch_size: int,
+        flush_interval: float,
+        spill_path: str
+    ):
+        """
+        Initializes the BatchedStructLogger.
+
+        Args:
+            get_logger: A callable returning the sink, an object exposing `log_struct`
+                (and optionally `batch`, like a Cloud Logging logger).
+            max_queue_size: Maximum number of entries waiting to be written.
+            max_batch_size: The number of entries that triggers a write.
+            flush_interval: Maximum number of seconds an entry waits before a write.
+            spill_path: The file batches are spilled to when the sink is down.
+        """
+        self.get_logger = get_logger
+        self.max_queue_size = max_queue_size
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self.spill_path = spill_path
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        # The entries taken off the queue for the next write, and the running write
+        self._pending: List[Entry] = []
+        self._flushing: Optional[asyncio.Future] = None
+        self._spill_lock = threading.Lock()
+
+    def _get_queue(self) -> asyncio.Queue:
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        return self._queue
+
+    def log_struct(self, info: Dict[str, Any], severity: str = "INFO") -> bool:
+        """Queues a structured entry to be written.
+
+        Args:
+            info: The structured entry.
+            severity: The severity of the entry.
+
+        Returns:
+            Whether the entry was queued. It is dropped if the queue is full.
+        """
+        queue = self._get_queue()
+        try:
+            queue.put_nowait((info, severity))
+        except asyncio.QueueFull:
+            FEEDBACK_ENTRIES.inc(outcome="dropped")
+            return False
+        FEEDBACK_ENTRIES.inc(outcome="queued")
+        FEEDBACK_QUEUE_DEPTH.set(queue.qsize())
+        return True
+
+    def start(self) -> None:
+        """Starts the background task writing the queued entries."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        """Stops the background task and writes the remaining entries.
+
+        Args:
+            timeout: Maximum number of seconds spent draining the queue. Entries
+                that could not be written in time are spilled to the local file.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        if self._flushing is not None and not self._flushing.done():
+            # The running write spills its batch itself if it fails
+            await asyncio.wait([self._flushing], timeout=timeout)
+
+        batch, self._pending = self._pending + self._take_batch(self.max_queue_size), []
+        if not batch:
+            return
+        try:
+            await asyncio.wait_for(asyncio.to_thread(self._write_batch, batch), timeout=max(deadline - loop.time(), 0))
+        except Exception as e:
+            logging.warning("Failed to drain %d feedback entries: %s", len(batch), e)
+            self._spill(batch)
+
+    def _take_batch(self, max_size: int) -> List[Entry]:
+        """Takes up to `max_size` entries off the queue without waiting."""
+        queue = self._get_queue()
+        batch = []
+        while len(batch) < max_size and not queue.empty():
+            batch.append(queue.get_nowait())
+        FEEDBACK_QUEUE_DEPTH.set(queue.qsize())
+        return batch
+
+    async def _run(self) -> None:
+        """Writes a batch whenever it is full or the flush interval has passed."""
+        queue = self._get_queue()
+        loop = asyncio.get_running_loop()
+        while True:
+            # Entries are collected on the instance, so `stop` can still write them
+            self._pending.append(await queue.get())
+            deadline = loop.time() + self.flush_interval
+            while len(self._pending) < self.max_batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    self._pending.append(await asyncio.wait_for(queue.get(), timeout=remaining))
+                except asyncio.TimeoutError:
+                    break
+            FEEDBACK_QUEUE_DEPTH.set(queue.qsize())
+
+            batch, self._pending = self._pending, []
+            self._flushing = asyncio.ensure_future(asyncio.to_thread(self._flush, batch))
+            try:
+                # Shielded, so a shutdown lets the running write finish
+                await asyncio.shield(self._flushing)
+            except Exception as e:
+                # Keeps writing the next batches whatever happened to this one
+                logging.error("Failed to flush feedback entries: %s", e)
+
+    def _flush(self, batch: List[Entry]) -> None:
+        """Writes a batch, spilling it on failure, and replays earlier spills on success."""
+        try:
+            self._write_batch(batch)
+        except Exception as e:
+            logging.warning("Failed to write %d feedback entries, spilling to %s: %s", len(batch), self.spill_path, e)
+            FEEDBACK_FLUSHES.inc(status="error")
+            self._spill(batch)
+            return
+        FEEDBACK_FLUSHES.inc(status="success")
+        FEEDBACK_ENTRIES.inc(len(batch), outcome="flushed")
+        self._replay_spill()
+
+    def _write_batch(self, batch: List[Entry]) -> None:
+        """Writes the entries to the sink, in a single request if the sink supports batches."""
+        sink = self.get_logger()
+        if hasattr(sink, "batch"):
+            with sink.batch() as sink_batch:
+                for info, severity in batch:
+                    sink_batch.log_struct(info, severity=severity)
+        else:
+            for info, severity in batch:
+                sink.log_struct(info, severity=severity)
+
+    def _spill(self, batch: List[Entry]) -> None:
+        """Appends the entries to the spill file."""
+        try:
+            with self._spill_lock, open(self.spill_path, "a", encoding="utf-8") as f:
+                for info, severity in batch:
+                    f.write(json.dumps({"info": info, "severity": severity}, default=str) + "\n")
+        except OSError as e:
+            logging.error("Failed to spill %d feedback entries: %s", len(batch), e)
+            FEEDBACK_ENTRIES.inc(len(batch), outcome="dropped")
+            return
+        FEEDBACK_ENTRIES.inc(len(batch), outcome="spilled")
+
+    def _replay_spill(self) -> None:
+        """Writes the spilled entries once the sink is reachable again. Never raises."""
+        try:
+            replay_path = self._rotate_spill()
+            if replay_path is not None:
+                self._replay(replay_path)
+        except Exception as e:
+            logging.error("Failed to replay spilled feedback entries: %s", e)
+
+    def _rotate_spill(self) -> Optional[str]:
+        """Moves the spilled entries to the replay file, after those left by an interrupted replay.
+
+        Returns:
+            The path of the replay file, None if there is nothing to replay.
+        """
+        replay_path = self.spill_path + ".replay"
+        with self._spill_lock:
+            if not os.path.exists(self.spill_path):
+                return replay_path if os.path.exists(replay_path) else None
+            if not os.path.exists(replay_path):
+                os.replace(self.spill_path, replay_path)
+                return replay_path
+            with open(self.spill_path, "rb") as spill, open(replay_path, "ab+") as replay:
+                # A last line torn by a crash mid-write is ended, so it does not merge with the next one
+                if replay.seek(0, os.SEEK_END) > 0:
+                    replay.seek(-1, os.SEEK_END)
+                    if replay.read(1) != b"\n":
+                        replay.write(b"\n")
+                for line in spill:
+                    replay.write(line if line.endswith(b"\n") else line + b"\n")
+            os.remove(self.spill_path)
+            return replay_path
+
+    def _replay(self, replay_path: str) -> None:
+        """Writes the entries of the replay file, spilling back those that could not be written."""
+        batch = []
+        malformed = 0
+        with open(replay_path, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    entry = json.loads(line)
+                    batch.append((entry["info"], entry["severity"]))
+                except (ValueError, KeyError, TypeError):
+                    # e.g. the last line of a spill torn by a crash mid-write
+                    malformed += 1
+        if malformed:
+            logging.warning("Skipped %d malformed spilled feedback entries.", malformed)
+            FEEDBACK_ENTRIES.inc(malformed, outcome="malformed")
+
+        for i in range(0, len(batch), self.max_batch_size):
+            chunk = batch[i:i + self.max_batch_size]
+            try:
+                self._write_batch(chunk)
+            except Exception as e:
+                logging.warning("Failed to replay spilled feedback entries: %s", e)
+                self._spill(batch[i:])
+                break
+            FEEDBACK_ENTRIES.inc(len(chunk), outcome="replayed")
+        os.remove(replay_path)
@@ -31,6 +31,14 @@ class InnerInputChat(BaseModel):
     )
     user_id: str = ""
     session_id: str = ""
+    session_version: Optional[int] = Field(
+        None,
+        description=(
+            "The version of the session history the client last saw. When set, "
+            "`messages` only contains the new turn and the server prepends the "
+            "history it stores for `session_id`."
+        ),
+    )
 
 class InputChat(BaseModel):
     """Wrapper class for the inner input."""
@@ -42,6 +50,20 @@ class RootInput(BaseModel):
     input: InputChat
 
 
+class BatchInput(BaseModel):
+    """Represents a batch of independent conversations to run."""
+
+    inputs: List[InnerInputChat] = Field(
+        ..., description="The conversations to run. Each is answered independently."
+    )
+    max_concurrency: Optional[int] = Field(
+        None, description="Maximum number of conversations run at once."
+    )
+    timeout_seconds: Optional[float] = Field(
+        None, description="Maximum number of seconds a single conversation may run."
+    )
+
+
 class Feedback(BaseModel):
     """Represents feedback for a conversation."""
 
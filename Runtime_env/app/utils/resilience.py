@@ -0,0 +1,396 @@
+# Copyright 2025 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# pylint: disable=C0301, C0415, W0718
+"""Module for isolating failing dependencies of the agents (models, search backends).
+
+Each dependency has a circuit breaker. After too many failures in a row the
+circuit opens and calls fail fast, without reaching the dependency, until a
+reset timeout has passed. The circuit is then half-open: a probe call is let
+through, and closes the circuit again if it succeeds.
+
+Transient failures are retried with exponential backoff and full jitter, so
+the retries of concurrent runs do not hit the dependency in waves. A retry is
+only made if the run has enough time left until its deadline to wait for
+the backoff and make the call, and never once the run has been cancelled.
+"""
+import asyncio
+from dataclasses import dataclass
+import functools
+import json
+import logging
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from app.utils.cancellation import RunCancelledError, raise_if_cancelled
+from app.utils.deadline import DeadlineExceededError, has_time_left
+from app.utils.metrics import REGISTRY
+from app.utils.response_cache import mark_uncacheable
+
+CIRCUIT_STATE = REGISTRY.gauge(
+    "circuit_breaker_state",
+    "State of the circuit breaker of each dependency (0 closed, 1 half-open, 2 open).",
+    ["dependency"]
+)
+CIRCUIT_REJECTIONS = REGISTRY.counter(
+    "circuit_breaker_rejections_total",
+    "Number of calls failed fast because the circuit of their dependency was open.",
+    ["dependency"]
+)
+DEPENDENCY_RETRIES = REGISTRY.counter(
+    "dependency_retries_total",
+    "Number of failed dependency calls by retry decision (retried, out_of_time, out_of_attempts).",
+    ["dependency", "result"]
+)
+
+# HTTP statuses of failures that a retry may fix: timeouts, rate limits and server errors (but not implemented)
+_TRANSIENT_STATUSES = frozenset((408, 429, *range(500, 600))) - {501}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a dependency whose circuit is open."""
+
+    def __init__(self, dependency: str, retry_after: float):
+        super().__init__(f"The circuit of {dependency} is open, retry in {retry_after:.0f} s.")
+        self.dependency = dependency
+        self.retry_after = retry_after
+
+
+@functools.lru_cache(maxsize=None)
+def get_transient_error_types() -> Tuple[type, ...]:
+    """Returns the exception types of transient failures, of the client libraries that are installed."""
+    error_types = [TimeoutError, asyncio.TimeoutError, ConnectionError]
+    try:
+        from google.api_core import exceptions as api_exceptions
+
+        error_types.extend((
+            api_exceptions.ServiceUnavailable,
+            api_exceptions.InternalServerError,
+            api_exceptions.TooManyRequests,
+            api_exceptions.ResourceExhausted,
+            api_exceptions.DeadlineExceeded,
+        ))
+    except ImportError:
+        pass
+    try:
+        import requests
+
+        # Used by the search tool wrappers
+        error_types.extend((requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+    except ImportError:
+        pass
+    try:
+        import httpx
+
+        # Used by the Anthropic client of the Claude models
+        error_types.extend((httpx.TimeoutException, httpx.NetworkError, httpx.RemoteProtocolError))
+    except ImportError:
+        pass
+    try:
+        import anthropic
+
+        error_types.append(anthropic.APIConnectionError)
+    except ImportError:
+        pass
+    return tuple(error_types)
+
+
+def get_error_status(error: BaseException) -> Optional[int]:
+    """Returns the HTTP status of an error (google.api_core, requests, Anthropic), None if it has none."""
+    status = getattr(error, "code", None)
+    if not isinstance(status, int):
+        status = getattr(error, "status_code", None)
+    if not isinstance(status, int):
+        # HTTP errors of requests, used by the search tool wrappers
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def is_transient_error(error: BaseException) -> bool:
+    """Whether a call failing with an error may succeed if made again.
+
+    Only known transient failures are: the service is unavailable or
+    overloaded (HTTP 408, 429 and 5xx but 501, and their google.api_core
+    exceptions), timeouts and connection errors. Any other error, such as an
+    invalid request, a programming error or the end of the run (deadline,
+    cancellation, open circuit), is not.
+    """
+    if isinstance(error, (DeadlineExceededError, RunCancelledError, CircuitOpenError, asyncio.CancelledError)):
+        return False
+    if isinstance(error, get_transient_error_types()):
+        return True
+    return get_error_status(error) in _TRANSIENT_STATUSES
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker of one dependency.
+
+    The circuit is closed while calls succeed. After `failure_threshold`
+    transient failures in a row it opens, and `allow` rejects every call for
+    `reset_timeout` seconds. It is then half-open: `half_open_calls` probe
+    calls are let through at a time, the first success closes the circuit and
+    a failure opens it again.
+    """
+
+    CLOSED = "closed"
+    HALF_OPEN = "half_open"
+    OPEN = "open"
+    _STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0, half_open_calls: int = 1):
+        """
+        Initializes the CircuitBreaker.
+
+        Args:
+            name: The name of the dependency, for the metrics.
+            failure_threshold: Number of failures in a row opening the circuit.
+            reset_timeout: Number of seconds the circuit stays open before a probe call.
+            half_open_calls: Number of concurrent probe calls while half-open.
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_calls = half_open_calls
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+        self._lock = threading.Lock()
+        CIRCUIT_STATE.set(0, dependency=name)
+
+    def _set_state(self, state: str) -> None:
+        if state != self._state:
+            logging.warning("Circuit of %s is now %s.", self.name, state)
+        self._state = state
+        CIRCUIT_STATE.set(self._STATE_VALUES[state], dependency=self.name)
+
+    @property
+    def state(self) -> str:
+        """The state of the circuit, half-open once the reset timeout of an open circuit has passed."""
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                return self.HALF_OPEN
+            return self._state
+
+    def retry_after(self) -> float:
+        """Number of seconds until the circuit lets a probe call through, 0 if it lets calls through."""
+        with self._lock:
+            if self._state != self.OPEN:
+                return 0.0
+            return max(self._opened_at + self.reset_timeout - time.monotonic(), 0.0)
+
+    def allow(self) -> bool:
+        """Whether a call may be made now. A call let through must be followed by one `record_*` call."""
+        with self._lock:
+            if self._state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    return False
+                self._set_state(self.HALF_OPEN)
+                self._probes = 0
+            if self._state == self.HALF_OPEN:
+                if self._probes >= self.half_open_calls:
+                    return False
+                self._probes += 1
+            return True
+
+    def check(self) -> None:
+        """Raises CircuitOpenError, counting the rejection, unless a call may be made now."""
+        if not self.allow():
+            CIRCUIT_REJECTIONS.inc(dependency=self.name)
+            raise CircuitOpenError(self.name, self.retry_after())
+
+    def record_success(self) -> None:
+        """Records a successful call, closing a half-open circuit."""
+        with self._lock:
+            self._failures = 0
+            if self._state == self.HALF_OPEN:
+                self._probes = max(self._probes - 1, 0)
+            self._set_state(self.CLOSED)
+
+    def record_failure(self) -> None:
+        """Records a transient failure, opening the circuit after too many in a row or a failed probe."""
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+                self._probes = 0
+                self._set_state(self.OPEN)
+
+    def record_abandoned(self) -> None:
+        """Records a call let through but abandoned before its outcome (e.g. a cancelled hedge)."""
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._probes = max(self._probes - 1, 0)
+
+    def record(self, error: BaseException) -> None:
+        """Records a failed call: a failure if the error is transient, else an abandoned call."""
+        if is_transient_error(error):
+            self.record_failure()
+        else:
+            self.record_abandoned()
+
+
+class CircuitBreakerRegistry:
+    """Creates the circuit breaker of each dependency on first use and shares it process-wide."""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        """
+        Initializes the CircuitBreakerRegistry.
+
+        Args:
+            failure_threshold: Number of failures in a row opening a circuit.
+            reset_timeout: Number of seconds a circuit stays open before a probe call.
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> CircuitBreaker:
+        """Returns the circuit breaker of a dependency, creating it on first use."""
+        with self._lock:
+            if name not in self._breakers:
+                self._breakers[name] = CircuitBreaker(name, self.failure_threshold, self.reset_timeout)
+            return self._breakers[name]
+
+    def stats(self) -> Dict[str, str]:
+        """Returns the state of each circuit."""
+        with self._lock:
+            breakers = list(self._breakers.values())
+        return {breaker.name: breaker.state for breaker in breakers}
+
+
+@dataclass
+class RetryPolicy:
+    """When to retry a failed call, and how long to wait before.
+
+    Attributes:
+        max_attempts: Maximum number of calls, including the first one.
+        base_delay: Upper bound of the first backoff, in seconds.
+        max_delay: Upper bound of every backoff, in seconds.
+        min_remaining: Seconds the run must have left after the backoff to retry.
+    """
+
+    max_attempts: int = 3
+    base_delay: float = 0.5
+    max_delay: float = 8.0
+    min_remaining: float = 2.0
+
+    def backoff(self, attempt: int) -> float:
+        """Returns a random wait before the retry following the `attempt`-th call (full jitter)."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+    def next_delay(self, dependency: str, attempt: int, error: BaseException) -> Optional[float]:
+        """Decides whether to retry after the `attempt`-th call failed.
+
+        Args:
+            dependency: The name of the dependency, for the metrics.
+            attempt: The number of calls made so far.
+            error: The error of the last call.
+
+        Returns:
+            The number of seconds to wait before retrying, None to give up.
+        """
+        if not is_transient_error(error):
+            return None
+        if attempt >= self.max_attempts:
+            DEPENDENCY_RETRIES.inc(dependency=dependency, result="out_of_attempts")
+            return None
+        delay = self.backoff(attempt)
+        if not has_time_left(delay + self.min_remaining):
+            DEPENDENCY_RETRIES.inc(dependency=dependency, result="out_of_time")
+            return None
+        DEPENDENCY_RETRIES.inc(dependency=dependency, result="retried")
+        return delay
+
+
+def call_with_retry(breaker: CircuitBreaker, policy: RetryPolicy, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """Calls a dependency through its circuit breaker, retrying transient failures.
+
+    Args:
+        breaker: The circuit breaker of the dependency.
+        policy: When to retry and how long to wait before.
+        func: Calls the dependency.
+        *args: The positional arguments of `func`.
+        **kwargs: The keyword arguments of `func`.
+
+    Returns:
+        The result of `func`.
+
+    Exception:
+        CircuitOpenError: The circuit of the dependency is open.
+    """
+    attempt = 0
+    while True:
+        breaker.check()
+        attempt += 1
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            breaker.record(e)
+            delay = policy.next_delay(breaker.name, attempt, e)
+            if delay is None:
+                raise
+            logging.info("Retrying %s in %.2f s after attempt %d failed: %s", breaker.name, delay, attempt, e)
+            time.sleep(delay)
+            raise_if_cancelled()
+            continue
+        breaker.record_success()
+        return result
+
+
+def resilient_tool(
+    func: Optional[Callable[..., Any]] = None,
+    *,
+    breaker: CircuitBreaker,
+    policy: RetryPolicy,
+    fallback: Optional[Callable[[str], Any]] = None
+) -> Callable[..., Any]:
+    """Decorator calling a tool through the circuit breaker of its backend, retrying transient failures.
+
+    While the circuit is open, the tool fails fast and the agent gets a JSON
+    notice (status, tool, dependency, retry_after_seconds, message) telling
+    it not to call the tool again, so it answers with what it has instead of
+    looping on a failing backend.
+
+    Args:
+        func: The tool function.
+        breaker: The circuit breaker of the backend of the tool.
+        policy: When to retry and how long to wait before.
+        fallback: Builds the tool result from the notice. Defaults to the notice itself.
+    """
+    if func is None:
+        return functools.partial(resilient_tool, breaker=breaker, policy=policy, fallback=fallback)
+
+    @functools.wraps(func)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        try:
+            return call_with_retry(breaker, policy, func, *args, **kwargs)
+        except CircuitOpenError as e:
+            notice = json.dumps({
+                "status": "unavailable",
+                "tool": func.__name__,
+                "dependency": e.dependency,
+                "retry_after_seconds": round(e.retry_after),
+                "message": (
+                    f"The {func.__name__} tool is temporarily unavailable. Do not call it again for this "
+                    "request. Answer with the information gathered so far."
+                ),
+            })
+            mark_uncacheable()
+            return fallback(notice) if fallback else notice
+
+    return wrapper
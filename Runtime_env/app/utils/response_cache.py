@@ -0,0 +1,271 @@
+# Copyright 2025 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# pylint: disable=C0301
+"""Module for caching the streamed responses of repeated conversations.
+
+A response is cached under a hash of the normalized conversation and of the
+agent answering it (model, industry, framework, tools, ...). A hit replays
+the recorded chunks, with the run_id of the new run, so the client receives
+the same stream as if the agent had run. Entries live in an in-memory LRU,
+optionally backed by a SQLite file shared by the workers of the host.
+
+Only runs that succeeded with every tool are cached. Tools returning live
+data (news, quotes, search results) are decorated with `volatile_tool`, and
+their runs are not cached, nor are runs whose tools were cut short.
+"""
+import collections
+from dataclasses import dataclass
+import functools
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from app.utils.metrics import REGISTRY
+from app.utils.serialization import stdlib_dumps
+from app.utils.stage_metrics import get_run_metrics
+
+RESPONSE_CACHE_REQUESTS = REGISTRY.counter(
+    "response_cache_requests_total",
+    "Number of response cache lookups by result (hit, miss, bypass).",
+    ["result"]
+)
+RESPONSE_CACHE_ENTRIES = REGISTRY.gauge(
+    "response_cache_entries",
+    "Number of responses cached in memory."
+)
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: Any) -> str:
+    """Normalizes a message content for the cache key (case and whitespace)."""
+    if not isinstance(text, str):
+        text = json.dumps(text, sort_keys=True, default=str)
+    return _WHITESPACE.sub(" ", text).strip().casefold()
+
+
+def make_cache_key(messages: List[Dict[str, Any]], **scope: Any) -> str:
+    """Returns the cache key of a conversation.
+
+    Args:
+        messages: The messages of the conversation, ending with the new one.
+        **scope: What else determines the answer (model, industry, framework, tools, ...).
+
+    Returns:
+        A hex digest of the normalized messages and scope.
+    """
+    payload = {
+        "messages": [[message.get("type"), normalize_text(message.get("content"))] for message in messages],
+        "scope": scope,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def get_first_turn_question(messages: List[Dict[str, Any]]) -> Optional[str]:
+    """Returns the question of a conversation made of a single user turn, None otherwise.
+
+    Such questions (suggestion cards, FAQs) can be answered without context,
+    which makes them safe to match by meaning in the semantic cache.
+    """
+    if len(messages) != 1 or messages[0].get("type") != "human":
+        return None
+    content = messages[0].get("content")
+    return content if isinstance(content, str) and content.strip() else None
+
+
+def get_cache_mode(cache_control: Optional[str]) -> str:
+    """Maps the `Cache-Control` header of a request to a response cache mode.
+
+    Args:
+        cache_control: The header value, may be None.
+
+    Returns:
+        `bypass` for `no-store` (neither read nor written), `refresh` for
+        `no-cache` (run the agent and record its answer), `use` otherwise.
+    """
+    directives = {directive.strip().lower() for directive in (cache_control or "").split(",")}
+    if "no-store" in directives:
+        return "bypass"
+    if "no-cache" in directives:
+        return "refresh"
+    return "use"
+
+
+def mark_uncacheable() -> None:
+    """Keeps the answer of the current run out of the response cache."""
+    run = get_run_metrics()
+    if run is not None:
+        run.cacheable = False
+
+
+def volatile_tool(func: Callable[..., Any]) -> Callable[..., Any]:
+    """Decorator keeping the answers of the runs calling a tool out of the response cache.
+
+    For tools returning live data, whose answers would be stale when replayed.
+    The wrapper keeps the signature and docstring of the tool, so it can be
+    passed to `StructuredTool.from_function` and `FunctionTool.from_defaults`.
+    """
+
+    @functools.wraps(func)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        mark_uncacheable()
+        return func(*args, **kwargs)
+
+    return wrapper
+
+
+def replace_run_id(obj: Any, old_run_id: str, new_run_id: str) -> Any:
+    """Returns a copy of a recorded chunk with the run_id of another run."""
+    if isinstance(obj, dict):
+        return {key: replace_run_id(value, old_run_id, new_run_id) for key, value in obj.items()}
+    if isinstance(obj, list):
+        return [replace_run_id(value, old_run_id, new_run_id) for value in obj]
+    if obj == old_run_id:
+        return new_run_id
+    return obj
+
+
+@dataclass
+class CachedResponse:
+    """The recorded chunks of a response.
+
+    Attributes:
+        run_id: The run_id of the recorded run.
+        chunks: The chunks of the response, as JSON compatible objects.
+        expires_at: When the entry expires (epoch seconds).
+    """
+
+    run_id: str
+    chunks: List[Any]
+    expires_at: float
+
+    def replay(self, run_id: str) -> List[Any]:
+        """Returns the chunks with the run_id of the replaying run."""
+        return [replace_run_id(chunk, self.run_id, run_id) for chunk in self.chunks]
+
+
+class ResponseCache:
+    """
+    LRU cache of recorded responses with a TTL, optionally backed by SQLite.
+
+    Lookups check memory first, then the SQLite file. Entries found on disk
+    are loaded back into memory.
+    """
+
+    def __init__(self, ttl: float, max_entries: int, path: str = ""):
+        """
+        Initializes the ResponseCache.
+
+        Args:
+            ttl: Number of seconds a response stays cached.
+            max_entries: Maximum number of responses kept in memory.
+            path: The path of the SQLite file, empty to only cache in memory.
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.path = path
+
+        self._entries: "collections.OrderedDict[str, CachedResponse]" = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+
+    def _get_connection(self) -> sqlite3.Connection:
+        """Opens the SQLite file on first use."""
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "cache_key TEXT PRIMARY KEY, run_id TEXT NOT NULL, chunks TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._connection.commit()
+        return self._connection
+
+    def _put(self, key: str, response: CachedResponse) -> None:
+        """Stores a response in memory, evicting the least recently used ones."""
+        self._entries[key] = response
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        RESPONSE_CACHE_ENTRIES.set(len(self._entries))
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        """Returns the cached response of a key, None if missing or expired."""
+        response = self._get(key)
+        RESPONSE_CACHE_REQUESTS.inc(result="hit" if response is not None else "miss")
+        return response
+
+    def _get(self, key: str) -> Optional[CachedResponse]:
+        now = time.time()
+        with self._lock:
+            response = self._entries.get(key)
+            if response is not None:
+                if response.expires_at > now:
+                    self._entries.move_to_end(key)
+                    return response
+                del self._entries[key]
+                RESPONSE_CACHE_ENTRIES.set(len(self._entries))
+
+            if not self.path:
+                return None
+            row = self._get_connection().execute(
+                "SELECT run_id, chunks, expires_at FROM responses WHERE cache_key = ? AND expires_at > ?", (key, now)
+            ).fetchone()
+            if row is None:
+                return None
+            response = CachedResponse(run_id=row[0], chunks=json.loads(row[1]), expires_at=row[2])
+            self._put(key, response)
+            return response
+
+    def put(self, key: str, run_id: str, chunks: List[Any]) -> CachedResponse:
+        """Records the chunks of a response.
+
+        Args:
+            key: The cache key of the conversation.
+            run_id: The run_id of the recorded run.
+            chunks: The chunks streamed by the agent.
+
+        Returns:
+            The recorded response.
+        """
+        # Round trip through JSON, so memory and disk entries replay the same
+        encoded = b"[" + b",".join(stdlib_dumps(chunk) for chunk in chunks) + b"]"
+        response = CachedResponse(run_id=run_id, chunks=json.loads(encoded), expires_at=time.time() + self.ttl)
+        with self._lock:
+            self._put(key, response)
+            if self.path:
+                connection = self._get_connection()
+                connection.execute(
+                    "INSERT OR REPLACE INTO responses (cache_key, run_id, chunks, expires_at) VALUES (?, ?, ?, ?)",
+                    (key, run_id, encoded.decode("utf-8"), response.expires_at)
+                )
+                connection.execute("DELETE FROM responses WHERE expires_at <= ?", (time.time(),))
+                connection.commit()
+        return response
+
+    def clear(self) -> None:
+        """Drops every cached response."""
+        with self._lock:
+            self._entries.clear()
+            RESPONSE_CACHE_ENTRIES.set(0)
+            if self.path:
+                self._get_connection().execute("DELETE FROM responses")
+                self._get_connection().commit()
+
+    def stats(self) -> Dict[str, int]:
+        """Returns the number of responses cached in memory."""
+        return {"entries": len(self._entries)}
@@ -0,0 +1,275 @@
+# Copyright 2025 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# pylint: disable=C0301, C0415
+"""Module for the semantic response cache.
+
+The exact-match response cache misses paraphrases of a question. The semantic
+cache embeds the last user turn and looks up the nearest cached question in a
+NumPy index. If it is similar enough, its recorded answer is replayed. Entries
+are scoped (industry, data store and agent), so an answer is only reused by
+the agent that gave it, and expire after a TTL.
+
+Embeddings score questions differing by a negation or a period ("Should I
+buy Tesla stock?" and "Should I not buy Tesla stock?", "revenue in Q3 2023"
+and "revenue in Q3 2024") as near duplicates, although their answers
+differ. Questions only match if they have the same negations and numbers.
+"""
+import re
+import threading
+import time
+from typing import Callable, Dict, FrozenSet, Hashable, List, Optional, Tuple
+import zlib
+
+import numpy as np
+
+from app.utils.metrics import REGISTRY
+from app.utils.response_cache import CachedResponse
+
+SEMANTIC_CACHE_REQUESTS = REGISTRY.counter(
+    "semantic_cache_requests_total",
+    "Number of semantic cache lookups by result (hit, miss).",
+    ["result"]
+)
+SEMANTIC_CACHE_SIMILARITY = REGISTRY.histogram(
+    "semantic_cache_similarity",
+    "Similarity of the nearest cached question of each lookup, to tune the threshold.",
+    buckets=(0.5, 0.6, 0.7, 0.8, 0.85, 0.9, 0.95, 0.98, 1.0)
+)
+
+# Embeds texts into L2-normalized vectors, one row per text
+Embedder = Callable[[List[str]], np.ndarray]
+
+_TOKEN = re.compile(r"[^\W_]+")
+_STOPWORDS = frozenset((
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "could", "did", "do", "does", "for",
+    "from", "give", "how", "i", "in", "is", "it", "me", "of", "on", "or", "please", "show", "tell",
+    "that", "the", "this", "to", "us", "was", "were", "what", "whats", "which", "with", "you",
+))
+
+
+# Words reversing the meaning of a question, and words naming a period (e.g. "third quarter", "last year")
+_NEGATIONS = frozenset((
+    "not", "no", "never", "nor", "none", "neither", "without", "cannot", "cant", "dont", "doesnt",
+    "didnt", "isnt", "arent", "wasnt", "werent", "wont", "shouldnt", "wouldnt", "couldnt",
+))
+_PERIOD_WORDS = frozenset((
+    "first", "second", "third", "fourth", "last", "next", "previous", "current",
+))
+_NEGATED_VERB = re.compile(r"\b(\w+)n['’]t\b")
+
+
+def get_hard_terms(text: str) -> FrozenSet[str]:
+    """Returns the terms two questions must share to have the same answer: negations, numbers and periods.
+
+    Negations are reduced to a single `not` term, numbers are kept with the
+    letters attached to them (e.g. `q3`, `fy2024`, `2023`).
+    """
+    text = _NEGATED_VERB.sub(r"\1 not", text.casefold())
+    terms = set()
+    for word in _TOKEN.findall(text):
+        if word in _NEGATIONS:
+            terms.add("not")
+        elif word in _PERIOD_WORDS or any(character.isdigit() for character in word):
+            terms.add(word)
+    return frozenset(terms)
+
+
+class HashingEmbedder:
+    """
+    Deterministic local embedder hashing words and character trigrams.
+
+    It needs no model, so lookups take microseconds, and it matches
+    reworded questions sharing most of their terms (e.g. "Q3 revenue for
+    Alphabet?" and "What was Alphabet's revenue in Q3?").
+    """
+
+    def __init__(self, dimension: int = 1024):
+        """
+        Initializes the HashingEmbedder.
+
+        Args:
+            dimension: The size of the vectors.
+        """
+        self.dimension = dimension
+
+    def features(self, text: str) -> List[Tuple[str, float]]:
+        """Returns the weighted features of a text: its words and their character trigrams."""
+        words = [word for word in _TOKEN.findall(text.casefold()) if len(word) > 1 and word not in _STOPWORDS]
+        features = [(f"w:{word}", 1.0) for word in words]
+        for word in words:
+            padded = f"<{word}>"
+            features.extend((f"c:{padded[i:i + 3]}", 0.25) for i in range(len(padded) - 2))
+        return features
+
+    def __call__(self, texts: List[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature, weight in self.features(text):
+                bucket = zlib.crc32(feature.encode("utf-8"))
+                sign = 1.0 if bucket & 0x80000000 else -1.0
+                vectors[row, bucket % self.dimension] += sign * weight
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+
+class VertexEmbedder:
+    """Embeds texts with a Vertex AI text embedding model (e.g. text-embedding-005)."""
+
+    def __init__(self, model_name: str):
+        """
+        Initializes the VertexEmbedder.
+
+        Args:
+            model_name: The name of the Vertex AI text embedding model.
+        """
+        from vertexai.language_models import TextEmbeddingModel
+
+        from app.orchestration.clients import init_vertexai
+
+        init_vertexai()
+        self.model = TextEmbeddingModel.from_pretrained(model_name)
+
+    def __call__(self, texts: List[str]) -> np.ndarray:
+        from vertexai.language_models import TextEmbeddingInput
+
+        embeddings = self.model.get_embeddings([TextEmbeddingInput(text, "SEMANTIC_SIMILARITY") for text in texts])
+        vectors = np.array([embedding.values for embedding in embeddings], dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+
+def get_embedder(name: str) -> Embedder:
+    """Returns the embedder named in the configuration: `hashing`, or a Vertex AI embedding model name."""
+    if name == "hashing":
+        return HashingEmbedder()
+    return VertexEmbedder(name)
+
+
+class _ScopeIndex:
+    """The cached questions of one scope: their vectors, answers and expiry."""
+
+    def __init__(self, dimension: int, capacity: int = 64):
+        self.vectors = np.zeros((capacity, dimension), dtype=np.float32)
+        self.expires_at = np.zeros(capacity, dtype=np.float64)
+        self.hard_terms: List[FrozenSet[str]] = []
+        self.responses: List[CachedResponse] = []
+
+    def __len__(self) -> int:
+        return len(self.responses)
+
+    def compact(self, now: float, max_entries: int) -> None:
+        """Drops the expired entries, then the oldest ones beyond `max_entries - 1`."""
+        count = len(self.responses)
+        keep = np.flatnonzero(self.expires_at[:count] > now)
+        keep = keep[max(len(keep) - max_entries + 1, 0):]
+        if len(keep) == count:
+            return
+        self.vectors[:len(keep)] = self.vectors[keep]
+        self.expires_at[:len(keep)] = self.expires_at[keep]
+        self.expires_at[len(keep):count] = 0
+        self.hard_terms = [self.hard_terms[index] for index in keep]
+        self.responses = [self.responses[index] for index in keep]
+
+    def add(self, vector: np.ndarray, hard_terms: FrozenSet[str], response: CachedResponse) -> None:
+        count = len(self.responses)
+        if count == len(self.vectors):
+            self.vectors = np.concatenate([self.vectors, np.zeros_like(self.vectors)])
+            self.expires_at = np.concatenate([self.expires_at, np.zeros_like(self.expires_at)])
+        self.vectors[count] = vector
+        self.expires_at[count] = response.expires_at
+        self.hard_terms.append(hard_terms)
+        self.responses.append(response)
+
+
+class SemanticCache:
+    """
+    Nearest-neighbor cache of answers, keyed by the embedding of the question.
+
+    Each scope has its own index. A lookup returns the answer of the most
+    similar unexpired question of the scope with the same negations and
+    numbers (see `get_hard_terms`), if its cosine similarity is at least
+    `threshold`.
+    """
+
+    def __init__(self, embedder: Embedder, threshold: float, ttl: float, max_entries: int):
+        """
+        Initializes the SemanticCache.
+
+        Args:
+            embedder: Embeds texts into L2-normalized vectors.
+            threshold: The minimum cosine similarity of a hit, between 0 and 1.
+            ttl: Number of seconds an answer stays cached.
+            max_entries: Maximum number of answers cached per scope. The oldest are evicted first.
+        """
+        self.embedder = embedder
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._indexes: Dict[Hashable, _ScopeIndex] = {}
+        self._lock = threading.Lock()
+
+    def get(self, scope: Hashable, question: str) -> Optional[CachedResponse]:
+        """Returns the cached answer of the nearest question of the scope, if similar enough.
+
+        Args:
+            scope: Identifies what the answer depends on besides the question.
+            question: The last user turn.
+
+        Returns:
+            The cached answer, or None on a miss.
+        """
+        vector = self.embedder([question])[0]
+        hard_terms = get_hard_terms(question)
+        now = time.time()
+        with self._lock:
+            index = self._indexes.get(scope)
+            count = len(index) if index is not None else 0
+            if count == 0:
+                SEMANTIC_CACHE_REQUESTS.inc(result="miss")
+                return None
+            similarities = index.vectors[:count] @ vector
+            similarities[index.expires_at[:count] <= now] = -1.0
+            similarities[[terms != hard_terms for terms in index.hard_terms]] = -1.0
+            best = int(np.argmax(similarities))
+            similarity = float(similarities[best])
+            response = index.responses[best]
+
+        SEMANTIC_CACHE_SIMILARITY.observe(max(similarity, 0.0))
+        if similarity < self.threshold:
+            SEMANTIC_CACHE_REQUESTS.inc(result="miss")
+            return None
+        SEMANTIC_CACHE_REQUESTS.inc(result="hit")
+        return response
+
+    def put(self, scope: Hashable, question: str, response: CachedResponse) -> None:
+        """Caches the answer to a question.
+
+        Args:
+            scope: Identifies what the answer depends on besides the question.
+            question: The last user turn.
+            response: The recorded answer.
+        """
+        vector = self.embedder([question])[0]
+        response = CachedResponse(run_id=response.run_id, chunks=response.chunks, expires_at=time.time() + self.ttl)
+        with self._lock:
+            index = self._indexes.get(scope)
+            if index is None:
+                index = self._indexes[scope] = _ScopeIndex(len(vector))
+            index.compact(time.time(), self.max_entries)
+            index.add(vector, get_hard_terms(question), response)
+
+    def stats(self) -> Dict[str, int]:
+        """Returns the number of scopes and cached answers."""
+        with self._lock:
+            return {"scopes": len(self._indexes), "entries": sum(len(index) for index in self._indexes.values())}
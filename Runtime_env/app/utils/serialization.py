@@ -0,0 +1,175 @@
+# Copyright 2025 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# pylint: disable=C0301
+"""Module for encoding the streamed agent output as newline delimited JSON.
+
+The JSON library is pluggable. A fast native library (orjson) is used when it
+is installed, with the standard library as fallback.
+"""
+import json
+import logging
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from app.utils.input_types import default_serialization
+
+JsonDumps = Callable[[Any], bytes]
+
+# Stands in for the message content when pre-encoding an envelope template
+_CONTENT_PLACEHOLDER = "\x00agentsmithy-content\x00"
+
+# The keys of a plain single message envelope, as built by `get_response_obj`
+_MESSAGE_KEYS = {"lc", "type", "id", "kwargs"}
+_MESSAGE_KWARGS_KEYS = {"content", "type", "tool_calls", "invalid_tool_calls", "id"}
+
+
+def stdlib_dumps(obj: Any) -> bytes:
+    """Encodes an object to compact JSON bytes with the standard library."""
+    return json.dumps(obj, default=default_serialization, separators=(",", ":")).encode()
+
+
+def _get_orjson_dumps() -> Optional[JsonDumps]:
+    """Returns an orjson based encoder, or None if orjson is not installed."""
+    try:
+        import orjson # pylint: disable=C0415
+    except ImportError:
+        return None
+
+    def orjson_dumps(obj: Any) -> bytes:
+        """Encodes an object to JSON bytes with orjson, falling back to the standard library."""
+        try:
+            return orjson.dumps(obj, default=default_serialization, option=orjson.OPT_NON_STR_KEYS)
+        except (TypeError, orjson.JSONEncodeError):
+            # e.g. integers larger than 64 bits
+            return stdlib_dumps(obj)
+
+    return orjson_dumps
+
+
+_JSON_ENCODERS: Dict[str, Callable[[], Optional[JsonDumps]]] = {
+    "orjson": _get_orjson_dumps,
+    "json": lambda: stdlib_dumps,
+}
+
+
+def register_json_encoder(name: str, factory: Callable[[], Optional[JsonDumps]]) -> None:
+    """Registers a JSON encoder that can be selected by name.
+
+    Args:
+        name: The name used to select the encoder (e.g. via JSON_ENCODER).
+        factory: A callable returning the encoder, or None if it is unavailable.
+    """
+    _JSON_ENCODERS[name] = factory
+
+
+def get_json_dumps(name: str = "auto") -> JsonDumps:
+    """Returns the JSON encoder to use for the event stream.
+
+    Args:
+        name: The name of a registered encoder, or `auto` to prefer orjson.
+
+    Returns:
+        A callable encoding an object to JSON bytes.
+    """
+    if name == "auto":
+        return _get_orjson_dumps() or stdlib_dumps
+
+    factory = _JSON_ENCODERS.get(name)
+    dumps = factory() if factory else None
+    if dumps is None:
+        logging.warning("JSON encoder %s is not available, falling back to the standard library.", name)
+        return stdlib_dumps
+    return dumps
+
+
+class StreamEncoder:
+    """
+    Encodes the chunks of one agent run as newline delimited JSON bytes.
+
+    Most chunks are plain single message envelopes that only differ in their
+    content. For those, everything around the content is encoded once per run
+    and only the content itself is encoded per chunk. Any other chunk is
+    encoded in full.
+    """
+
+    def __init__(self, dumps: Optional[JsonDumps] = None):
+        """
+        Initializes the StreamEncoder.
+
+        Args:
+            dumps: The JSON encoder to use. Defaults to `get_json_dumps()`.
+        """
+        self._dumps = dumps or get_json_dumps()
+        # template key -> (bytes before the content, bytes after the content)
+        self._templates: Dict[Tuple, Tuple[bytes, bytes]] = {}
+
+    @staticmethod
+    def _get_template_key(data: Any) -> Optional[Tuple]:
+        """Returns the key of the envelope template matching a chunk, if any."""
+        if type(data) is not dict or len(data) != 1: # pylint: disable=C0123
+            return None
+        agent = data.get("agent")
+        if type(agent) is not dict or len(agent) != 1: # pylint: disable=C0123
+            return None
+        messages = agent.get("messages")
+        if type(messages) is not list or len(messages) != 1: # pylint: disable=C0123
+            return None
+        message = messages[0]
+        if type(message) is not dict or message.keys() != _MESSAGE_KEYS: # pylint: disable=C0123
+            return None
+        kwargs = message["kwargs"]
+        if (
+            type(kwargs) is not dict # pylint: disable=C0123
+            or kwargs.keys() != _MESSAGE_KWARGS_KEYS
+            or type(kwargs["content"]) is not str # pylint: disable=C0123
+            or kwargs["tool_calls"]
+            or kwargs["invalid_tool_calls"]
+        ):
+            return None
+        try:
+            return (message["lc"], message["type"], tuple(message["id"]), kwargs["type"], kwargs["id"])
+        except TypeError:
+            return None
+
+    def _build_template(self, data: Dict) -> Tuple[bytes, bytes]:
+        """Pre-encodes the parts of an envelope around its content."""
+        message = data["agent"]["messages"][0]
+        placeholder = {
+            "agent": {
+                "messages": [
+                    {**message, "kwargs": {**message["kwargs"], "content": _CONTENT_PLACEHOLDER}}
+                ]
+            }
+        }
+        encoded = self._dumps(placeholder)
+        prefix, suffix = encoded.split(self._dumps(_CONTENT_PLACEHOLDER), 1)
+        return prefix, suffix + b"\n"
+
+    def encode(self, data: Any) -> bytes:
+        """Encodes one chunk as a line of JSON.
+
+        Args:
+            data: The chunk yielded by the agent manager.
+
+        Returns:
+            The JSON encoded chunk followed by a newline.
+        """
+        key = self._get_template_key(data)
+        if key is None:
+            return self._dumps(data) + b"\n"
+
+        template = self._templates.get(key)
+        if template is None:
+            template = self._templates[key] = self._build_template(data)
+        prefix, suffix = template
+        return prefix + self._dumps(data["agent"]["messages"][0]["kwargs"]["content"]) + suffix
@@ -0,0 +1,268 @@
+# Copyright 2025 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# pylint: disable=C0301
+"""Module for storing the canonical conversation history of each chat session.
+
+Clients using the session-delta protocol only send the new turn together with
+the version of the history they last saw. The version of a session is the
+number of messages stored for it, so a completed turn (human + ai) advances it
+by two. Sessions are scoped by user, a session is only visible under the
+user_id it was created with.
+"""
+import collections
+from dataclasses import dataclass, field
+import json
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+# (user_id, session_id) of a stored session
+SessionKey = Tuple[str, str]
+
+
+@dataclass
+class SessionHistory:
+    """The stored messages of a session and its current version."""
+
+    messages: List[Dict[str, str]] = field(default_factory=list)
+
+    @property
+    def version(self) -> int:
+        """The version of the history, i.e. the number of stored messages."""
+        return len(self.messages)
+
+    @property
+    def size(self) -> int:
+        """An approximation of the memory used by the messages in bytes."""
+        return sum(len(msg["content"]) + len(msg["type"]) for msg in self.messages)
+
+
+class SessionConflictError(Exception):
+    """Raised when a client's session version does not match the stored one.
+
+    Attributes:
+        current_version: The version currently stored on the server.
+    """
+
+    def __init__(self, message: str, current_version: int):
+        super().__init__(message)
+        self.current_version = current_version
+
+
+def to_stored_message(message: Dict[str, Any]) -> Dict[str, str]:
+    """Reduces a message dictionary to the fields kept in the session store."""
+    content = message.get("content", "")
+    if not isinstance(content, str):
+        content = json.dumps(content)
+    return {"type": message["type"], "content": content}
+
+
+def get_ai_message_content(chunk: Dict[str, Any]) -> str:
+    """Returns the text of the AI message carried by a streamed chunk, if any.
+
+    Args:
+        chunk: A response object yielded by an agent manager.
+
+    Returns:
+        The AI message content, or an empty string if the chunk carries none.
+    """
+    try:
+        message = chunk["agent"]["messages"][-1]
+        kwargs = message["kwargs"]
+    except (KeyError, IndexError, TypeError):
+        return ""
+    if kwargs.get("type") != "ai":
+        return ""
+    content = kwargs.get("content") or ""
+    if isinstance(content, list):
+        content = "".join(
+            part if isinstance(part, str) else part.get("text", "")
+            for part in content
+        )
+    return content
+
+
+class SessionHistoryStore:
+    """
+    Memory-bounded LRU store of session histories that spills to SQLite.
+
+    Recently used sessions are kept in memory. Once the total size of the
+    in-memory histories exceeds `max_memory_bytes`, the least recently used
+    sessions are written to a local SQLite file and loaded back on next use.
+    """
+
+    def __init__(self, path: str, max_memory_bytes: int):
+        """
+        Initializes the SessionHistoryStore.
+
+        Args:
+            path: The path of the SQLite file used for spilled sessions.
+            max_memory_bytes: The approximate number of bytes of history kept in memory.
+        """
+        self.path = path
+        self.max_memory_bytes = max_memory_bytes
+
+        self._sessions: "collections.OrderedDict[SessionKey, SessionHistory]" = collections.OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+
+    def _get_connection(self) -> sqlite3.Connection:
+        """Opens the SQLite file on first use."""
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS user_sessions ("
+                "user_id TEXT NOT NULL, session_id TEXT NOT NULL, messages TEXT NOT NULL, "
+                "updated_at REAL NOT NULL, PRIMARY KEY (user_id, session_id))"
+            )
+            self._connection.commit()
+        return self._connection
+
+    def _load(self, key: SessionKey) -> SessionHistory:
+        """Returns the history from memory, falling back to the SQLite file."""
+        history = self._sessions.get(key)
+        if history is not None:
+            self._sessions.move_to_end(key)
+            return history
+
+        row = self._get_connection().execute(
+            "SELECT messages FROM user_sessions WHERE user_id = ? AND session_id = ?", key
+        ).fetchone()
+        history = SessionHistory(messages=json.loads(row[0]) if row else [])
+        self._put(key, history)
+        return history
+
+    def _put(self, key: SessionKey, history: SessionHistory) -> None:
+        """Stores the history in memory, spilling least recently used sessions."""
+        previous = self._sessions.pop(key, None)
+        if previous is not None:
+            self._memory_bytes -= previous.size
+        self._sessions[key] = history
+        self._memory_bytes += history.size
+
+        while self._memory_bytes > self.max_memory_bytes and len(self._sessions) > 1:
+            evicted_key, evicted = self._sessions.popitem(last=False)
+            self._memory_bytes -= evicted.size
+            self._spill(evicted_key, evicted)
+
+    def _spill(self, key: SessionKey, history: SessionHistory) -> None:
+        """Writes an evicted session to the SQLite file."""
+        connection = self._get_connection()
+        connection.execute(
+            "INSERT OR REPLACE INTO user_sessions (user_id, session_id, messages, updated_at) VALUES (?, ?, ?, ?)",
+            (*key, json.dumps(history.messages), time.time())
+        )
+        connection.commit()
+
+    def _check_version(self, key: SessionKey, history: SessionHistory, expected_version: Optional[int]) -> None:
+        """Raises SessionConflictError if an expected version does not match the stored one."""
+        if expected_version is not None and expected_version != history.version:
+            raise SessionConflictError(
+                f"Session {key[1]} is at version {history.version}, not {expected_version}.",
+                current_version=history.version
+            )
+
+    def get(self, user_id: str, session_id: str) -> SessionHistory:
+        """Returns a copy of the stored history of a session.
+
+        Args:
+            user_id: The ID of the user owning the session.
+            session_id: The ID of the session.
+
+        Returns:
+            The stored history. Unknown sessions have an empty history at version 0.
+        """
+        with self._lock:
+            return SessionHistory(messages=list(self._load((user_id, session_id)).messages))
+
+    def merge(
+        self,
+        user_id: str,
+        session_id: str,
+        messages: List[Dict[str, Any]],
+        expected_version: Optional[int] = None
+    ) -> SessionHistory:
+        """Returns the history a new turn is answered with, without storing anything.
+
+        Args:
+            user_id: The ID of the user owning the session.
+            session_id: The ID of the session.
+            messages: The messages of the new turn, or the complete list of
+                messages of the session if `expected_version` is None.
+            expected_version: The version the client last saw.
+
+        Returns:
+            The stored history followed by the messages if `expected_version` is
+            set, else the messages alone.
+
+        Exception:
+            SessionConflictError: The expected version does not match the stored one.
+        """
+        if expected_version is None:
+            return SessionHistory(messages=[to_stored_message(msg) for msg in messages])
+        key = (user_id, session_id)
+        with self._lock:
+            history = self._load(key)
+            self._check_version(key, history, expected_version)
+            return SessionHistory(messages=history.messages + [to_stored_message(msg) for msg in messages])
+
+    def append(
+        self,
+        user_id: str,
+        session_id: str,
+        messages: List[Dict[str, Any]],
+        expected_version: Optional[int] = None
+    ) -> SessionHistory:
+        """Appends messages to the history of a session.
+
+        Args:
+            user_id: The ID of the user owning the session.
+            session_id: The ID of the session.
+            messages: The messages to append.
+            expected_version: The version the client last saw. If provided and it
+                does not match the stored version, nothing is appended.
+
+        Returns:
+            A copy of the full history after appending.
+
+        Exception:
+            SessionConflictError: The expected version does not match the stored one.
+        """
+        key = (user_id, session_id)
+        with self._lock:
+            history = self._load(key)
+            self._check_version(key, history, expected_version)
+            history = SessionHistory(
+                messages=history.messages + [to_stored_message(msg) for msg in messages]
+            )
+            self._put(key, history)
+            return SessionHistory(messages=list(history.messages))
+
+    def replace(self, user_id: str, session_id: str, messages: List[Dict[str, Any]]) -> SessionHistory:
+        """Replaces the history of a session with a full snapshot sent by a client.
+
+        Args:
+            user_id: The ID of the user owning the session.
+            session_id: The ID of the session.
+            messages: The complete list of messages of the session.
+
+        Returns:
+            A copy of the stored history.
+        """
+        with self._lock:
+            history = SessionHistory(messages=[to_stored_message(msg) for msg in messages])
+            self._put((user_id, session_id), history)
+            return SessionHistory(messages=list(history.messages))
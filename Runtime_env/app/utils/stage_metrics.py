@@ -0,0 +1,204 @@
+# Copyright 2025 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# pylint: disable=C0301
+"""Module for the per-stage latency metrics of agent runs.
+
+Each run gets a RunMetrics, attached through a context variable like the
+cancellation token, so the tools called by the run are labeled with its
+orchestration framework and model. The metrics are served on /metrics.
+"""
+import contextlib
+import contextvars
+import functools
+import time
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from app.utils.metrics import REGISTRY
+from app.utils.session_store import get_ai_message_content
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "agent_stage_seconds",
+    "Time spent in each stage of an agent run (prompt_assembly, time_to_first_token, rerank, serialization, total, ...).",
+    ["framework", "model", "stage"]
+)
+TOOL_SECONDS = REGISTRY.histogram(
+    "agent_tool_seconds",
+    "Time taken by each tool call.",
+    ["framework", "model", "tool", "status"]
+)
+AGENT_RUNS = REGISTRY.counter(
+    "agent_runs_total",
+    "Number of agent runs by status (success, cached, error, cancelled).",
+    ["framework", "model", "status"]
+)
+OUTPUT_TOKENS = REGISTRY.counter(
+    "agent_output_tokens_total",
+    "Number of tokens generated by the model. Estimated from the text length when the model reports no usage.",
+    ["framework", "model"]
+)
+OUTPUT_TOKENS_PER_SECOND = REGISTRY.histogram(
+    "agent_output_tokens_per_second",
+    "Generation speed of an agent run, from its first to its last token.",
+    ["framework", "model"],
+    buckets=(1, 5, 10, 25, 50, 100, 200, 400, 800)
+)
+
+# The labels used outside of an agent run
+_NO_RUN_LABELS = {"framework": "none", "model": "none"}
+
+
+def estimate_tokens(text: str) -> int:
+    """Roughly estimates the number of tokens of a text (about 4 characters per token)."""
+    return (len(text) + 3) // 4
+
+
+class RunMetrics:
+    """Collects the stage timings of one agent run."""
+
+    def __init__(self, framework: str, model: str):
+        """
+        Initializes the RunMetrics.
+
+        Args:
+            framework: The orchestration framework of the agent.
+            model: The name of the model of the agent.
+        """
+        self.labels = {"framework": framework, "model": model}
+        self.start_time = time.perf_counter()
+        self.first_token_time: Optional[float] = None
+        self.last_token_time: Optional[float] = None
+        self.output_tokens = 0
+        self.tool_errors = 0
+        # Whether the answer may be cached, False once a tool returned live data or a degraded result
+        self.cacheable = True
+        self._reported_tokens = False
+
+    def observe_stage(self, stage: str, seconds: float) -> None:
+        """Records the time spent in a stage."""
+        STAGE_SECONDS.observe(seconds, stage=stage, **self.labels)
+
+    def observe_chunk(self, chunk: Any) -> None:
+        """Records the time to first token and the tokens of a streamed response object."""
+        content = get_ai_message_content(chunk)
+        usage_tokens = _get_output_tokens(chunk)
+        if not content and not usage_tokens:
+            return
+
+        now = time.perf_counter()
+        if self.first_token_time is None:
+            self.first_token_time = now
+            self.observe_stage("time_to_first_token", now - self.start_time)
+        self.last_token_time = now
+
+        # Token counts reported by the model replace the estimate once seen
+        if usage_tokens:
+            if not self._reported_tokens:
+                self._reported_tokens = True
+                self.output_tokens = 0
+            self.output_tokens += usage_tokens
+        elif not self._reported_tokens:
+            self.output_tokens += estimate_tokens(content)
+
+    def finish(self, status: str) -> None:
+        """Records the totals of the run."""
+        self.observe_stage("total", time.perf_counter() - self.start_time)
+        AGENT_RUNS.inc(status=status, **self.labels)
+        if self.output_tokens:
+            OUTPUT_TOKENS.inc(self.output_tokens, **self.labels)
+            generation_seconds = self.last_token_time - self.first_token_time
+            if generation_seconds > 0:
+                OUTPUT_TOKENS_PER_SECOND.observe(self.output_tokens / generation_seconds, **self.labels)
+
+
+def _get_output_tokens(chunk: Any) -> int:
+    """Returns the output tokens reported in the usage metadata of a response object, 0 if none."""
+    try:
+        messages = chunk["agent"]["messages"]
+    except (KeyError, TypeError):
+        return 0
+    tokens = 0
+    for message in messages:
+        usage_metadata = message.get("usage_metadata") if isinstance(message, dict) else None
+        if usage_metadata:
+            tokens += usage_metadata.get("output_tokens") or 0
+    return tokens
+
+
+_current_run: contextvars.ContextVar[Optional[RunMetrics]] = contextvars.ContextVar(
+    "agent_run_metrics", default=None
+)
+
+
+def get_run_metrics() -> Optional[RunMetrics]:
+    """Returns the RunMetrics of the current run, if any."""
+    return _current_run.get()
+
+
+def get_run_labels() -> Dict[str, str]:
+    """Returns the framework and model labels of the current run."""
+    run = _current_run.get()
+    return run.labels if run is not None else _NO_RUN_LABELS
+
+
+@contextlib.contextmanager
+def run_metrics_scope(run: RunMetrics) -> Iterator[RunMetrics]:
+    """Makes a RunMetrics the current one for the duration of the block."""
+    reset_token = _current_run.set(run)
+    try:
+        yield run
+    finally:
+        try:
+            _current_run.reset(reset_token)
+        except ValueError:
+            # Exited from another context, e.g. a generator closed by a different task
+            _current_run.set(None)
+
+
+@contextlib.contextmanager
+def stage_timer(stage: str, labels: Optional[Dict[str, str]] = None) -> Iterator[None]:
+    """Times the block as a stage of a run (e.g. the rerank of a tool).
+
+    Args:
+        stage: The name of the stage.
+        labels: The framework and model labels. Defaults to those of the current run.
+    """
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start_time, stage=stage, **(labels or get_run_labels()))
+
+
+def timed_tool(func: Callable[..., Any]) -> Callable[..., Any]:
+    """Decorator recording the latency of each call of a tool.
+
+    The wrapper keeps the signature and docstring of the tool, so it can be
+    passed to `StructuredTool.from_function` and `FunctionTool.from_defaults`.
+    """
+
+    @functools.wraps(func)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        start_time = time.perf_counter()
+        status = "error"
+        try:
+            result = func(*args, **kwargs)
+            status = "success"
+            return result
+        finally:
+            TOOL_SECONDS.observe(time.perf_counter() - start_time, tool=func.__name__, status=status, **get_run_labels())
+            run = _current_run.get()
+            if run is not None and status == "error":
+                run.tool_errors += 1
+
+    return wrapper
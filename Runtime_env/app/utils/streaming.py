@@ -0,0 +1,138 @@
+# Copyright 2025 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# pylint: disable=C0301, W0718
+"""Module for bridging synchronous generators onto the asyncio event loop.
+
+Several orchestration frameworks (Agent Engine, ADK) only expose a synchronous
+`stream_query` generator. Iterating those directly inside an `async def` blocks
+the event loop on every chunk, so they are driven on a bounded worker pool
+instead and their chunks are handed back through an asyncio queue.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
+import threading
+from typing import Any, AsyncGenerator, Callable, Optional
+
+from app.utils.cancellation import is_cancelled
+
+# Marks the end of the sync generator in the hand-off queue
+_END_OF_STREAM = object()
+
+_stream_executor: Optional[ThreadPoolExecutor] = None
+_stream_executor_lock = threading.Lock()
+
+
+def get_stream_executor(max_workers: int) -> ThreadPoolExecutor:
+    """Returns the process-wide worker pool used to drive sync generators.
+
+    The pool is created on first use. Subsequent calls return the same pool,
+    regardless of the `max_workers` value passed in.
+
+    Args:
+        max_workers: The maximum number of generators driven concurrently.
+
+    Returns:
+        The shared ThreadPoolExecutor.
+    """
+    global _stream_executor # pylint: disable=W0603
+    with _stream_executor_lock:
+        if _stream_executor is None:
+            _stream_executor = ThreadPoolExecutor(
+                max_workers=max_workers,
+                thread_name_prefix="agent-stream"
+            )
+        return _stream_executor
+
+
+async def iterate_in_threadpool(
+    func: Callable[..., Any],
+    *args: Any,
+    executor: Optional[ThreadPoolExecutor] = None,
+    max_buffer_size: int = 64,
+    **kwargs: Any
+) -> AsyncGenerator[Any, None]:
+    """Asynchronously iterates a synchronous generator without blocking the event loop.
+
+    `func(*args, **kwargs)` is called on a worker thread and the resulting
+    generator is driven there. Each chunk is handed back to the event loop
+    through a bounded asyncio queue, so a slow consumer applies back-pressure
+    to the worker instead of buffering the entire stream in memory.
+
+    If the consumer stops early or the run is cancelled (e.g. the client
+    disconnected), the worker stops pulling from the generator after the
+    current chunk and closes it.
+
+    Args:
+        func: A callable returning a synchronous iterable (e.g. `stream_query`).
+        *args: Positional arguments passed to `func`.
+        executor: The worker pool to use. Defaults to the event loop's default executor.
+        max_buffer_size: The maximum number of chunks buffered between the worker and the consumer.
+        **kwargs: Keyword arguments passed to `func`.
+
+    Yields:
+        The chunks produced by the synchronous generator, in order.
+
+    Exception:
+        Any exception raised by `func` or the generator is re-raised in the consumer.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=max_buffer_size)
+    stop_event = threading.Event()
+
+    def put(item: Any, error: Optional[BaseException] = None) -> None:
+        """Blocks the worker thread until the item is accepted by the queue."""
+        try:
+            asyncio.run_coroutine_threadsafe(queue.put((item, error)), loop).result()
+        except RuntimeError:
+            # The event loop has been closed, nobody is listening anymore
+            stop_event.set()
+
+    def drive() -> None:
+        """Runs on the worker thread and pushes each chunk into the queue."""
+        try:
+            iterator = iter(func(*args, **kwargs))
+            try:
+                for item in iterator:
+                    if stop_event.is_set() or is_cancelled():
+                        break
+                    put(item)
+            finally:
+                close = getattr(iterator, "close", None)
+                if close is not None:
+                    close()
+        except BaseException as e:
+            if not stop_event.is_set():
+                put(_END_OF_STREAM, e)
+            return
+        if not stop_event.is_set():
+            put(_END_OF_STREAM)
+
+    # Copy the context so contextvars set by the request are visible to the worker
+    context = contextvars.copy_context()
+    loop.run_in_executor(executor, context.run, drive)
+
+    try:
+        while True:
+            item, error = await queue.get()
+            if item is _END_OF_STREAM:
+                if error is not None:
+                    raise error
+                break
+            yield item
+    finally:
+        stop_event.set()
+        # Unblock a worker that is waiting on a full queue
+        while not queue.empty():
+            queue.get_nowait()
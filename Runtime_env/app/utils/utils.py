@@ -16,7 +16,6 @@
 import os
 
 import toml
-from vertexai import agent_engines
 import yaml
 
 def get_requirements_from_toml(pyproject_file="pyproject.toml"):
@@ -156,6 +155,8 @@ def deploy_agent_to_agent_engine(
     Exception:
         An error is encountered during deployment.
     """
+    from vertexai import agent_engines # pylint: disable=C0415
+
     try:
         remote_agent = agent_engines.create(
             agent,
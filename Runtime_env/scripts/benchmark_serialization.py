@@ -0,0 +1,91 @@
+# Copyright 2025 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# pylint: disable=C0301
+"""Micro-benchmark of the per-chunk cost of encoding the NDJSON event stream.
+
+Run from the Runtime_env folder:
+    python -m scripts.benchmark_serialization
+"""
+import argparse
+import json
+import timeit
+import uuid
+
+from app.utils.input_types import default_serialization
+from app.utils.serialization import StreamEncoder, get_json_dumps, stdlib_dumps
+
+
+def get_token_chunk(run_id: str, content: str) -> dict:
+    """Returns a token chunk envelope, as built by `BaseAgentManager.get_response_obj`."""
+    return {
+        "agent": {
+            "messages": [
+                {
+                    "lc": 1,
+                    "type": "constructor",
+                    "id": ["langgraph", "schema", "messages", "AIMessageChunk"],
+                    "kwargs": {
+                        "content": content,
+                        "type": "ai",
+                        "tool_calls": [],
+                        "invalid_tool_calls": [],
+                        "id": run_id
+                    },
+                }
+            ]
+        }
+    }
+
+
+def get_tool_chunk(run_id: str) -> dict:
+    """Returns a tool result envelope carrying a larger payload."""
+    chunk = get_token_chunk(run_id, "## Context provided:\n" + "Alphabet revenue grew. " * 200)
+    message = chunk["agent"]["messages"][0]
+    message["id"][-1] = "ToolMessage"
+    message["kwargs"].update({"type": "tool", "name": "retrieve_info", "tool_call_id": str(uuid.uuid4())})
+    return chunk
+
+
+def baseline_encode(data: dict) -> bytes:
+    """The encoding used before the serialization layer was introduced."""
+    return (json.dumps(data, default=default_serialization) + "\n").encode()
+
+
+def main():
+    """Prints the per-chunk encoding cost of each encoder."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--number", type=int, default=100_000, help="Chunks encoded per measurement.")
+    args = parser.parse_args()
+
+    run_id = str(uuid.uuid4())
+    chunks = {
+        "token chunk": get_token_chunk(run_id, "Alphabet's Q3 revenue"),
+        "tool chunk": get_tool_chunk(run_id),
+    }
+    encoders = {
+        "baseline json.dumps": baseline_encode,
+        "StreamEncoder (json)": StreamEncoder(stdlib_dumps).encode,
+        "StreamEncoder (auto)": StreamEncoder(get_json_dumps()).encode,
+    }
+
+    for chunk_name, chunk in chunks.items():
+        print(f"{chunk_name}:")
+        for encoder_name, encode in encoders.items():
+            assert json.loads(encode(chunk)) == json.loads(baseline_encode(chunk))
+            seconds = min(timeit.repeat(lambda: encode(chunk), number=args.number, repeat=3)) # pylint: disable=W0640
+            print(f"  {encoder_name:<24} {seconds / args.number * 1e6:8.2f} us/chunk")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+# Copyright 2025 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# pylint: disable=C0301
+"""Reports the per-module import cost of the server, i.e. its cold start.
+
+The imports are timed with `python -X importtime` in a fresh interpreter, so
+nothing imported by this script skews the numbers. If a framework is given,
+its dependencies are imported as well, as they would be on the first request.
+
+Run from the Runtime_env folder:
+    python -m scripts.import_report --framework langgraph_prebuilt_agent
+"""
+import argparse
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+from app.orchestration.enums import OrchestrationFramework
+
+
+def get_import_script(module: str, framework: str) -> str:
+    """Returns the code run in the profiled interpreter."""
+    script = f"import {module}\n"
+    if framework:
+        script += (
+            "from app.orchestration.server_utils import import_framework_dependencies\n"
+            f"import_framework_dependencies({framework!r})\n"
+        )
+    return script
+
+
+def parse_importtime(output: str) -> List[Tuple[str, int, int]]:
+    """Parses the `-X importtime` output into (module, self us, cumulative us) rows."""
+    rows: Dict[str, Tuple[str, int, int]] = {}
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        name = name.strip()
+        rows[name] = (name, int(self_us), int(cumulative_us))
+    return list(rows.values())
+
+
+def get_top_level_total(output: str) -> int:
+    """Returns the total import time in microseconds, summed over top level imports."""
+    total = 0
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        # Nested imports are indented by two spaces per level
+        if not name.startswith("  "):
+            total += int(cumulative_us)
+    return total
+
+
+def main():
+    """Prints the slowest imports of the server."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="app.server", help="The module to import.")
+    parser.add_argument(
+        "--framework",
+        default="",
+        choices=[""] + [framework.value for framework in OrchestrationFramework],
+        help="Also import the dependencies of this orchestration framework."
+    )
+    parser.add_argument("--top", type=int, default=25, help="Number of modules to list.")
+    parser.add_argument("--sort", choices=["cumulative", "self"], default="cumulative", help="Sort column.")
+    args = parser.parse_args()
+
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", get_import_script(args.module, args.framework)],
+        capture_output=True,
+        text=True,
+        check=False
+    )
+    if result.returncode != 0:
+        print(result.stderr[-4000:], file=sys.stderr)
+        sys.exit(result.returncode)
+
+    rows = parse_importtime(result.stderr)
+    sort_index = 2 if args.sort == "cumulative" else 1
+    rows.sort(key=lambda row: row[sort_index], reverse=True)
+
+    total_us = get_top_level_total(result.stderr)
+    print(f"Imported {len(rows)} modules in {total_us / 1e6:.3f} s ({args.module}{' + ' + args.framework if args.framework else ''})")
+    print(f"{'cumulative [ms]':>16} {'self [ms]':>10}  module")
+    for name, self_us, cumulative_us in rows[:args.top]:
+        print(f"{cumulative_us / 1e3:16.1f} {self_us / 1e3:10.1f}  {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+# Copyright 2025 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# pylint: disable=C0301, W0212
+"""Stress check that concurrent LlamaIndex runs never see each other's LLM or retriever.
+
+Each simulated request sets its own LLM and retriever with `llamaindex_scope`
+and calls `llamaindex_query_engine_tool` repeatedly, both through the async
+FunctionTool wrapper (as `ReActAgent.astream_step` does) and from a sync
+generator driven by the stream worker pool (as `stream_query` does). The LLM
+and retriever tag their output, so an answer built with the settings of
+another request is reported as a leak. Exits with status 1 on any leak.
+
+Run from the Runtime_env folder:
+    python -m scripts.llamaindex_concurrency_check --requests 200 --calls 5
+"""
+import argparse
+import asyncio
+import random
+import re
+import sys
+import time
+from typing import Any, List
+
+from llama_index.core.base.llms.types import CompletionResponse, CompletionResponseGen, LLMMetadata
+from llama_index.core.llms.callbacks import llm_completion_callback
+from llama_index.core.llms.custom import CustomLLM
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import NodeWithScore, QueryBundle, TextNode
+
+from app.orchestration.tools import _as_llamaindex_tool, llamaindex_query_engine_tool, llamaindex_scope
+from app.utils.streaming import iterate_in_threadpool
+
+
+class TaggedLLM(CustomLLM):
+    """Answers with its own tag and the retriever tags found in the prompt."""
+
+    tag: str
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return LLMMetadata(model_name=f"tagged-{self.tag}")
+
+    @llm_completion_callback()
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        # Let the other requests run in between
+        time.sleep(random.uniform(0, 0.005))
+        retrievers = " ".join(sorted(set(re.findall(r"retriever=\w+", prompt))))
+        return CompletionResponse(text=f"llm={self.tag} {retrievers}")
+
+    @llm_completion_callback()
+    def stream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponseGen:
+        yield self.complete(prompt, formatted=formatted, **kwargs)
+
+
+class TaggedRetriever(BaseRetriever):
+    """Retrieves a single node carrying its tag."""
+
+    def __init__(self, tag: str):
+        self.tag = tag
+        super().__init__()
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        time.sleep(random.uniform(0, 0.005))
+        return [NodeWithScore(node=TextNode(text=f"retriever={self.tag}"), score=1.0)]
+
+
+async def run_request(index: int, calls: int, tool: Any) -> int:
+    """Runs the tool `calls` times each way with the settings of one request.
+
+    Returns:
+        The number of answers built with the settings of another request.
+    """
+    tag = f"r{index}"
+    expected = f"llm={tag} retriever={tag}"
+    leaks = 0
+
+    def sync_calls():
+        for _ in range(calls):
+            yield llamaindex_query_engine_tool("question")
+
+    with llamaindex_scope(TaggedLLM(tag=tag), TaggedRetriever(tag)):
+        for _ in range(calls):
+            output = await tool.acall(query="question")
+            leaks += str(output.content).strip() != expected
+        async for output in iterate_in_threadpool(sync_calls):
+            leaks += str(output).strip() != expected
+    return leaks
+
+
+async def run_check(requests: int, calls: int) -> int:
+    """Runs the requests concurrently and returns the total number of leaks."""
+    tool = _as_llamaindex_tool(llamaindex_query_engine_tool)
+    results = await asyncio.gather(*(run_request(index, calls, tool) for index in range(requests)))
+    return sum(results)
+
+
+def main():
+    """Runs the check and reports the leaks."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200, help="Concurrent requests.")
+    parser.add_argument("--calls", type=int, default=5, help="Tool calls per request, each way.")
+    args = parser.parse_args()
+
+    start_time = time.perf_counter()
+    leaks = asyncio.run(run_check(args.requests, args.calls))
+    elapsed = time.perf_counter() - start_time
+
+    total = args.requests * args.calls * 2
+    print(f"{total} tool calls from {args.requests} concurrent requests in {elapsed:.2f}s, {leaks} leaked settings.")
+    sys.exit(1 if leaks else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+# Copyright 2025 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# pylint: disable=C0301, W0718
+"""Check of the regional failover and hedging of models against stub endpoints.
+
+Each region is served by a local stub model whose latency and error rate can
+be changed while requests flow. The check streams requests through a
+RegionalChatModel in three phases:
+- healthy: the fastest region gets the traffic;
+- brownout: the preferred region turns slow and returns 429s, no request may
+  fail and the traffic must move to the other region;
+- tail latency: both regions are slow on a share of their calls, and
+  hedging must cut the p99 latency.
+Exits with status 1 if a check fails.
+
+Run from the Runtime_env folder:
+    python -m scripts.region_failover_check --requests 300
+"""
+import argparse
+import asyncio
+import collections
+import random
+import sys
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from app.orchestration.regions import RegionalChatModel, RegionalEndpointPool
+
+
+class StubEndpointError(Exception):
+    """An error returned by a stub endpoint, with its HTTP status like google.api_core errors."""
+
+    def __init__(self, code: int):
+        super().__init__(f"stub endpoint returned {code}")
+        self.code = code
+
+
+class StubEndpoint:
+    """The behavior of one regional endpoint, changed while the check runs."""
+
+    def __init__(self, region: str, latency: float):
+        self.region = region
+        self.latency = latency
+        self.error_rate = 0.0
+        self.slow_rate = 0.0
+        self.slow_latency = 0.0
+        self.calls = 0
+
+    def first_chunk_delay(self) -> float:
+        """Draws the time to the first chunk of a call, or raises its error."""
+        self.calls += 1
+        if random.random() < self.error_rate:
+            raise StubEndpointError(429)
+        if random.random() < self.slow_rate:
+            return self.slow_latency
+        return self.latency * random.uniform(0.8, 1.2)
+
+
+class StubRegionModel(BaseChatModel):
+    """Chat model answering from a stub endpoint, tagged with its region."""
+
+    endpoint: Any
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub"
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        time.sleep(self.endpoint.first_chunk_delay())
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=f"answer from {self.endpoint.region}"))])
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self.endpoint.first_chunk_delay())
+        for word in ("answer", "from", self.endpoint.region):
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word + " "))
+            await asyncio.sleep(0.001)
+
+
+async def run_phase(model: RegionalChatModel, requests: int, concurrency: int) -> Dict[str, Any]:
+    """Streams requests through the model, returning their latency, answering regions and failures."""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    regions: "collections.Counter[str]" = collections.Counter()
+    failures = 0
+
+    async def request() -> None:
+        nonlocal failures
+        async with semaphore:
+            start_time = time.perf_counter()
+            try:
+                text = ""
+                async for chunk in model.astream([HumanMessage(content="hello")]):
+                    text += chunk.content
+                regions[text.split()[-1]] += 1
+            except Exception:
+                failures += 1
+            latencies.append(time.perf_counter() - start_time)
+
+    await asyncio.gather(*(request() for _ in range(requests)))
+    latencies.sort()
+    return {
+        "regions": dict(regions),
+        "failures": failures,
+        "p50": latencies[len(latencies) // 2],
+        "p99": latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)],
+    }
+
+
+def build_model(endpoints: List[StubEndpoint], hedging: bool) -> RegionalChatModel:
+    """Builds a regional model over stub endpoints, with a fresh pool."""
+    return RegionalChatModel(
+        model_name="stub-model",
+        region_models={endpoint.region: StubRegionModel(endpoint=endpoint) for endpoint in endpoints},
+        pool=RegionalEndpointPool(
+            "stub-model", [endpoint.region for endpoint in endpoints], cooldown=1.0, hedge_min_delay=0.005
+        ),
+        hedging=hedging
+    )
+
+
+def report(name: str, result: Dict[str, Any]) -> None:
+    print(f"{name:<24} regions={result['regions']} failures={result['failures']} p50={result['p50'] * 1000:.1f} ms p99={result['p99'] * 1000:.1f} ms")
+
+
+async def main(requests: int, concurrency: int) -> int:
+    errors = []
+    primary, secondary = StubEndpoint("us-central1", 0.010), StubEndpoint("us-east4", 0.020)
+    model = build_model([primary, secondary], hedging=False)
+
+    healthy = await run_phase(model, requests, concurrency)
+    report("healthy", healthy)
+    if healthy["regions"].get("us-central1", 0) < requests * 0.8:
+        errors.append("healthy: the fastest region did not get most of the traffic")
+
+    primary.latency, primary.error_rate = 0.100, 0.3
+    brownout = await run_phase(model, requests, concurrency)
+    report("brownout", brownout)
+    if brownout["failures"]:
+        errors.append(f"brownout: {brownout['failures']} requests failed although us-east4 was healthy")
+    if brownout["regions"].get("us-east4", 0) < requests * 0.7:
+        errors.append("brownout: the traffic did not move to the healthy region")
+
+    results = {}
+    for hedging in (False, True):
+        primary, secondary = StubEndpoint("us-central1", 0.010), StubEndpoint("us-east4", 0.015)
+        for endpoint in (primary, secondary):
+            endpoint.slow_rate, endpoint.slow_latency = 0.03, 0.300
+        model = build_model([primary, secondary], hedging=hedging)
+        # Let the pool learn the latency of each region before measuring
+        await run_phase(model, 50, concurrency)
+        results[hedging] = await run_phase(model, requests, concurrency)
+        report(f"tail latency, hedging={hedging}", results[hedging])
+    if results[True]["p99"] > results[False]["p99"] * 0.5:
+        errors.append("tail latency: hedging did not halve the p99 latency")
+    if results[True]["failures"]:
+        errors.append("tail latency: hedged requests failed")
+
+    for error in errors:
+        print(f"FAILED {error}")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=300, help="Number of requests per phase.")
+    parser.add_argument("--concurrency", type=int, default=20, help="Number of concurrent requests.")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main(args.requests, args.concurrency)))
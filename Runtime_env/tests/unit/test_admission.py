@@ -0,0 +1,118 @@
+# Copyright 2025 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Unit tests of the admission control of concurrent requests."""
+import asyncio
+
+import pytest
+
+from app.utils.admission import AdmissionController, AdmissionRejectedError
+
+
+def make_controller(max_in_flight=1, max_queue_size=1, max_queue_time=1.0):
+    return AdmissionController(
+        max_in_flight=max_in_flight, max_queue_size=max_queue_size, max_queue_time=max_queue_time, retry_after=3
+    )
+
+
+@pytest.mark.asyncio
+async def test_requests_are_admitted_up_to_the_limit():
+    controller = make_controller(max_in_flight=2)
+    leases = [await controller.acquire(), await controller.acquire()]
+    assert controller.in_flight == 2
+
+    for lease in leases:
+        lease.release()
+        # Releasing twice is a no-op
+        lease.release()
+    assert controller.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_full_queue_is_rejected_with_a_429():
+    controller = make_controller()
+    await controller.acquire()
+    waiter = asyncio.create_task(controller.acquire())
+    await asyncio.sleep(0)
+
+    with pytest.raises(AdmissionRejectedError) as rejection:
+        await controller.acquire()
+    assert rejection.value.status_code == 429
+    assert rejection.value.retry_after == 3
+
+    waiter.cancel()
+    await asyncio.wait({waiter})
+
+
+@pytest.mark.asyncio
+async def test_queue_timeout_is_rejected_with_a_503():
+    controller = make_controller(max_queue_time=0.01)
+    await controller.acquire()
+
+    with pytest.raises(AdmissionRejectedError) as rejection:
+        await controller.acquire()
+    assert rejection.value.status_code == 503
+    assert controller.queue_depth == 0
+
+
+@pytest.mark.asyncio
+async def test_permit_is_handed_to_the_waiters_in_order():
+    controller = make_controller(max_queue_size=2)
+    lease = await controller.acquire()
+    order = []
+
+    async def wait(name):
+        waiter_lease = await controller.acquire()
+        order.append(name)
+        return waiter_lease
+
+    first = asyncio.create_task(wait("first"))
+    await asyncio.sleep(0)
+    second = asyncio.create_task(wait("second"))
+    await asyncio.sleep(0)
+    assert controller.queue_depth == 2
+
+    lease.release()
+    (await first).release()
+    (await second).release()
+    assert order == ["first", "second"]
+    assert controller.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_does_not_leak_its_permit():
+    controller = make_controller()
+    lease = await controller.acquire()
+    waiter = asyncio.create_task(controller.acquire())
+    await asyncio.sleep(0)
+
+    # The permit is handed over just before the waiter is cancelled
+    lease.release()
+    waiter.cancel()
+    await asyncio.wait({waiter})
+    if not waiter.cancelled():
+        # The cancellation came too late, and the waiter got the permit
+        waiter.result().release()
+
+    assert controller.in_flight == 0
+    assert controller.queue_depth == 0
+    (await controller.acquire()).release()
+
+
+@pytest.mark.asyncio
+async def test_admission_control_can_be_disabled():
+    controller = make_controller(max_in_flight=0)
+    leases = [await controller.acquire() for _ in range(10)]
+    for lease in leases:
+        lease.release()
+    assert controller.in_flight == 0
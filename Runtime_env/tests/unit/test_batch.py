@@ -0,0 +1,88 @@
+# Copyright 2025 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Unit tests of the batched runs of an Agent Manager."""
+import asyncio
+
+import pytest
+
+from app.orchestration.agent import BaseAgentManager
+from app.utils.deadline import DeadlineExceededError
+
+
+class FakeAgent(BaseAgentManager):
+
+    def __init__(self):  # pylint: disable=W0231
+        self.running = 0
+        self.max_running = 0
+
+    def create_agent_executor(self):
+        return None
+
+    async def astream(self, input):
+        yield {}
+
+    async def ainvoke(self, input):
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        try:
+            await asyncio.sleep(input["delay"])
+            if input.get("error") == "deadline":
+                try:
+                    raise DeadlineExceededError("The request deadline has passed.")
+                except DeadlineExceededError as e:
+                    # Like the managers, which wrap the errors of their runs
+                    raise RuntimeError(f"Unexpected error. {e}") from e
+            if input.get("error") == "model":
+                raise RuntimeError("Unexpected error. model error")
+            return f"answer {input['delay']}"
+        finally:
+            self.running -= 1
+
+
+async def run_batch(agent, inputs, **kwargs):
+    return [result async for result in agent.abatch(inputs, **kwargs)]
+
+
+@pytest.mark.asyncio
+async def test_results_arrive_in_completion_order_with_their_index():
+    results = await run_batch(FakeAgent(), [{"delay": 0.05}, {"delay": 0.01}])
+
+    assert [result["index"] for result in results] == [1, 0]
+    assert [result["output"] for result in results] == ["answer 0.01", "answer 0.05"]
+    assert all(result["status"] == "success" and result["run_id"] for result in results)
+
+
+@pytest.mark.asyncio
+async def test_concurrency_is_capped():
+    agent = FakeAgent()
+    results = await run_batch(agent, [{"delay": 0.01} for _ in range(6)], max_concurrency=2)
+
+    assert len(results) == 6
+    assert agent.max_running == 2
+
+
+@pytest.mark.asyncio
+async def test_slow_conversation_times_out():
+    results = await run_batch(FakeAgent(), [{"delay": 1}, {"delay": 0}], timeout=0.05)
+
+    statuses = {result["index"]: result["status"] for result in results}
+    assert statuses == {0: "timeout", 1: "success"}
+
+
+@pytest.mark.asyncio
+async def test_wrapped_deadline_error_is_a_timeout():
+    results = await run_batch(FakeAgent(), [{"delay": 0, "error": "deadline"}, {"delay": 0, "error": "model"}], timeout=5)
+
+    statuses = {result["index"]: result["status"] for result in results}
+    assert statuses == {0: "timeout", 1: "error"}
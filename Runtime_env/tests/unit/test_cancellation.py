@@ -0,0 +1,142 @@
+# Copyright 2025 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Unit tests of the cancellation of agent runs on disconnect and deadline."""
+import asyncio
+
+import pytest
+
+from app.utils.cancellation import (
+    CancellationToken,
+    RunCancelledError,
+    cancel_on_disconnect,
+    cancellable_tool,
+    cancellation_scope,
+    get_cancellation_token,
+    stream_in_task
+)
+from app.utils.deadline import Deadline, DeadlineExceededError, deadline_scope, get_remaining_time
+
+
+async def never_disconnected():
+    return False
+
+
+class SlowAgent:
+    """Yields a chunk, then hangs like a slow model call."""
+
+    def __init__(self):
+        self.closed = False
+
+    async def stream(self):
+        try:
+            yield "chunk"
+            await asyncio.sleep(60)
+            yield "never sent"
+        finally:
+            self.closed = True
+
+
+async def respond(agent, timeout, is_disconnected=never_disconnected):
+    """Streams like the /streamQuery response, ending with a notice at the deadline."""
+    with deadline_scope(Deadline(timeout)):
+        try:
+            async with cancel_on_disconnect(is_disconnected, "test", 0.01):
+                events = stream_in_task(agent.stream())
+                try:
+                    async for event in events:
+                        yield event
+                finally:
+                    await events.aclose()
+        except DeadlineExceededError:
+            yield "notice"
+
+
+def test_token_callbacks():
+    token = CancellationToken()
+    calls = []
+    token.add_callback(lambda: calls.append("first"))
+    remove = token.add_callback(lambda: calls.append("removed"))
+    remove()
+    token.cancel("deadline_exceeded")
+    token.cancel("client_disconnected")
+    assert calls == ["first"]
+    assert token.reason == "deadline_exceeded"
+    # Callbacks added once cancelled are called right away
+    token.add_callback(lambda: calls.append("late"))
+    assert calls == ["first", "late"]
+
+
+def test_cancellable_tool():
+    @cancellable_tool
+    def search(query):
+        return query
+
+    token = CancellationToken()
+    with cancellation_scope(token):
+        assert search("q") == "q"
+        token.cancel("client_disconnected")
+        with pytest.raises(RunCancelledError):
+            search("q")
+
+
+@pytest.mark.asyncio
+async def test_deadline_ends_the_stream_with_a_notice():
+    agent = SlowAgent()
+    assert [event async for event in respond(agent, timeout=0.05)] == ["chunk", "notice"]
+    assert agent.closed
+
+
+@pytest.mark.asyncio
+async def test_deadline_while_sending_still_ends_with_a_notice():
+    agent = SlowAgent()
+    events = []
+    async for event in respond(agent, timeout=0.05):
+        events.append(event)
+        # The response is busy sending the chunk when the deadline passes
+        await asyncio.sleep(0.1)
+    assert events == ["chunk", "notice"]
+    assert agent.closed
+
+
+@pytest.mark.asyncio
+async def test_disconnect_cancels_the_run():
+    agent = SlowAgent()
+    start = asyncio.get_running_loop().time()
+
+    async def disconnected_after_50ms():
+        return asyncio.get_running_loop().time() - start > 0.05
+
+    events = []
+    with pytest.raises(RunCancelledError):
+        async for event in respond(agent, timeout=10, is_disconnected=disconnected_after_50ms):
+            events.append(event)
+    assert events == ["chunk"]
+    assert agent.closed
+
+
+@pytest.mark.asyncio
+async def test_stream_in_task_keeps_the_context_and_errors():
+    token = CancellationToken()
+
+    async def stream():
+        yield get_cancellation_token() is token
+        yield get_remaining_time() is not None
+        raise ValueError("boom")
+
+    items = []
+    with deadline_scope(Deadline(10)), cancellation_scope(token):
+        with pytest.raises(ValueError):
+            async for item in stream_in_task(stream()):
+                items.append(item)
+    assert items == [True, True]
@@ -0,0 +1,100 @@
+# Copyright 2025 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Unit tests of the shared clients and model pool."""
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+
+from app.orchestration.clients import ClientRegistry, ModelClientPool
+
+
+class FakeModel:
+    builds = 0
+
+    def __init__(self, **params):
+        FakeModel.builds += 1
+        self.params = params
+
+
+def test_model_pool_shares_models_by_settings():
+    pool = ModelClientPool()
+    model = pool.get_model(FakeModel, model_name="gemini", temperature=0)
+    assert pool.get_model(FakeModel, temperature=0, model_name="gemini") is model
+    assert pool.get_model(FakeModel, model_name="gemini", temperature=1) is not model
+    assert pool.stats()["models"] == 2
+
+
+def test_model_pool_builds_a_model_once():
+    pool = ModelClientPool()
+    builds = []
+
+    def factory():
+        builds.append(1)
+        time.sleep(0.05)
+        return object()
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        clients = list(executor.map(lambda _: pool.get_client(("endpoint",), factory), range(8)))
+    assert len(builds) == 1
+    assert all(client is clients[0] for client in clients)
+
+
+def test_model_pool_build_does_not_block_other_keys():
+    pool = ModelClientPool()
+    cached = pool.get_client(("cached",), object)
+    building = threading.Event()
+    release = threading.Event()
+
+    def slow_factory():
+        building.set()
+        release.wait(5)
+        return object()
+
+    thread = threading.Thread(target=pool.get_client, args=(("slow",), slow_factory))
+    thread.start()
+    try:
+        assert building.wait(5)
+        start = time.monotonic()
+        assert pool.get_client(("cached",), object) is cached
+        pool.get_client(("other",), object)
+        assert time.monotonic() - start < 0.5
+    finally:
+        release.set()
+        thread.join()
+
+
+def test_model_pool_does_not_cache_failed_builds():
+    pool = ModelClientPool()
+
+    def failing_factory():
+        raise RuntimeError("no credentials")
+
+    try:
+        pool.get_client(("endpoint",), failing_factory)
+    except RuntimeError:
+        pass
+    client = pool.get_client(("endpoint",), object)
+    assert pool.get_client(("endpoint",), object) is client
+
+
+def test_client_registry_creates_clients_on_first_use():
+    registry = ClientRegistry()
+    created = []
+    registry.register("client", lambda: created.append(1) or "client")
+    assert not registry.is_initialized("client")
+    assert registry.get("client") == "client"
+    assert registry.get("client") == "client"
+    assert created == [1]
+    registry.register("failing", lambda: 1 / 0)
+    assert set(registry.warm_up()) == {"failing"}
@@ -0,0 +1,157 @@
+# Copyright 2025 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Unit tests of the request deadlines."""
+import threading
+import time
+
+import pytest
+
+from app.utils import deadline as deadline_module
+from app.utils.deadline import (
+    Deadline,
+    DeadlineExceededError,
+    ToolWorkerPool,
+    clamp_timeout,
+    configure_tool_pool,
+    deadline_scope,
+    deadline_tool,
+    get_remaining_time,
+    parse_timeout
+)
+
+
+def test_parse_timeout():
+    assert parse_timeout(None, 30, 120) == 30
+    assert parse_timeout("10", 30, 120) == 10
+    assert parse_timeout("soon", 30, 120) == 30
+    assert parse_timeout("-1", 30, 120) == 30
+    assert parse_timeout("600", 30, 120) == 120
+    assert parse_timeout("nan", 30, 120) == 30
+    assert parse_timeout("inf", 30, 120) == 30
+    assert parse_timeout("-inf", 30, 120) == 30
+
+
+def test_clamp_timeout():
+    assert clamp_timeout(5) == 5
+    assert clamp_timeout(None) is None
+    with deadline_scope(Deadline(1)):
+        assert clamp_timeout(5) <= 1
+        assert clamp_timeout(0.5) == 0.5
+        assert clamp_timeout(None) <= 1
+    with deadline_scope(Deadline(0)):
+        with pytest.raises(DeadlineExceededError):
+            clamp_timeout(5)
+
+
+def test_deadline_scope_keeps_the_earlier_deadline():
+    with deadline_scope(Deadline(1)):
+        with deadline_scope(Deadline(100)):
+            assert get_remaining_time() <= 1
+        with deadline_scope(Deadline(0.5)):
+            assert get_remaining_time() <= 0.5
+        assert 0.5 < get_remaining_time() <= 1
+    assert get_remaining_time() is None
+
+
+def test_deadline_tool_without_deadline_runs_inline():
+    @deadline_tool
+    def tool():
+        return threading.current_thread().name
+
+    assert tool() == threading.current_thread().name
+
+
+def test_deadline_tool_skips_when_out_of_time():
+    calls = []
+
+    @deadline_tool(min_seconds=2)
+    def tool():
+        calls.append(1)
+
+    with deadline_scope(Deadline(1)):
+        assert "was skipped" in tool()
+    assert not calls
+
+
+def test_deadline_tool_abandons_a_hung_call():
+    release = threading.Event()
+
+    @deadline_tool(min_seconds=0, fallback=lambda notice: ("fallback", notice))
+    def tool():
+        release.wait(5)
+        return "late"
+
+    with deadline_scope(Deadline(0.1)):
+        result = tool()
+    release.set()
+    assert result[0] == "fallback"
+    assert "did not finish" in result[1]
+
+
+def test_worker_pool_saturates_with_abandoned_calls():
+    pool = ToolWorkerPool(max_workers=2)
+    release = threading.Event()
+    futures = [pool.submit(release.wait, 5) for _ in range(2)]
+    assert pool.in_flight == 2
+    # Busy, but not with abandoned calls
+    assert not pool.saturated
+
+    pool.abandon(futures[0])
+    assert pool.abandoned == 1
+    assert pool.saturated
+
+    release.set()
+    for future in futures:
+        future.result()
+    assert pool.abandoned == 0
+    assert pool.in_flight == 0
+    assert not pool.saturated
+
+
+def test_worker_pool_cancels_a_queued_call():
+    pool = ToolWorkerPool(max_workers=1)
+    release = threading.Event()
+    running = pool.submit(release.wait, 5)
+    queued = pool.submit(time.sleep, 0)
+    pool.abandon(queued)
+    assert queued.cancelled()
+    assert pool.abandoned == 0
+    release.set()
+    running.result()
+    assert pool.in_flight == 0
+
+
+def test_deadline_tool_fails_fast_when_saturated(monkeypatch):
+    pool = ToolWorkerPool(max_workers=1)
+    release = threading.Event()
+    monkeypatch.setattr(deadline_module, "_tool_pool", pool)
+
+    @deadline_tool(min_seconds=0)
+    def hung_tool():
+        release.wait(5)
+
+    with deadline_scope(Deadline(0.1)):
+        assert "did not finish" in hung_tool()
+        start = time.monotonic()
+        assert "server is busy" in hung_tool()
+        assert time.monotonic() - start < 0.05
+    release.set()
+
+
+
+def test_tool_pool_size_is_configurable(monkeypatch):
+    monkeypatch.setattr(deadline_module, "_tool_pool", None)
+    monkeypatch.setattr(deadline_module, "_tool_workers", 32)
+    configure_tool_pool(4)
+    assert deadline_module._get_tool_pool().max_workers == 4
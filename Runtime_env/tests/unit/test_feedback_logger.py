@@ -0,0 +1,131 @@
+# Copyright 2025 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Unit tests of the batched feedback logger."""
+import asyncio
+import json
+import os
+
+import pytest
+
+from app.utils.feedback_logger import BatchedStructLogger
+
+
+class FakeSink:
+
+    def __init__(self):
+        self.entries = []
+        self.available = True
+
+    def log_struct(self, info, severity="INFO"):
+        if not self.available:
+            raise ConnectionError("sink unavailable")
+        self.entries.append(info)
+
+
+def make_logger(sink, tmp_path, max_batch_size=2):
+    return BatchedStructLogger(
+        lambda: sink,
+        max_queue_size=10,
+        max_batch_size=max_batch_size,
+        flush_interval=0.01,
+        spill_path=str(tmp_path / "feedback.spill")
+    )
+
+
+def spill_line(feedback_id):
+    return json.dumps({"info": {"id": feedback_id}, "severity": "INFO"}) + "\n"
+
+
+async def wait_for_entries(sink, count):
+    for _ in range(200):
+        if len(sink.entries) >= count:
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"{len(sink.entries)} entries written, expected {count}")
+
+
+@pytest.mark.asyncio
+async def test_entries_are_written_in_batches(tmp_path):
+    sink = FakeSink()
+    logger = make_logger(sink, tmp_path)
+    logger.start()
+    for feedback_id in range(3):
+        assert logger.log_struct({"id": feedback_id})
+
+    await wait_for_entries(sink, 3)
+    await logger.stop()
+    assert sink.entries == [{"id": 0}, {"id": 1}, {"id": 2}]
+
+
+@pytest.mark.asyncio
+async def test_failed_batches_are_spilled_then_replayed(tmp_path):
+    sink = FakeSink()
+    sink.available = False
+    logger = make_logger(sink, tmp_path)
+    logger.start()
+    logger.log_struct({"id": 0})
+    for _ in range(200):
+        if os.path.exists(logger.spill_path):
+            break
+        await asyncio.sleep(0.01)
+
+    sink.available = True
+    logger.log_struct({"id": 1})
+    await wait_for_entries(sink, 2)
+    await logger.stop()
+    assert sorted(entry["id"] for entry in sink.entries) == [0, 1]
+    assert not os.path.exists(logger.spill_path)
+
+
+@pytest.mark.asyncio
+async def test_torn_spill_line_is_skipped_and_the_writer_keeps_running(tmp_path):
+    sink = FakeSink()
+    logger = make_logger(sink, tmp_path)
+    with open(logger.spill_path, "w", encoding="utf-8") as f:
+        f.write(spill_line(0) + spill_line(1)[:10])
+    logger.start()
+
+    logger.log_struct({"id": 2})
+    await wait_for_entries(sink, 2)
+    logger.log_struct({"id": 3})
+    await wait_for_entries(sink, 3)
+
+    assert not logger._task.done()
+    await logger.stop()
+    assert sorted(entry["id"] for entry in sink.entries) == [0, 2, 3]
+    assert not os.path.exists(logger.spill_path + ".replay")
+
+
+def test_leftover_replay_file_is_replayed_with_the_spill(tmp_path):
+    sink = FakeSink()
+    logger = make_logger(sink, tmp_path)
+    with open(logger.spill_path + ".replay", "w", encoding="utf-8") as f:
+        f.write(spill_line(0) + spill_line(1)[:10])
+    with open(logger.spill_path, "w", encoding="utf-8") as f:
+        f.write(spill_line(2))
+
+    logger._replay_spill()
+
+    assert sorted(entry["id"] for entry in sink.entries) == [0, 2]
+    assert not os.path.exists(logger.spill_path)
+    assert not os.path.exists(logger.spill_path + ".replay")
+
+
+def test_replay_never_raises(tmp_path):
+    sink = FakeSink()
+    logger = make_logger(sink, tmp_path)
+    # A directory in place of the replay file cannot be read
+    os.mkdir(logger.spill_path + ".replay")
+
+    logger._replay_spill()
@@ -0,0 +1,179 @@
+# Copyright 2025 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Unit tests of the conversation history compaction."""
+import asyncio
+
+import pytest
+
+from app.orchestration import agent
+from app.orchestration.agent import BaseAgentManager
+from app.orchestration.history import HistoryCompactor, HistorySummary, estimate_message_tokens, with_summary
+from app.orchestration.routing import ModelCascadeAgentManager, RoutingDecision
+
+
+def conversation(turns, words=50):
+    messages = []
+    for turn in range(turns):
+        messages.append({"type": "human", "content": f"question {turn} " + "word " * words})
+        messages.append({"type": "ai", "content": f"answer {turn} " + "word " * words})
+    messages.append({"type": "human", "content": "the new question"})
+    return messages
+
+
+def total_tokens(messages):
+    return sum(estimate_message_tokens(message) for message in messages)
+
+
+class RecordingSummarizer:
+
+    def __init__(self):
+        self.transcripts = []
+
+    async def __call__(self, text):
+        self.transcripts.append(text)
+        return "the user asked about revenue"
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+@pytest.mark.asyncio
+async def test_history_within_budget_is_unchanged_and_not_summarized():
+    summarize = RecordingSummarizer()
+    compactor = HistoryCompactor(keep_turns=1, default_budget=100000, summarize=summarize)
+    messages = conversation(10)
+
+    assert compactor.compact(messages, "model", ("", "s")) is messages
+    await settle()
+    assert summarize.transcripts == []
+    assert compactor.stats() == {"summaries": 0, "pending": 0}
+
+
+@pytest.mark.asyncio
+async def test_history_over_budget_is_truncated_until_the_summary_is_ready():
+    summarize = RecordingSummarizer()
+    messages = conversation(10)
+    budget = total_tokens(messages[-5:])
+    compactor = HistoryCompactor(keep_turns=2, default_budget=budget, summarize=summarize)
+
+    compacted = compactor.compact(messages, "model", ("", "s"))
+    assert compacted == messages[-5:]
+    assert compacted[0]["type"] == "human"
+
+    await settle()
+    assert len(summarize.transcripts) == 1
+    assert "question 0" in summarize.transcripts[0]
+    assert compactor.get_summary(("", "s")).message_count == len(messages) - 3
+
+
+@pytest.mark.asyncio
+async def test_summary_is_prepended_to_the_first_kept_message():
+    compactor = HistoryCompactor(keep_turns=2, default_budget=1000, summarize=RecordingSummarizer())
+    messages = conversation(10)
+    compactor.compact(messages, "model", ("", "s"))
+    await settle()
+
+    compacted = compactor.compact(messages, "model", ("", "s"))
+    assert [message["type"] for message in compacted] == ["human", "ai", "human"]
+    assert compacted[0]["content"].endswith(messages[-3]["content"])
+    assert "the user asked about revenue" in compacted[0]["content"]
+    assert compacted[1:] == messages[-2:]
+    # The stored messages are not modified
+    assert "revenue" not in messages[-3]["content"]
+
+
+def test_summary_is_prepended_to_multimodal_content():
+    message = {"type": "human", "content": [{"type": "text", "text": "what is this?"}]}
+    summarized = with_summary(message, "a chart was shared")
+    assert summarized["content"][1:] == message["content"]
+    assert "a chart was shared" in summarized["content"][0]["text"]
+
+
+def test_stale_summary_is_not_used():
+    compactor = HistoryCompactor(keep_turns=2, default_budget=1000, summarize=RecordingSummarizer())
+    messages = conversation(10)
+    compactor._set_summary(("", "s"), HistorySummary(4, "not the digest", "an old summary"))
+
+    compacted = compactor.compact(messages, "model", ("", "s"))
+    assert all("an old summary" not in str(message["content"]) for message in compacted)
+
+
+def test_budget_is_looked_up_by_model_name():
+    compactor = HistoryCompactor(
+        keep_turns=1, default_budget=100000, budgets={"small-model": 200}, summarize=RecordingSummarizer()
+    )
+    messages = conversation(10)
+
+    assert compactor.compact(messages, "large-model", ("", "s")) is messages
+    compacted = compactor.compact(messages, "small-model", ("", "s"))
+    assert total_tokens(compacted) <= 200
+    assert compacted[-1] == messages[-1]
+
+
+class FakeTier(BaseAgentManager):
+
+    def __init__(self, model_name):  # pylint: disable=W0231
+        self.model_name = model_name
+        self.schema_namespace = "langchain"
+        self.prompt = "prompt"
+        self.industry_type = "finance"
+        self.location = "us-central1"
+        self.orchestration_framework = "langchain_prebuilt_agent"
+        self.agent_engine_resource_id = ""
+        self.max_retries = 0
+        self.max_output_tokens = 100
+        self.temperature = 0
+        self.top_p = 1
+        self.top_k = 1
+        self.return_steps = False
+        self.verbose = False
+        self.tools = []
+        self.inputs = []
+
+    def create_agent_executor(self):
+        return None
+
+    async def astream(self, input):
+        self.inputs.append(input)
+        yield {"agent": {"messages": [{"kwargs": {"type": "ai", "content": "answer"}}]}}
+
+
+class FirstTierClassifier:
+
+    def route(self, messages, tier_count, has_tools):
+        return RoutingDecision(tier=0, complexity=0.0, confidence=1.0, reason="test")
+
+
+@pytest.mark.asyncio
+async def test_cascade_tiers_compact_to_the_budget_of_their_model(monkeypatch):
+    compactor = HistoryCompactor(
+        keep_turns=1, default_budget=100000, budgets={"small-model": 200}, summarize=RecordingSummarizer()
+    )
+    monkeypatch.setattr(agent, "HISTORY", compactor)
+    tiers = {}
+    cascade = ModelCascadeAgentManager(
+        ["small-model", "large-model"], lambda model_name: tiers.setdefault(model_name, FakeTier(model_name)),
+        FirstTierClassifier()
+    )
+    assert not cascade.compact_history
+    messages = conversation(10)
+
+    async for _ in cascade.astream({"messages": messages, "run_id": "run"}):
+        pass
+
+    tier_input = tiers["small-model"].inputs[0]
+    assert total_tokens(tier_input["messages"]) <= 200
+    await settle()
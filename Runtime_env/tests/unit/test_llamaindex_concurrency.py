@@ -0,0 +1,95 @@
+# Copyright 2025 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Unit tests that concurrent LlamaIndex runs never see each other's LLM or retriever."""
+import asyncio
+import random
+import re
+import time
+from typing import Any, List
+
+import pytest
+
+pytest.importorskip("llama_index.core")
+
+# pylint: disable=C0413
+from llama_index.core.base.llms.types import CompletionResponse, CompletionResponseGen, LLMMetadata
+from llama_index.core.llms.callbacks import llm_completion_callback
+from llama_index.core.llms.custom import CustomLLM
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import NodeWithScore, QueryBundle, TextNode
+
+from app.orchestration.tools import _as_llamaindex_tool, llamaindex_query_engine_tool, llamaindex_scope
+from app.utils.streaming import iterate_in_threadpool
+
+
+class TaggedLLM(CustomLLM):
+    """Answers with its own tag and the retriever tags found in the prompt."""
+
+    tag: str
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return LLMMetadata(model_name=f"tagged-{self.tag}")
+
+    @llm_completion_callback()
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        # Let the other runs go in between
+        time.sleep(random.uniform(0, 0.002))
+        retrievers = " ".join(sorted(set(re.findall(r"retriever=\w+", prompt))))
+        return CompletionResponse(text=f"llm={self.tag} {retrievers}")
+
+    @llm_completion_callback()
+    def stream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponseGen:
+        yield self.complete(prompt, formatted=formatted, **kwargs)
+
+
+class TaggedRetriever(BaseRetriever):
+    """Retrieves a single node carrying its tag."""
+
+    def __init__(self, tag: str):
+        self.tag = tag
+        super().__init__()
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        time.sleep(random.uniform(0, 0.002))
+        return [NodeWithScore(node=TextNode(text=f"retriever={self.tag}"), score=1.0)]
+
+
+async def run_request(index, calls, tool):
+    """Calls the tool `calls` times each way with the LLM and retriever of one run, returning the answers."""
+    tag = f"r{index}"
+    outputs = []
+
+    def sync_calls():
+        for _ in range(calls):
+            yield llamaindex_query_engine_tool("question")
+
+    with llamaindex_scope(TaggedLLM(tag=tag), TaggedRetriever(tag)):
+        for _ in range(calls):
+            # Like ReActAgent.astream_step
+            output = await tool.acall(query="question")
+            outputs.append(str(output.content).strip())
+        # Like stream_query, driven by the stream worker pool
+        async for output in iterate_in_threadpool(sync_calls):
+            outputs.append(str(output).strip())
+    return tag, outputs
+
+
+@pytest.mark.asyncio
+async def test_concurrent_runs_use_their_own_llm_and_retriever():
+    tool = _as_llamaindex_tool(llamaindex_query_engine_tool)
+    results = await asyncio.gather(*(run_request(index, 3, tool) for index in range(20)))
+
+    for tag, outputs in results:
+        assert outputs == [f"llm={tag} retriever={tag}"] * 6
@@ -0,0 +1,194 @@
+# Copyright 2025 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Unit tests of the regional failover and hedging of models, against stub endpoints."""
+import asyncio
+import collections
+import time
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+import pytest
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from app.orchestration.regions import RegionalChatModel, RegionalEndpointPool
+from app.utils.deadline import Deadline, DeadlineExceededError, deadline_scope
+
+
+class StubEndpointError(Exception):
+    """An error returned by a stub endpoint, with its HTTP status like google.api_core errors."""
+
+    def __init__(self, code: int):
+        super().__init__(f"stub endpoint returned {code}")
+        self.code = code
+
+
+class StubEndpoint:
+    """The behavior of one regional endpoint, changed while the test runs."""
+
+    def __init__(self, region: str, latency: float):
+        self.region = region
+        self.latency = latency
+        self.failing = False
+        self.calls = 0
+
+    async def wait_first_chunk(self) -> None:
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        if self.failing:
+            raise StubEndpointError(429)
+
+
+class StubRegionModel(BaseChatModel):
+    """Chat model answering from a stub endpoint with the name of its region."""
+
+    endpoint: Any
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub"
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        raise NotImplementedError
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        await self.endpoint.wait_first_chunk()
+        yield ChatGenerationChunk(message=AIMessageChunk(content=self.endpoint.region))
+
+
+def make_stub_model(endpoints: List[StubEndpoint], hedging: bool = False) -> RegionalChatModel:
+    return RegionalChatModel(
+        model_name="stub-model",
+        region_models={endpoint.region: StubRegionModel(endpoint=endpoint) for endpoint in endpoints},
+        pool=RegionalEndpointPool(
+            "stub-model", [endpoint.region for endpoint in endpoints], cooldown=60, explore=0, hedge_min_delay=0.005
+        ),
+        hedging=hedging
+    )
+
+
+async def stream_requests(model: RegionalChatModel, requests: int) -> "collections.Counter[str]":
+    """Streams requests through the model, returning the number answered by each region."""
+    regions: "collections.Counter[str]" = collections.Counter()
+    for _ in range(requests):
+        text = ""
+        async for chunk in model.astream([HumanMessage(content="hello")]):
+            text += chunk.content
+        regions[text] += 1
+    return regions
+
+
+@pytest.mark.asyncio
+async def test_healthy_traffic_goes_to_the_fastest_region():
+    primary, secondary = StubEndpoint("us-central1", 0.001), StubEndpoint("us-east4", 0.005)
+    regions = await stream_requests(make_stub_model([primary, secondary]), 20)
+    assert regions == {"us-central1": 20}
+
+
+@pytest.mark.asyncio
+async def test_brownout_moves_the_traffic_without_failing_requests():
+    primary, secondary = StubEndpoint("us-central1", 0.001), StubEndpoint("us-east4", 0.002)
+    model = make_stub_model([primary, secondary])
+    await stream_requests(model, 5)
+
+    primary.failing = True
+    regions = await stream_requests(model, 20)
+
+    assert regions == {"us-east4": 20}
+    # The circuit of us-central1 opened after a few errors
+    assert primary.calls < 5 + 5
+
+
+@pytest.mark.asyncio
+async def test_hedging_cuts_the_latency_of_a_slow_region():
+    primary, secondary = StubEndpoint("us-central1", 0.001), StubEndpoint("us-east4", 0.001)
+    model = make_stub_model([primary, secondary], hedging=True)
+    # Let the pool learn the latency of us-central1 before it turns slow
+    await stream_requests(model, 20)
+    assert secondary.calls == 0
+
+    primary.latency = 0.5
+    start_time = time.perf_counter()
+    regions = await stream_requests(model, 1)
+
+    assert regions == {"us-east4": 1}
+    assert time.perf_counter() - start_time < 0.25
+
+
+class TimeoutRecordingModel(BaseChatModel):
+    """Chat model recording the timeout of each call."""
+
+    timeouts: List[Optional[float]] = []
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub"
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        self.timeouts.append(kwargs.get("timeout"))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="answer"))])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        self.timeouts.append(kwargs.get("timeout"))
+        yield ChatGenerationChunk(message=AIMessageChunk(content="answer"))
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        self.timeouts.append(kwargs.get("timeout"))
+        yield ChatGenerationChunk(message=AIMessageChunk(content="answer"))
+
+
+def make_timeout_model(attempt_timeout=None):
+    region_model = TimeoutRecordingModel(timeouts=[])
+    model = RegionalChatModel(
+        model_name="stub-model",
+        region_models={"us-central1": region_model},
+        pool=RegionalEndpointPool("stub-model", ["us-central1"]),
+        attempt_timeout=attempt_timeout
+    )
+    return model, region_model
+
+
+def test_attempt_timeout_is_passed_to_the_regional_model():
+    model, region_model = make_timeout_model(attempt_timeout=30)
+    model.invoke([HumanMessage(content="hello")])
+    list(model.stream([HumanMessage(content="hello")]))
+    assert region_model.timeouts == [30, 30]
+
+
+def test_attempt_timeout_is_capped_by_the_deadline():
+    model, region_model = make_timeout_model(attempt_timeout=30)
+    with deadline_scope(Deadline(2)):
+        model.invoke([HumanMessage(content="hello")])
+    model_without_timeout, region_model_without_timeout = make_timeout_model()
+    with deadline_scope(Deadline(2)):
+        list(model_without_timeout.stream([HumanMessage(content="hello")]))
+
+    assert 0 < region_model.timeouts[0] <= 2
+    assert 0 < region_model_without_timeout.timeouts[0] <= 2
+
+
+@pytest.mark.asyncio
+async def test_async_attempt_timeout_is_capped_by_the_deadline():
+    model, region_model = make_timeout_model(attempt_timeout=30)
+    with deadline_scope(Deadline(2)):
+        [chunk async for chunk in model.astream([HumanMessage(content="hello")])]
+    assert 0 < region_model.timeouts[0] <= 2
+
+
+def test_call_after_the_deadline_never_reaches_the_model():
+    model, region_model = make_timeout_model(attempt_timeout=30)
+    with deadline_scope(Deadline(0)):
+        with pytest.raises(DeadlineExceededError):
+            model.invoke([HumanMessage(content="hello")])
+    assert not region_model.timeouts
@@ -0,0 +1,229 @@
+# Copyright 2025 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Unit tests of the circuit breakers and of the retry classification."""
+import asyncio
+import json
+
+import pytest
+import requests
+
+from app.utils import resilience
+from app.utils.cancellation import RunCancelledError
+from app.utils.deadline import Deadline, DeadlineExceededError, deadline_scope
+from app.utils.resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    RetryPolicy,
+    call_with_retry,
+    is_transient_error,
+    resilient_tool
+)
+from app.utils.stage_metrics import RunMetrics, run_metrics_scope
+
+
+class StatusError(Exception):
+
+    def __init__(self, code=None, status_code=None, response=None):
+        super().__init__("status error")
+        self.code = code
+        self.status_code = status_code
+        self.response = response
+
+
+class FakeResponse:
+
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.mark.parametrize("error", [
+    TimeoutError(),
+    asyncio.TimeoutError(),
+    ConnectionResetError(),
+    requests.exceptions.ConnectionError(),
+    requests.exceptions.ReadTimeout(),
+    StatusError(code=429),
+    StatusError(code=503),
+    StatusError(status_code=408),
+    StatusError(status_code=529),
+    requests.exceptions.HTTPError(response=FakeResponse(502)),
+])
+def test_transient_errors(error):
+    assert is_transient_error(error)
+
+
+@pytest.mark.parametrize("error", [
+    ValueError("invalid request"),
+    KeyError("bug"),
+    RuntimeError("unknown"),
+    StatusError(code=400),
+    StatusError(code=403),
+    StatusError(code=501),
+    requests.exceptions.HTTPError(response=FakeResponse(404)),
+    DeadlineExceededError(),
+    RunCancelledError(),
+    CircuitOpenError("dependency", 1),
+    asyncio.CancelledError(),
+])
+def test_permanent_errors(error):
+    assert not is_transient_error(error)
+
+
+def test_google_api_errors():
+    exceptions = pytest.importorskip("google.api_core.exceptions")
+
+    for error_type in (
+        exceptions.ServiceUnavailable, exceptions.InternalServerError, exceptions.TooManyRequests,
+        exceptions.ResourceExhausted, exceptions.DeadlineExceeded
+    ):
+        assert is_transient_error(error_type("failed"))
+    for error_type in (exceptions.InvalidArgument, exceptions.PermissionDenied, exceptions.NotFound):
+        assert not is_transient_error(error_type("failed"))
+
+
+@pytest.fixture(name="clock")
+def fixture_clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(resilience.time, "monotonic", clock)
+    return clock
+
+
+def test_breaker_opens_after_failures_in_a_row(clock):
+    breaker = CircuitBreaker("dependency", failure_threshold=3, reset_timeout=10)
+    for _ in range(2):
+        assert breaker.allow()
+        breaker.record_failure()
+    breaker.record_success()
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+    assert breaker.retry_after() == 10
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+
+
+def test_half_open_breaker_lets_one_probe_through(clock):
+    breaker = CircuitBreaker("dependency", failure_threshold=1, reset_timeout=10)
+    breaker.record_failure()
+    clock.now += 10
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow()
+
+
+def test_failed_probe_opens_the_breaker_again(clock):
+    breaker = CircuitBreaker("dependency", failure_threshold=5, reset_timeout=10)
+    for _ in range(5):
+        breaker.record_failure()
+    clock.now += 10
+    assert breaker.allow()
+    breaker.record_failure()
+
+    assert breaker.state == CircuitBreaker.OPEN
+    clock.now += 9
+    assert not breaker.allow()
+
+
+def test_abandoned_probe_frees_its_slot(clock):
+    breaker = CircuitBreaker("dependency", failure_threshold=1, reset_timeout=10)
+    breaker.record_failure()
+    clock.now += 10
+    assert breaker.allow()
+    breaker.record_abandoned()
+
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow()
+
+
+def test_permanent_errors_do_not_open_the_breaker(clock):
+    breaker = CircuitBreaker("dependency", failure_threshold=1, reset_timeout=10)
+    breaker.record(ValueError("invalid request"))
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record(TimeoutError())
+    assert breaker.state == CircuitBreaker.OPEN
+
+
+def test_retry_policy():
+    policy = RetryPolicy(max_attempts=3, base_delay=1, max_delay=8, min_remaining=2)
+    assert policy.next_delay("dependency", 1, ValueError()) is None
+    assert 0 <= policy.next_delay("dependency", 1, TimeoutError()) <= 1
+    assert 0 <= policy.next_delay("dependency", 2, TimeoutError()) <= 2
+    assert policy.next_delay("dependency", 3, TimeoutError()) is None
+
+    with deadline_scope(Deadline(1.5)):
+        assert policy.next_delay("dependency", 2, TimeoutError()) is None
+
+
+def test_call_with_retry_retries_transient_failures():
+    breaker = CircuitBreaker("dependency", failure_threshold=5)
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise TimeoutError()
+        return "result"
+
+    assert call_with_retry(breaker, RetryPolicy(max_attempts=3, base_delay=0), flaky) == "result"
+    assert len(calls) == 3
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_call_with_retry_raises_permanent_failures_at_once():
+    breaker = CircuitBreaker("dependency", failure_threshold=1)
+    calls = []
+
+    def invalid():
+        calls.append(1)
+        raise ValueError("invalid request")
+
+    with pytest.raises(ValueError):
+        call_with_retry(breaker, RetryPolicy(max_attempts=3, base_delay=0), invalid)
+    assert len(calls) == 1
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_resilient_tool_returns_a_notice_while_open():
+    breaker = CircuitBreaker("backend", failure_threshold=1, reset_timeout=60)
+
+    @resilient_tool(breaker=breaker, policy=RetryPolicy(max_attempts=1))
+    def search_tool(query):
+        raise TimeoutError(query)
+
+    with pytest.raises(TimeoutError):
+        search_tool("query")
+    run = RunMetrics("framework", "model")
+    with run_metrics_scope(run):
+        notice = json.loads(search_tool("query"))
+
+    assert notice["status"] == "unavailable"
+    assert notice["dependency"] == "backend"
+    assert not run.cacheable
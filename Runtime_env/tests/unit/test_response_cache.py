@@ -0,0 +1,161 @@
+# Copyright 2025 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Unit tests of the response cache."""
+import time
+
+import pytest
+
+from app.orchestration import agent
+from app.orchestration.agent import BaseAgentManager
+from app.utils.deadline import Deadline, deadline_scope, deadline_tool
+from app.utils.response_cache import ResponseCache, get_cache_mode, make_cache_key, volatile_tool
+from app.utils.stage_metrics import timed_tool
+
+
+def answer_chunk(run_id, content="the answer"):
+    return {"run_id": run_id, "agent": {"messages": [{"kwargs": {"type": "ai", "content": content}}]}}
+
+
+def test_cache_key_ignores_case_and_whitespace():
+    key = make_cache_key([{"type": "human", "content": "What is  the revenue?"}], model_name="m")
+    assert key == make_cache_key([{"type": "human", "content": "what is the revenue? "}], model_name="m")
+    assert key != make_cache_key([{"type": "human", "content": "What is the revenue?"}], model_name="other")
+
+
+def test_cache_replays_with_the_new_run_id():
+    cache = ResponseCache(ttl=60, max_entries=10)
+    cache.put("key", "run-1", [answer_chunk("run-1")])
+
+    assert cache.get("key").replay("run-2") == [answer_chunk("run-2")]
+
+
+def test_cache_expires_and_evicts_entries():
+    cache = ResponseCache(ttl=60, max_entries=2)
+    for key in ("a", "b", "c"):
+        cache.put(key, "run", [answer_chunk("run")])
+    assert cache.get("a") is None
+    assert cache.get("c") is not None
+
+    cache.get("c").expires_at = time.time() - 1
+    assert cache.get("c") is None
+
+
+def test_cache_is_shared_through_sqlite(tmp_path):
+    path = str(tmp_path / "responses.db")
+    ResponseCache(ttl=60, max_entries=10, path=path).put("key", "run-1", [answer_chunk("run-1")])
+
+    assert ResponseCache(ttl=60, max_entries=10, path=path).get("key").chunks == [answer_chunk("run-1")]
+
+
+def test_cache_mode_follows_cache_control():
+    assert get_cache_mode(None) == "use"
+    assert get_cache_mode("no-cache") == "refresh"
+    assert get_cache_mode("max-age=0, no-store") == "bypass"
+
+
+@timed_tool
+def failing_tool(query):
+    raise ValueError(query)
+
+
+@volatile_tool
+def live_tool(query):
+    return f"live data for {query}"
+
+
+@deadline_tool(min_seconds=5)
+def slow_tool(query):
+    return query
+
+
+class FakeAgent(BaseAgentManager):
+
+    def __init__(self, tool=None, agent_engine_resource_id=""):  # pylint: disable=W0231
+        self.model_name = "model"
+        self.prompt = "prompt"
+        self.industry_type = "finance"
+        self.location = "us-central1"
+        self.orchestration_framework = "langchain_prebuilt_agent"
+        self.agent_engine_resource_id = agent_engine_resource_id
+        self.max_output_tokens = 100
+        self.temperature = 0
+        self.tools = []
+        self.compact_history = False
+        self.tool = tool
+        self.runs = 0
+
+    def create_agent_executor(self):
+        return None
+
+    async def astream(self, input):
+        self.runs += 1
+        if self.tool is not None:
+            try:
+                self.tool("query")
+            except ValueError:
+                pass
+        yield answer_chunk(input["run_id"])
+
+
+@pytest.fixture(name="response_cache")
+def fixture_response_cache(monkeypatch):
+    cache = ResponseCache(ttl=60, max_entries=10)
+    monkeypatch.setattr(agent, "RESPONSE_CACHE", cache)
+    monkeypatch.setattr(agent, "RESPONSE_CACHE_ENABLED", True)
+    monkeypatch.setattr(agent, "SEMANTIC_CACHE_ENABLED", False)
+    return cache
+
+
+async def run_twice(fake_agent):
+    for run_id in ("run-1", "run-2"):
+        input = {"messages": [{"type": "human", "content": "What is the revenue?"}], "run_id": run_id}
+        chunks = [chunk async for chunk in fake_agent.astream_with_metrics(input)]
+        assert chunks == [answer_chunk(run_id)]
+
+
+@pytest.mark.asyncio
+async def test_successful_run_is_replayed(response_cache):
+    fake_agent = FakeAgent()
+    await run_twice(fake_agent)
+    assert fake_agent.runs == 1
+
+
+@pytest.mark.asyncio
+async def test_run_with_a_failed_tool_is_not_cached(response_cache):
+    fake_agent = FakeAgent(failing_tool)
+    await run_twice(fake_agent)
+    assert fake_agent.runs == 2
+
+
+@pytest.mark.asyncio
+async def test_run_calling_a_volatile_tool_is_not_cached(response_cache):
+    fake_agent = FakeAgent(live_tool)
+    await run_twice(fake_agent)
+    assert fake_agent.runs == 2
+
+
+@pytest.mark.asyncio
+async def test_run_with_a_degraded_tool_is_not_cached(response_cache):
+    fake_agent = FakeAgent(slow_tool)
+    with deadline_scope(Deadline(1)):
+        await run_twice(fake_agent)
+    assert fake_agent.runs == 2
+
+
+@pytest.mark.asyncio
+async def test_run_of_a_remote_agent_engine_is_not_cached(response_cache):
+    # Its tools run remotely, so a live data or failed tool call would go unseen
+    fake_agent = FakeAgent(agent_engine_resource_id="projects/p/locations/l/reasoningEngines/1")
+    await run_twice(fake_agent)
+    assert fake_agent.runs == 2
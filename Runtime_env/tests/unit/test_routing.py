@@ -0,0 +1,167 @@
+# Copyright 2025 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Unit tests of the model cascade."""
+import pytest
+
+from app.orchestration.agent import BaseAgentManager
+from app.orchestration.routing import ComplexityClassifier, ModelCascadeAgentManager, RoutingDecision
+from app.utils.deadline import DeadlineExceededError
+from app.utils.stage_metrics import RunMetrics, run_metrics_scope, timed_tool
+
+TOOL_EVENT = {"agent": {"messages": [{"kwargs": {"type": "tool", "content": "tool result"}}]}}
+
+
+def answer(content):
+    return {"agent": {"messages": [{"kwargs": {"type": "ai", "content": content}}]}}
+
+
+@timed_tool
+def failing_tool():
+    raise ValueError("backend error")
+
+
+class FakeTier(BaseAgentManager):
+
+    def __init__(self, model_name, behavior):  # pylint: disable=W0231
+        self.model_name = model_name
+        self.behavior = behavior
+        self.schema_namespace = "langchain"
+        self.compact_history = False
+        self.prompt = "prompt"
+        self.industry_type = "finance"
+        self.location = "us-central1"
+        self.orchestration_framework = "langchain_prebuilt_agent"
+        self.agent_engine_resource_id = ""
+        self.max_retries = 0
+        self.max_output_tokens = 100
+        self.temperature = 0
+        self.top_p = 1
+        self.top_k = 1
+        self.return_steps = False
+        self.verbose = False
+        self.tools = ["tool"]
+
+    def create_agent_executor(self):
+        return None
+
+    async def astream(self, input):
+        if self.behavior == "error":
+            raise RuntimeError("model error")
+        if self.behavior == "deadline":
+            raise DeadlineExceededError("deadline")
+        yield TOOL_EVENT
+        if self.behavior == "tool_error":
+            try:
+                failing_tool()
+            except ValueError:
+                pass
+        yield answer(f"answer of {self.model_name}")
+        if self.behavior == "error_after_answer":
+            raise RuntimeError("model error")
+
+
+class FixedClassifier:
+
+    def __init__(self, tier):
+        self.tier = tier
+
+    def route(self, messages, tier_count, has_tools):
+        return RoutingDecision(tier=self.tier, complexity=0.0, confidence=1.0, reason="test")
+
+
+def make_cascade(*behaviors, tier=0):
+    model_names = [f"model-{index}" for index in range(len(behaviors))]
+    tiers = {model_name: FakeTier(model_name, behavior) for model_name, behavior in zip(model_names, behaviors)}
+    return ModelCascadeAgentManager(model_names, tiers.__getitem__, FixedClassifier(tier))
+
+
+async def run_cascade(cascade):
+    run = RunMetrics("framework", cascade.model_name)
+    chunks = []
+    with run_metrics_scope(run):
+        async for chunk in cascade.astream({"messages": [{"type": "human", "content": "question"}], "run_id": "run"}):
+            chunks.append(chunk)
+    return chunks, run
+
+
+@pytest.mark.asyncio
+async def test_successful_run_stays_on_its_model():
+    chunks, run = await run_cascade(make_cascade("ok", "ok"))
+    assert chunks == [TOOL_EVENT, answer("answer of model-0")]
+    assert run.labels["model"] == "model-0"
+
+
+@pytest.mark.asyncio
+async def test_run_starts_on_the_routed_model():
+    chunks, _ = await run_cascade(make_cascade("error", "ok", tier=1))
+    assert chunks == [TOOL_EVENT, answer("answer of model-1")]
+
+
+@pytest.mark.asyncio
+async def test_model_error_before_the_answer_escalates():
+    chunks, run = await run_cascade(make_cascade("error", "ok"))
+    assert chunks == [TOOL_EVENT, answer("answer of model-1")]
+    assert run.labels["model"] == "model-1"
+
+
+@pytest.mark.asyncio
+async def test_tool_error_before_the_answer_escalates_without_leaking_tool_events():
+    chunks, _ = await run_cascade(make_cascade("tool_error", "ok"))
+    assert chunks == [TOOL_EVENT, answer("answer of model-1")]
+
+
+@pytest.mark.asyncio
+async def test_tool_error_of_an_escalated_model_is_forgotten():
+    _, run = await run_cascade(make_cascade("tool_error", "ok"))
+    # The answer of the larger model may be cached
+    assert run.tool_errors == 0
+
+
+@pytest.mark.asyncio
+async def test_tool_error_on_the_last_model_is_answered():
+    chunks, run = await run_cascade(make_cascade("tool_error"))
+    assert chunks == [TOOL_EVENT, answer("answer of model-0")]
+    assert run.tool_errors == 1
+
+
+@pytest.mark.asyncio
+async def test_error_after_the_answer_is_not_escalated():
+    with pytest.raises(RuntimeError):
+        await run_cascade(make_cascade("error_after_answer", "ok"))
+
+
+@pytest.mark.asyncio
+async def test_deadline_is_not_escalated():
+    with pytest.raises(DeadlineExceededError):
+        await run_cascade(make_cascade("deadline", "ok"))
+
+
+@pytest.mark.asyncio
+async def test_error_on_the_last_model_is_raised():
+    with pytest.raises(RuntimeError):
+        await run_cascade(make_cascade("error", "error"))
+
+
+def test_classifier_routes_complex_questions_to_larger_models():
+    classifier = ComplexityClassifier()
+    simple = classifier.route([{"type": "human", "content": "Hi!"}], 3, has_tools=True)
+    complex_question = (
+        "Compare the revenue growth of Alphabet and Microsoft over the last five years, explain why "
+        "their cloud margins differ and what the latest news says about their AI spending? " * 3
+    )
+    complex_route = classifier.route([{"type": "human", "content": complex_question}], 3, has_tools=True)
+
+    assert simple.tier == 0
+    assert complex_route.tier > simple.tier
+    assert 0 <= complex_route.complexity <= 1
@@ -0,0 +1,89 @@
+# Copyright 2025 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Unit tests of the semantic response cache."""
+import pytest
+
+from app.orchestration.config import SEMANTIC_CACHE_THRESHOLD
+from app.utils.response_cache import CachedResponse
+from app.utils.semantic_cache import HashingEmbedder, SemanticCache, get_hard_terms
+
+
+def make_cache(ttl=60, max_entries=100):
+    return SemanticCache(HashingEmbedder(), threshold=SEMANTIC_CACHE_THRESHOLD, ttl=ttl, max_entries=max_entries)
+
+
+def response(run_id):
+    return CachedResponse(run_id=run_id, chunks=[run_id], expires_at=0)
+
+
+@pytest.mark.parametrize("cached, question", [
+    ("Q3 revenue for Alphabet?", "What was Alphabet's revenue in Q3?"),
+    ("What is Alphabet's operating margin?", "alphabet operating margin"),
+    ("Summarize the patient data", "Please summarize the patient data."),
+])
+def test_paraphrases_hit(cached, question):
+    cache = make_cache()
+    cache.put("scope", cached, response("cached"))
+
+    assert cache.get("scope", question).run_id == "cached"
+
+
+@pytest.mark.parametrize("cached, question", [
+    ("Should I buy Tesla stock?", "Should I not buy Tesla stock?"),
+    ("Should I buy Tesla stock?", "Why shouldn't I buy Tesla stock?"),
+    ("Is Alphabet profitable?", "Is Alphabet never profitable?"),
+    ("What was Alphabet's revenue in Q3 2023?", "What was Alphabet's revenue in Q3 2024?"),
+    ("What was Alphabet's revenue in Q3?", "What was Alphabet's revenue in Q4?"),
+    ("Alphabet revenue in the third quarter", "Alphabet revenue in the fourth quarter"),
+    ("How did Google Cloud grow last year?", "How did Google Cloud grow in 2022?"),
+])
+def test_negations_and_numbers_miss(cached, question):
+    cache = make_cache()
+    cache.put("scope", cached, response("cached"))
+
+    assert cache.get("scope", question) is None
+
+
+def test_nearest_question_with_the_same_hard_terms_is_used():
+    cache = make_cache()
+    cache.put("scope", "What was Alphabet's revenue in Q3 2024?", response("2024"))
+    cache.put("scope", "Alphabet revenue Q3 2023", response("2023"))
+
+    assert cache.get("scope", "What was Alphabet's revenue in Q3 2023?").run_id == "2023"
+
+
+def test_hard_terms():
+    assert get_hard_terms("Why shouldn't I buy it?") == {"not"}
+    assert get_hard_terms("Revenue in Q3 FY2024, last quarter") == {"q3", "fy2024", "last"}
+    assert get_hard_terms("What is the revenue?") == frozenset()
+
+
+def test_entries_are_scoped():
+    cache = make_cache()
+    cache.put("finance", "What was Alphabet's revenue?", response("finance"))
+
+    assert cache.get("retail", "What was Alphabet's revenue?") is None
+
+
+def test_entries_expire_and_are_evicted():
+    cache = make_cache(max_entries=2)
+    for topic in ("revenue", "margin", "growth"):
+        cache.put("scope", f"What is the {topic} of Alphabet?", response(topic))
+    assert cache.stats() == {"scopes": 1, "entries": 2}
+    assert cache.get("scope", "What is the revenue of Alphabet?") is None
+    assert cache.get("scope", "What is the growth of Alphabet?").run_id == "growth"
+
+    cache.ttl = -1
+    cache.put("scope", "What is the debt of Alphabet?", response("debt"))
+    assert cache.get("scope", "What is the debt of Alphabet?") is None
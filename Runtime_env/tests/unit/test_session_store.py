@@ -0,0 +1,100 @@
+# Copyright 2025 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Unit tests of the session history store."""
+import pytest
+
+from app.utils.session_store import SessionConflictError, SessionHistoryStore
+
+
+def human(content):
+    return {"type": "human", "content": content}
+
+
+def ai(content):
+    return {"type": "ai", "content": content}
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SessionHistoryStore(path=str(tmp_path / "sessions.db"), max_memory_bytes=1 << 20)
+
+
+def test_unknown_session_is_empty(store):
+    assert store.get("alice", "s1").messages == []
+    assert store.get("alice", "s1").version == 0
+
+
+def test_append_advances_version(store):
+    store.append("alice", "s1", [human("hi"), ai("hello")])
+    history = store.append("alice", "s1", [human("how are you?"), ai("fine")], expected_version=2)
+    assert history.version == 4
+    assert history.messages[-1] == ai("fine")
+
+
+def test_append_with_stale_version_conflicts(store):
+    store.append("alice", "s1", [human("hi"), ai("hello")])
+    with pytest.raises(SessionConflictError) as error:
+        store.append("alice", "s1", [human("again")], expected_version=0)
+    assert error.value.current_version == 2
+    assert store.get("alice", "s1").version == 2
+
+
+def test_merge_does_not_store(store):
+    store.append("alice", "s1", [human("hi"), ai("hello")])
+    merged = store.merge("alice", "s1", [human("next")], expected_version=2)
+    assert merged.messages == [human("hi"), ai("hello"), human("next")]
+    # A rejected or failed turn leaves the session unchanged, so a retry keeps its version
+    assert store.get("alice", "s1").version == 2
+    assert store.merge("alice", "s1", [human("next")], expected_version=2).version == 3
+
+
+def test_merge_with_stale_version_conflicts(store):
+    store.append("alice", "s1", [human("hi"), ai("hello")])
+    with pytest.raises(SessionConflictError):
+        store.merge("alice", "s1", [human("next")], expected_version=4)
+
+
+def test_merge_without_version_uses_the_snapshot(store):
+    store.append("alice", "s1", [human("hi"), ai("hello")])
+    merged = store.merge("alice", "s1", [human("other"), ai("conversation"), human("next")])
+    assert merged.messages == [human("other"), ai("conversation"), human("next")]
+    assert store.get("alice", "s1").messages == [human("hi"), ai("hello")]
+
+
+def test_replace(store):
+    store.append("alice", "s1", [human("hi"), ai("hello")])
+    store.replace("alice", "s1", [human("restart")])
+    assert store.get("alice", "s1").messages == [human("restart")]
+
+
+def test_sessions_are_scoped_by_user(store):
+    store.append("alice", "s1", [human("secret"), ai("noted")])
+    assert store.get("bob", "s1").messages == []
+    with pytest.raises(SessionConflictError):
+        store.append("bob", "s1", [human("hi")], expected_version=2)
+
+
+def test_non_text_content_is_stored_as_json(store):
+    store.append("alice", "s1", [{"type": "human", "content": [{"type": "text", "text": "hi"}]}])
+    assert store.get("alice", "s1").messages == [human('[{"type": "text", "text": "hi"}]')]
+
+
+def test_spilled_sessions_are_loaded_back(tmp_path):
+    store = SessionHistoryStore(path=str(tmp_path / "sessions.db"), max_memory_bytes=50)
+    store.append("alice", "s1", [human("a" * 40), ai("b")])
+    store.append("bob", "s1", [human("c" * 40), ai("d")])
+    # alice's session was spilled to SQLite to make room for bob's
+    assert ("alice", "s1") not in store._sessions # pylint: disable=W0212
+    assert store.get("alice", "s1").messages == [human("a" * 40), ai("b")]
+    assert store.get("bob", "s1").messages == [human("c" * 40), ai("d")]
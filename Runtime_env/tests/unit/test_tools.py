@@ -0,0 +1,62 @@
+# Copyright 2025 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Unit tests of the tool helpers."""
+import threading
+
+import pytest
+
+from app.orchestration.config import TOOL_TIMEOUT_SECONDS
+from app.orchestration.tools import get_llama_retriever, get_llamaindex_llm, get_search_timeout, llamaindex_scope, with_search_timeout
+from app.utils.deadline import Deadline, deadline_scope
+
+
+def test_llamaindex_llm_requires_a_scope():
+    with pytest.raises(RuntimeError, match="llamaindex_scope"):
+        get_llamaindex_llm()
+
+
+def test_llamaindex_scope_is_per_run():
+    seen = {}
+
+    def run(name):
+        with llamaindex_scope(f"llm-{name}", f"retriever-{name}"):
+            barrier.wait()
+            seen[name] = (get_llamaindex_llm(), get_llama_retriever())
+
+    barrier = threading.Barrier(2)
+    threads = [threading.Thread(target=run, args=(name,)) for name in ("a", "b")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert seen == {"a": ("llm-a", "retriever-a"), "b": ("llm-b", "retriever-b")}
+    with pytest.raises(RuntimeError):
+        get_llamaindex_llm()
+
+
+class FakeSerpApiClient:
+
+    def __init__(self, params):
+        self.params = params
+        self.timeout = 60000
+
+
+def test_search_timeout_is_capped_by_the_deadline():
+    assert get_search_timeout() == TOOL_TIMEOUT_SECONDS
+    with deadline_scope(Deadline(2)):
+        assert 0 < get_search_timeout() <= 2
+        client = with_search_timeout(FakeSerpApiClient)({"q": "query"})
+    assert client.params == {"q": "query"}
+    assert 0 < client.timeout <= 2
+